@@ -25,6 +25,11 @@ except ImportError:
     print('STATUS : Finished with error -- exitting!')
     sys.exit(1)
 from itk_pdb.ITkPDLoginGui import ITkPDLoginGui
+try:
+    from itk_pdb.asyncAccess import runMany
+except (ImportError, SyntaxError):
+    # Python 2 -- fall back to one QThread per command
+    runMany = None
 from functools import wraps
 
 def tip_decorate(func):
@@ -200,6 +205,24 @@ class ITkPDThread(QThread):
     def run(self):
         self.data = self.ITkPDSession.doSomething(**self.command)
 
+# Run many commands concurrently on a single asyncio event loop inside one QThread (sharing the token of ITkPDSession)
+class ITkPDAsyncThread(QThread):
+
+    def __init__(self, ITkPDSession, commands = [], parent = None):
+        super(ITkPDAsyncThread, self).__init__(parent)
+        self.ITkPDSession   = ITkPDSession
+        self.commands       = commands
+        self.parent         = parent
+        self.data           = None
+        self.error          = None
+
+    # data := the result of each command (or the exception it raised), error := the exception raised if the commands could not be run at all
+    def run(self):
+        try:
+            self.data = runMany(self.commands, session = self.ITkPDSession, enable_printing = self.ITkPDSession.enable_printing, return_exceptions = True)
+        except Exception as e:
+            self.error = e
+
 ##############################################################################################################################################
 ##############################################################################################################################################
 ## ---------------------------------------------------------------------------------------------------------------------------------------- ##
@@ -593,7 +616,16 @@ class ComponentAssemblyGui__Step2(QWidget):
                         children[i] = child
                     else:
                         children.append(child)
-            if children != []:
+            if children != [] and runMany is not None:
+                commands = [{'action': 'listComponents', 'method': 'GET', 'data': {'project': self.componentType_detailed['project']['code'], 'componentType': [self.componentType_detailed['code']], 'type': [self.type[0]]}}]
+                self.table__comps.addTab(QComponentTableWidget(self.table__comps, ['Serial (Component) #', 'Type', 'Stage']), self.componentType_detailed['code'])
+                for child in children:
+                    commands.append({'action': 'listComponents', 'method': 'GET', 'data': {'project': self.componentType_detailed['project']['code'], 'componentType': [child['code']], 'type': [child['type']['code']]}})
+                    self.table__comps.addTab(QComponentTableWidget(self.table__comps, ['Serial (Component) #', 'Type', 'Stage']), child['name'])
+                self.thread = ITkPDAsyncThread(self.ITkPDSession, commands, self)
+                self.thread.finished.connect(self.__fillTables)
+                self.thread.start()
+            elif children != []:
                 threads = [ITkPDThread(self.ITkPDSession, {'action': 'listComponents', 'method': 'GET', 'data': {'project': self.componentType_detailed['project']['code'], 'componentType': [self.componentType_detailed['code']], 'type': [self.type[0]]}}, self)]
                 self.table__comps.addTab(QComponentTableWidget(self.table__comps, ['Serial (Component) #', 'Type', 'Stage']), self.componentType_detailed['code'])
                 threads[0].finished.connect(lambda: self.table__comps[0].fillTable(threads[0].data))
@@ -620,6 +652,17 @@ class ComponentAssemblyGui__Step2(QWidget):
             self.remove.setEnabled(False)
             self.assemble.setEnabled(False)
 
+    # Fill the component tables from the listings of ITkPDAsyncThread, reporting the listings which failed rather than raising in the slot
+    def __fillTables(self):
+        if self.thread.error is not None:
+            QMessageBox.warning(self, 'Error', 'Components could not be listed: %s' % self.thread.error)
+            return
+        for i, data in enumerate(self.thread.data):
+            if isinstance(data, Exception):
+                QMessageBox.warning(self, 'Error', 'Components of \"%s\" could not be listed: %s' % (self.table__comps.tabText(i), data))
+            else:
+                self.table__comps[i].fillTable(data)
+
     @DEBUG
     def reset(self):
         self.__setDefaults()
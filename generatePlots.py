@@ -3,11 +3,167 @@
 # Created: 2018/11/13, Updated: 2019/01/28
 # Written by Matthew Basso
 
-import sys, os
-from collections import Counter
+import sys, os, json, multiprocessing
+import numpy as np
 from itk_pdb.dbAccess import ITkPDSession
+from itk_pdb.componentTable import ComponentTable
+from itk_pdb.tableCuts import Column, DAY, allOf
+from itk_pdb.dateCounts import cumulativeCounts, BINNINGS
+from itk_pdb.stageTimeline import StageLog, StageTimeline, updateLog, DEFAULT_PATH as STAGE_LOG_PATH
+from itk_pdb.snapshotStore import SnapshotStore
 from itk_pdb.databaseUtilities import INFO, STATUS, WARNING, ERROR
 
+# PyYAML is only needed for batch files written in YAML
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# Define a general error class (for arguments which do not make sense)
+class PlotError(Exception):
+    def __init__(self, message):
+        super(PlotError, self).__init__(message)
+        self.message = message
+
+# Default arguments of a plot (as for the command line)
+DEFAULTS = {    'project':                  'S',
+                'type':                     None,
+                'currentStage':             None,
+                'currentLocation':          None,
+                'institution':              None,
+                'currentGrade':             None,
+                'qaState':                  None,
+                'lowerDate':                None,
+                'upperDate':                None,
+                'trashed':                  None,
+                'dummy':                    None,
+                'assembled':                None,
+                'reworked':                 None,
+                'qaTested':                 None,
+                'split':                    None,
+                'rrulewrapperFrequency':    'MONTHLY',
+                'rrulewrapperInterval':     2,
+                'binning':                  'day',
+                'stageLog':                 os.getenv('ITK_DB_STAGE_LOG', None),
+                'snapshot':                 os.getenv('ITK_DB_SNAPSHOT', None),
+                'offline':                  False,
+                'includeTotal':             False,
+                'saveJson':                 False,
+                'stream':                   False   }
+
+# Arguments which are lists of codes (upper case)
+CODE_LISTS = ['type', 'currentStage', 'currentLocation', 'institution']
+
+# Arguments which are lists of allowed values
+VALUE_LISTS = CODE_LISTS + ['currentGrade', 'qaState', 'trashed', 'dummy', 'assembled', 'reworked', 'qaTested']
+
+# Define a function for loading a batch of plots from a YAML or JSON file, returning a list of kwargs for PlotMaker.makeBatch()
+# The file holds a list of plots (or {'defaults': {...}, 'plots': [...]}), each with the same keys as the kwargs of makePlots(), e.g.,
+#   - {componentType: HYBRID, savePath: plots/hybrids.pdf, split: institution, trashed: false}
+#   - {componentType: MODULE, savePath: plots/modules.png, currentStage: [TESTING], lowerDate: '2019-01-01'}
+# savePath is relative to the current directory, dates are 'YYYY-MM-DD' and single values are accepted wherever a list is
+def loadBatch(path, startTime):
+    with open(path) as file:
+        if os.path.splitext(path)[1].lower() in ['.yaml', '.yml']:
+            if yaml is None:
+                raise PlotError('Python module \'yaml\' (PyYAML) is required to read %s' % path)
+            batch = yaml.safe_load(file)
+        else:
+            batch = json.load(file)
+    defaults = batch.get('defaults', {}) if isinstance(batch, dict) else {}
+    plots = []
+    for i, spec in enumerate(batch.get('plots', []) if isinstance(batch, dict) else batch):
+        kwargs = dict(DEFAULTS, startTime = startTime)
+        kwargs.update(defaults)
+        kwargs.update(spec)
+        if 'componentType' not in kwargs or 'savePath' not in kwargs:
+            raise PlotError('Plot %s of %s needs a \'componentType\' and a \'savePath\'' % (i, path))
+        for key in VALUE_LISTS:
+            if kwargs[key] != None and not isinstance(kwargs[key], list):
+                kwargs[key] = [kwargs[key]]
+        for key in CODE_LISTS:
+            if kwargs[key] != None:
+                kwargs[key] = [str(value).upper() for value in kwargs[key]]
+        kwargs['project'] = kwargs['project'].upper()
+        kwargs['componentType'] = kwargs['componentType'].upper()
+        kwargs['savePath'] = os.path.abspath(kwargs['savePath'])
+        for key in ['lowerDate', 'upperDate']:
+            if kwargs[key] != None:
+                kwargs[key] = str(kwargs[key])
+        plots.append(kwargs)
+    return plots
+
+# Define a function for drawing (and saving) the plot of a counter
+def drawPlots(counter, **kwargs):
+
+    import datetime
+    import matplotlib.pyplot as plt
+    from matplotlib.dates import DAILY, MONTHLY, YEARLY, DateFormatter, rrulewrapper, RRuleLocator
+
+    if kwargs['rrulewrapperFrequency'] == 'DAILY':
+        rrulewrapperFrequency = DAILY
+    elif kwargs['rrulewrapperFrequency'] == 'MONTHLY':
+        rrulewrapperFrequency = MONTHLY
+    elif kwargs['rrulewrapperFrequency'] == 'YEARLY':
+        rrulewrapperFrequency = YEARLY
+
+    rule = rrulewrapper(rrulewrapperFrequency, interval = kwargs['rrulewrapperInterval'])
+    loc = RRuleLocator(rule)
+    formatter = DateFormatter('%Y/%m/%d')
+
+    plt.style.use("seaborn-whitegrid")
+    fig, ax = plt.subplots()
+
+    keys = counter.keys()
+    if len(keys) == 1:
+        dates = [datetime.date(*[int(item) for item in date.split('-')]) for date in counter['total']['dates']]
+        counts = counter['total']['counts']
+        plt.plot_date(dates, counts, linestyle = '-', label = 'total')
+
+    else:
+        if kwargs['includeTotal']:
+            dates = [datetime.date(*[int(item) for item in date.split('-')]) for date in counter['total']['dates']]
+            counts = counter['total']['counts']
+            plt.plot_date(dates, counts, linestyle = '-', label = 'total')
+        for key in sorted(keys):
+            if key == 'total':
+                continue
+            dates = [datetime.date(*[int(item) for item in date.split('-')]) for date in counter[key]['dates']]
+            counts = counter[key]['counts']
+            plt.plot_date(dates, counts, linestyle = '-', label = key)
+
+    plt.title('project = \'%s\', componentType = \'%s\' -- Generated on %s' % (kwargs['project'], kwargs['componentType'], kwargs['startTime']))
+    plt.xlabel('Date [a.u.]')
+    plt.ylabel('Frequency [a.u.]')
+    plt.legend()
+
+    ax.xaxis.set_major_locator(loc)
+    ax.xaxis.set_major_formatter(formatter)
+
+    # if kwargs['lowerDate'] != None:
+    #     plt.gca().set_xlim(left = datetime.date(*[int(item) for item in kwargs['lowerDate'].split('-')]))
+    # if kwargs['upperDate'] != None:
+    #     plt.gca().set_xlim(right = datetime.date(*[int(item) for item in kwargs['upperDate'].split('-')]))
+
+    if kwargs['savePath'][-4:] == '.pdf':
+        plt.savefig(kwargs['savePath'])
+    elif kwargs['savePath'][-4:] == '.png':
+        plt.savefig(kwargs['savePath'], dpi = 150)
+    if kwargs['saveJson']:
+        counter['kwargs'] = kwargs
+        import json
+        with open(kwargs['savePath'][0:-4] + '.json', 'w') as file:
+            json.dump(counter, file, sort_keys = True, indent = 4, separators = (',', ': '))
+    plt.close(fig)
+    return kwargs['savePath']
+
+# Draw a (counter, kwargs) job of PlotMaker.makeBatch() in a worker process (without a display)
+def _drawJob(job):
+    import matplotlib
+    matplotlib.use('Agg')
+    counter, kwargs = job
+    return drawPlots(counter, **kwargs)
+
 class PlotMaker(ITkPDSession):
 
     def __init__(self, verbose):
@@ -16,478 +172,233 @@ class PlotMaker(ITkPDSession):
         super(PlotMaker, self).__init__()
         self.verbose = verbose
 
-    # Define our function for applying cuts (from a list of choices or a boolean value)
-    def __cutOnValue(self, component, allowedValues, keywords):
-
-        try:
-
-            # Get value at the level of the first keyword
-            value = component[keywords[0]]
-
-            # If there are multiple keywords, continue to update value (note, the order of the keywords should match the order in the uuComponent object)
-            for keyword in keywords[1:]:
-                value = value[keyword]
-
-            # If the value passes the cut, return True
-            if value in allowedValues:
-                return True
-
-            # If the value fails the cut, return False
-            else:
-                if self.verbose:
-                    INFO('Component \'%s\' failed at \'%s\' cut: \'%s\' = %s' % (component['code'], keywords[0], keywords[0], value))
-                return False
-
-        # If the keywords do not actually exist for the object, return False too
-        except KeyError as error:
-            if self.verbose:
-                WARNING('Component \'%s\' failed due to KeyError: %s' % (component['code'], error))
-            return False
-
-    # Define our function for applying cuts using a mathematical (in)equality operator
-    def __cutOnValueWithOperator(self, component, operator, cutValue, keywords):
-
-        try:
-
-            # Get value at the level of the first keyword
-            value = component[keywords[0]]
-
-            # If there are multiple keywords, continue to update value (note, the order of the keywords should match the order in the uuComponent object)
-            for keyword in keywords[1:]:
-                if ':' in keyword:
-                    index1, index2 = [int(item) for item in keyword.split(':')]
-                    value = value[index1:index2]
-                else:
-                    value = value[keyword]
-
-            # If the value passes the cut, return True, else return False (note: we have to check each case for the operator to be used)
-            if operator == '<':
-                if value < cutValue:
-                    return True
-                else:
-                    if self.verbose:
-                        INFO('Component \'%s\' failed at \'%s\' cut: \'%s\' = %s' % (component['code'], keywords[0], keywords[0], value))
-                    return False
-            elif operator == '>':
-                if value > cutValue:
-                    return True
-                else:
-                    if self.verbose:
-                        INFO('Component \'%s\' failed at \'%s\' cut: \'%s\' = %s' % (component['code'], keywords[0], keywords[0], value))
-                    return False
-            elif operator == '<=':
-                if value <= cutValue:
-                    return True
-                else:
-                    if self.verbose:
-                        INFO('Component \'%s\' failed at \'%s\' cut: \'%s\' = %s' % (component['code'], keywords[0], keywords[0], value))
-                    return False
-            elif operator == '>=':
-                if value >= cutValue:
-                    return True
-                else:
-                    if self.verbose:
-                        INFO('Component \'%s\' failed at \'%s\' cut: \'%s\' = %s' % (component['code'], keywords[0], keywords[0], value))
-                    return False
-            elif operator == '==':
-                if value == cutValue:
-                    return True
-                else:
-                    if self.verbose:
-                        INFO('Component \'%s\' failed at \'%s\' cut: \'%s\' = %s' % (component['code'], keywords[0], keywords[0], value))
-                    return False
-            elif operator == '!=':
-                if value != cutValue:
-                    return True
-                else:
-                    if self.verbose:
-                        INFO('Component \'%s\' failed at \'%s\' cut: \'%s\' = %s' % (component['code'], keywords[0], keywords[0], value))
-                    return False
-
-        # If the keywords do not actually exist for the object, return False too
-        except KeyError as error:
-            if self.verbose:
-                WARNING('Component \'%s\' failed due to KeyError: %s' % (component['code'], error))
-            return False
+        # Metadata used for argument checking ({(project, componentType): JSON} and the institutions), fetched once per session
+        self.__componentTypes = {}
+        self.__institutions = None
 
-    # Define a function for adding a single cutOnValue
-    def __addCutOnValue(self, cuts, cutName, allowedValues, keywords):
-
-        # Check if allowedValues is a list and doesn't equal a list of None
-        # If this passes, we add the cut
-        if isinstance(allowedValues, list) and allowedValues != [None]:
-            if self.verbose:
-                INFO('Adding cut \'%s\'...' % cutName)
-            cuts[cutName] = lambda component: self.__cutOnValue(component, allowedValues = allowedValues, keywords = keywords)
-
-        # Check if allowedValues is not a list and doesn't equal None
-        # If this passes, we add the cut
-        elif not isinstance(allowedValues, list) and allowedValues != None:
-            if self.verbose:
-                INFO('Adding cut \'%s\'...' % cutName)
-            cuts[cutName] = lambda component: self.__cutOnValue(component, allowedValues = allowedValues, keywords = keywords)
-
-        # Else, don't add the cut
-        else:
-            pass
-
-    # Define a function for adding all of our cuts from our kwargs
+    # Define a function for compiling our cuts from our kwargs, returning a list of (cutName, tableCuts.Cut)
+    # Each cut is an expression over the columns of a ComponentTable, evaluated for every component at once by __cutMask()
     def __getCuts(self, **kwargs):
 
         if self.verbose:
             INFO('Adding cuts...')
 
         # Initialize our cut list
-        cuts = {}
+        cuts = []
 
-        # Add our cuts, one at a time
-        self.__addCutOnValue(cuts, 'currentLocation', allowedValues = kwargs['currentLocation'], keywords = ['currentLocation', 'code'])
-        self.__addCutOnValue(cuts, 'institution', allowedValues = kwargs['institution'], keywords = ['institution', 'code'])
-        self.__addCutOnValue(cuts, 'currentGrade', allowedValues = kwargs['currentGrade'], keywords = ['currentGrade'])
-        self.__addCutOnValue(cuts, 'qaState', allowedValues = kwargs['qaState'], keywords = ['qaState'])
+        # Add our cuts on a list of allowed values (or a single value), unless the value is None (or [None])
+        for cutName in ['currentLocation', 'institution', 'currentGrade', 'qaState', 'trashed', 'dummy', 'assembled', 'reworked', 'qaTested']:
+            allowedValues = kwargs[cutName]
+            if allowedValues == None or allowedValues == [None]:
+                continue
+            if self.verbose:
+                INFO('Adding cut \'%s\'...' % cutName)
+            cuts.append((cutName, Column(cutName).isIn(allowedValues if isinstance(allowedValues, list) else [allowedValues])))
 
-        # Add our lower date cut
+        # Add our lower/upper date cuts (on the creation day, inclusive)
         if kwargs['lowerDate'] != None:
             if self.verbose:
                 INFO('Adding cut \'lowerDate\'...')
-            cuts['lowerDate'] = lambda component: self.__cutOnValueWithOperator(component, '>=', kwargs['lowerDate'], ['cts', '0:10'])
-
-        # Add our upper date cut
+            cuts.append(('lowerDate', Column(DAY) >= kwargs['lowerDate']))
         if kwargs['upperDate'] != None:
             if self.verbose:
                 INFO('Adding cut \'upperDate\'...')
-            cuts['upperDate'] = lambda component: not self.__cutOnValueWithOperator(component['cts'], '>=', kwargs['upper'], [])
-
-        # Add the remaining cuts
-        self.__addCutOnValue(cuts, 'trashed', allowedValues = kwargs['trashed'], keywords = ['trashed'])
-        self.__addCutOnValue(cuts, 'dummy', allowedValues = kwargs['dummy'], keywords = ['dummy'])
-        self.__addCutOnValue(cuts, 'assembled', allowedValues = kwargs['assembled'], keywords = ['assembled'])
-        self.__addCutOnValue(cuts, 'reworked', allowedValues = kwargs['reworked'], keywords = ['reworked'])
-        self.__addCutOnValue(cuts, 'qaTested', allowedValues = kwargs['qaTested'], keywords = ['qaTested'])
+            cuts.append(('upperDate', Column(DAY) <= kwargs['upperDate']))
 
         # Return the cuts
         if self.verbose:
             INFO('All cuts successfully added.')
         return cuts
 
-    # Define a function for applying every cut in cuts to a component
-    def __applyCuts(self, component, cuts):
-
-        # Iterate through our cuts
-        for cut in cuts.values():
-
-            # If the cut fails (i.e., returns False), return False to indicate that the component did not pass
-            if not cut(component):
-                return False
-
-        # Else, return True is everything passes
-        if self.verbose:
-            INFO('Component \'%s\' passed all cuts.' % component['code'])
-        return True
-
-    def __addToCounter(self, component, counter, split):
-        date = component['cts'][0:10]
-        counter['total'].append(date)
-        if split:
-            try:
-                splitType = component[split]['code']
-            except TypeError as error:
-                if self.verbose:
-                    WARNING('Component \'%s\' failed to be added to counter due to TypeError: %s' % (component['code'], error))
-                return counter
-            except KeyError as error:
-                if self.verbose:
-                    WARNING('Component \'%s\' failed to be added to counter due to KeyError: %s' % (component['code'], error))
-                return counter
-            if splitType in counter.keys():
-                counter[splitType].append(date)
-            else:
-                counter[splitType] = [date]
-        if self.verbose:
-            INFO('Component \'%s\' successfully added to counter.' % component['code'])
-        return counter
-
-    def __addToCounterWithStages(self, component, counter, **kwargs):
-        try:
-            for i, stage in enumerate(component['stages']):
-                date = stage['dateTime'][0:10]
-                if stage in counter.keys():
-                    if i == 0:
-                        counter[stage].append(date)
-                    else:
-                        counter[stage].append(date)
-                        counter[stages[i-1]].append('-' + date)
-                else:
-                    if i == 0:
-                        counter[stage].append(date)
-                    else:
-                        counter[stage].append(date)
-                        counter[stages[i-1]].append('-' + date)
-        except TypeError as error:
-            if self.verbose:
-                WARNING('Component \'%s\' failed due to TypeError: %s' % (component['code'], error))
-            return counter
-        except KeyError as error:
-            if self.verbose:
-                WARNING('Component \'%s\' failed due to KeyError: %s' % (component['code'], error))
-            return counter
-
-    # Define a function for finalizing our counter (i.e., performing a cumulative sum and organizing by date)
-    def __finalizeCounter(self, counter, **kwargs):
-
-        # Define a small function for performing the cumulative sum of a list
-        def accumulate(list):
-            total = 0
-            for count in list:
-                total += count
-                yield total
-
-        # Iterate through the keys ('total' and any 'split' keys) of our counter
-        for key in counter.keys():
-
-            # Turn each iterable into a Counter object
-            counter[key] = Counter(counter[key])
-
-            # Sort the dates
-            dates = sorted(counter[key].keys())
-
-            # Perform a cumulative sum of our counts in the order of dates
-            counts = list(accumulate([counter[key][date] for date in dates]))
-
-            # Redefine two new keys for the current key of counts we are examining:
-            # dates := time ordered list of dates
-            # counts := cumulative sum of counts in order of dates
-            counter[key] = {'dates': dates, 'counts': counts}
-
-        # Get the earliest and latest dates from counter['total']
-        earliest_date = kwargs['lowerDate'] if kwargs['lowerDate'] != None else counter['total']['dates'][0]
-        latest_date = kwargs['upperDate'] if kwargs['upperDate'] != None else counter['total']['dates'][-1]
-
-        # Iterate through our keys, inserting the earliest and latest dates from 'total'
-        # (and keeping the number of counts the same as the 2nd earliest/latest date)
-        for key in counter.keys():
-            if counter[key]['dates'][0] != earliest_date:
-                counter[key]['dates'].insert(0, earliest_date)
-                counter[key]['counts'].insert(0, counter[key]['counts'][0])
-            if counter[key]['dates'][-1] != latest_date:
-                counter[key]['dates'].append(latest_date)
-                counter[key]['counts'].append(counter[key]['counts'][-1])
-
-        # Return our counter
-        return counter
-
-    def __finalizeCounterWithStages(self, counter, **kwargs):
-
-        # Define a small function for performing the cumulative sum of a list
-        def accumulate(list):
-            total = 0
-            for count in list:
-                total += count
-                yield total
-
-        counter['total'] = []
-        for dates in counter.values():
-            counter['total'] += dates
-
-        # Iterate through the keys of our counter
-        for key in counter.keys():
-
-            # Turn each iterable into a Counter object
-            counter[key] = Counter(counter[key])
-
-            # Sort the dates
-            dates = sorted(counter[key].keys())
-
-            for date in dates:
-                if date[0] == '-':
-                    counter[key][date[1:]] -= counter[key][date]
-                    del counter[date]
-                else:
-                    break
-
-            # Perform a cumulative sum of our counts in the order of dates
-            counts = list(accumulate([counter[key][date] for date in dates]))
-
-            # Redefine two new keys for the current key of counts we are examining:
-            # dates := time ordered list of dates
-            # counts := cumulative sum of counts in order of dates
-            counter[key] = {'dates': dates, 'counts': counts}
-
-        # Get the earliest and latest dates from counter['total']
-        earliest_date = counter['total']['dates'][0]
-        latest_date = counter['total']['dates'][-1]
-
-        # Iterate through our keys, inserting the earliest and latest dates from 'total'
-        # (and keeping the number of counts the same as the 2nd earliest/latest date)
-        for key in counter.keys():
-            if counter[key]['dates'][0] != earliest_date:
-                counter[key]['dates'].insert(0, earliest_date)
-                counter[key]['counts'].insert(0, counter[key]['counts'][0])
-            if counter[key]['dates'][-1] != latest_date:
-                counter[key]['dates'].append(latest_date)
-                counter[key]['counts'].append(counter[key]['counts'][-1])
-
-        # Return our counter
-        return counter
-
-    def __drawPlots(self, counter, **kwargs):
-
-        import datetime
-
-        if kwargs['rrulewrapperFrequency'] == 'DAILY':
-            rrulewrapperFrequency = DAILY
-        elif kwargs['rrulewrapperFrequency'] == 'MONTHLY':
-            rrulewrapperFrequency = MONTHLY
-        elif kwargs['rrulewrapperFrequency'] == 'YEARLY':
-            rrulewrapperFrequency = YEARLY
-
-        rule = rrulewrapper(rrulewrapperFrequency, interval = kwargs['rrulewrapperInterval'])
-        loc = RRuleLocator(rule)
-        formatter = DateFormatter('%Y/%m/%d')
-
-        plt.style.use("seaborn-whitegrid")
-        fig, ax = plt.subplots()
-
-        keys = counter.keys()
-        if len(keys) == 1:
-            dates = [datetime.date(*[int(item) for item in date.split('-')]) for date in counter['total']['dates']]
-            counts = counter['total']['counts']
-            plt.plot_date(dates, counts, linestyle = '-', label = 'total')
-
-        else:
-            if kwargs['includeTotal']:
-                dates = [datetime.date(*[int(item) for item in date.split('-')]) for date in counter['total']['dates']]
-                counts = counter['total']['counts']
-                plt.plot_date(dates, counts, linestyle = '-', label = 'total')
-            for key in sorted(keys):
-                if key == 'total':
-                    continue
-                dates = [datetime.date(*[int(item) for item in date.split('-')]) for date in counter[key]['dates']]
-                counts = counter[key]['counts']
-                plt.plot_date(dates, counts, linestyle = '-', label = key)
-
-        plt.title('project = \'%s\', componentType = \'%s\' -- Generated on %s' % (kwargs['project'], kwargs['componentType'], kwargs['startTime']))
-        plt.xlabel('Date [a.u.]')
-        plt.ylabel('Frequency [a.u.]')
-        plt.legend()
-
-        ax.xaxis.set_major_locator(loc)
-        ax.xaxis.set_major_formatter(formatter)
-
-        # if kwargs['lowerDate'] != None:
-        #     plt.gca().set_xlim(left = datetime.date(*[int(item) for item in kwargs['lowerDate'].split('-')]))
-        # if kwargs['upperDate'] != None:
-        #     plt.gca().set_xlim(right = datetime.date(*[int(item) for item in kwargs['upperDate'].split('-')]))
-
-        if kwargs['savePath'][-4:] == '.pdf':
-            plt.savefig(kwargs['savePath'])
-        elif kwargs['savePath'][-4:] == '.png':
-            plt.savefig(kwargs['savePath'], dpi = 150)
-        if kwargs['saveJson']:
-            counter['kwargs'] = kwargs
-            import json
-            with open(kwargs['savePath'][0:-4] + '.json', 'w') as file:
-                json.dump(counter, file, sort_keys = True, indent = 4, separators = (',', ': '))
-
-    # Define our main makePlots function
-    def makePlots(self, **kwargs):
-
-        # Get our keys for kwargs
+    # Define a function for applying every cut at once to a ComponentTable, returning the boolean mask of the components passing all cuts
+    # (components missing a value we cut on fail that cut)
+    def __cutMask(self, table, cuts):
+        if not self.verbose:
+            return allOf(cut for cutName, cut in cuts).mask(table)
+        mask = np.ones(len(table), dtype = bool)
+        for cutName, cut in cuts:
+            passed = cut.mask(table)
+            INFO('Cut \'%s\' removes %s of the remaining components.' % (cutName, int((mask & ~passed).sum())))
+            mask &= passed
+        return mask
+
+    # Define a function for checking the arguments of a plot, raising PlotError if they make no sense
+    # Note, this does not check every required argument for makePlot() is present in kwargs
+    ########################################################################################################
+    # This is bad of me, it should be fixed in the future if this class is to be used outside of this file #
+    ########################################################################################################
+    def __checkArguments(self, **kwargs):
         keys = kwargs.keys()
-
-        # Define a general error class
-        class Error(Exception):
-            def __init__(self, message):
-                self.message = message
-
-        # Perform some argument checking
-        # Note, this does not check every required argument for makePlot() is present in kwargs
-        ########################################################################################################
-        # This is bad of me, it should be fixed in the future if this class is to be used outside of this file #
-        ########################################################################################################
-        INFO('Peforming argument checking...')
-        try:
-            if 'project' not in keys:
-                raise Error('Keyword argument \'project\' is required by PlotMaker.makePlots().')
-            if 'componentType' not in keys:
-                raise Error('Keyword argument \'componentType\' is required by PlotMaker.makePlots().')
-            if 'savePath' not in keys:
-                raise Error('Keyword argument \'savePath\' is required by PlotMaker.makePlots().')
-            if kwargs['savePath'][-4:] != '.pdf' and kwargs['savePath'][-4:] != '.png':
-                raise Error('--savePath must have suffix \'.pdf\' or \'.png\'": --savePath = %s' % kwargs['savePath'])
-            if not os.path.exists(os.path.dirname(kwargs['savePath'])):
-                raise Error('Parent directory does not exist: %s' % os.path.dirname(kwargs['savePath']))
-            if kwargs['type'] != None or kwargs['currentStage'] != None or kwargs['split'] in ['type', 'currentStage']:
-                componentTypeJson = self.doSomething(action = 'getComponentTypeByCode', method = 'GET', data = {'project': kwargs['project'], 'code': kwargs['componentType']})
-                if componentTypeJson['types'] == [] and (kwargs['split'] == 'type' or kwargs['type'] != []):
-                    raise Error('Component type \'%s\' does not have any types and so it does not make sense to split/filter by type.' % kwargs['componentType'])
-                if kwargs['type'] != None:
-                    unknownTypes = [type for type in kwargs['type'] if type not in [type2['code'] for type2 in componentTypeJson['types']]]
-                    if unknownTypes != []:
-                        raise Error('Unknown type code(s) for component type \'%s\': [\'%s\']' % (kwargs['componentType'], '\', \''.join(unknownTypes)))
-                if componentTypeJson['stages'] == [] and (kwargs['split'] == 'currentStage' or kwargs['currentStage'] != []):
-                    raise Error('Component type \'%s\' does not have any types and so it does not make sense to split/filter by the current stage.' % kwargs['componentType'])
-                if kwargs['currentStage'] != None:
-                    unknownStages = [stage for stage in kwargs['currentStage'] if stage not in [stage2['code'] for stage2 in componentTypeJson['stages']]]
-                    if unknownStages != []:
-                        raise Error('Unknown stage code(s) for component type \'%s\': [\'%s\']' % (kwargs['componentType'], '\', \''.join(unknownStages)))
-            if kwargs['currentLocation'] != None or kwargs['institution'] != None:
-                institutionsJson = self.doSomething('listInstitutions', 'GET', data = {})
-                if kwargs['currentLocation'] != None:
-                    unknownCurrentLocations = [currentLocation for currentLocation in kwargs['currentLocation'] if currentLocation not in [currentLocation2['code'] for currentLocation2 in institutionsJson]]
-                    if unknownCurrentLocations != []:
-                        raise Error('Unknown current location code(s): [\'%s\']' % '\', \''.join(unknownCurrentLocations))
-                if kwargs['institution'] != None:
-                    unknownInstitutions = [institution for institution in kwargs['institution'] if institution not in [institution2['code'] for institution2 in institutionsJson]]
-                    if unknownInstitutions != []:
-                        raise Error('Unknown institution code(s): [\'%s\']' % '\', \''.join(unknownInstitutions))
-        except Error as e:
-            ERROR(e.message)
-            STATUS('Finished with error.', False)
-            sys.exit(1)
-        INFO('Argument checking passed.')
-
-        # Get our initial list of components from the DB
+        if 'project' not in keys:
+            raise PlotError('Keyword argument \'project\' is required by PlotMaker.makePlots().')
+        if 'componentType' not in keys:
+            raise PlotError('Keyword argument \'componentType\' is required by PlotMaker.makePlots().')
+        if 'savePath' not in keys:
+            raise PlotError('Keyword argument \'savePath\' is required by PlotMaker.makePlots().')
+        if kwargs['savePath'][-4:] != '.pdf' and kwargs['savePath'][-4:] != '.png':
+            raise PlotError('--savePath must have suffix \'.pdf\' or \'.png\'": --savePath = %s' % kwargs['savePath'])
+        if not os.path.exists(os.path.dirname(kwargs['savePath'])):
+            raise PlotError('Parent directory does not exist: %s' % os.path.dirname(kwargs['savePath']))
+        # The stage histories are counted per stage, so they cannot also be split by another column
+        if kwargs['currentStage'] != None and kwargs['split'] not in [None, 'currentStage']:
+            raise PlotError('--currentStage can only be combined with --split currentStage (the counts are per stage): --split = %s' % kwargs['split'])
+        # Offline, the plot is made from the snapshot as it is, so the codes can only be checked against the ITkPD when connected
+        if kwargs.get('offline', False):
+            if not kwargs.get('snapshot'):
+                raise PlotError('--offline requires --snapshot.')
+            return
+        if kwargs['type'] != None or kwargs['currentStage'] != None or kwargs['split'] in ['type', 'currentStage']:
+            key = (kwargs['project'], kwargs['componentType'])
+            if key not in self.__componentTypes:
+                self.__componentTypes[key] = self.doSomething(action = 'getComponentTypeByCode', method = 'GET', data = {'project': kwargs['project'], 'code': kwargs['componentType']})
+            componentTypeJson = self.__componentTypes[key]
+            if componentTypeJson['types'] == [] and (kwargs['split'] == 'type' or kwargs['type'] != []):
+                raise PlotError('Component type \'%s\' does not have any types and so it does not make sense to split/filter by type.' % kwargs['componentType'])
+            if kwargs['type'] != None:
+                unknownTypes = [type for type in kwargs['type'] if type not in [type2['code'] for type2 in componentTypeJson['types']]]
+                if unknownTypes != []:
+                    raise PlotError('Unknown type code(s) for component type \'%s\': [\'%s\']' % (kwargs['componentType'], '\', \''.join(unknownTypes)))
+            if componentTypeJson['stages'] == [] and (kwargs['split'] == 'currentStage' or kwargs['currentStage'] != []):
+                raise PlotError('Component type \'%s\' does not have any types and so it does not make sense to split/filter by the current stage.' % kwargs['componentType'])
+            if kwargs['currentStage'] != None:
+                unknownStages = [stage for stage in kwargs['currentStage'] if stage not in [stage2['code'] for stage2 in componentTypeJson['stages']]]
+                if unknownStages != []:
+                    raise PlotError('Unknown stage code(s) for component type \'%s\': [\'%s\']' % (kwargs['componentType'], '\', \''.join(unknownStages)))
+        if kwargs['currentLocation'] != None or kwargs['institution'] != None:
+            if self.__institutions is None:
+                self.__institutions = self.doSomething('listInstitutions', 'GET', data = {})
+            institutionsJson = self.__institutions
+            if kwargs['currentLocation'] != None:
+                unknownCurrentLocations = [currentLocation for currentLocation in kwargs['currentLocation'] if currentLocation not in [currentLocation2['code'] for currentLocation2 in institutionsJson]]
+                if unknownCurrentLocations != []:
+                    raise PlotError('Unknown current location code(s): [\'%s\']' % '\', \''.join(unknownCurrentLocations))
+            if kwargs['institution'] != None:
+                unknownInstitutions = [institution for institution in kwargs['institution'] if institution not in [institution2['code'] for institution2 in institutionsJson]]
+                if unknownInstitutions != []:
+                    raise PlotError('Unknown institution code(s): [\'%s\']' % '\', \''.join(unknownInstitutions))
+
+    # Define a function for fetching the list of components of a plot (filtered by project/componentType/type/currentStage) as a ComponentTable
+    # With a snapshot, the snapshot is refreshed (unless offline) and the components are read from it instead (see snapshotStore.SnapshotStore)
+    def __fetchTable(self, **kwargs):
+        if kwargs.get('snapshot'):
+            snapshot = SnapshotStore(kwargs['snapshot'])
+            if not kwargs.get('offline', False):
+                INFO('Refreshing the snapshot of project/componentType \'%s/%s\': %s' % (kwargs['project'], kwargs['componentType'], snapshot.path))
+                listing = self.doSomethingPaged(action = 'listComponents', method = 'GET', data = {'project': kwargs['project'], 'componentType': kwargs['componentType']},
+                                                stream = kwargs.get('stream', False))
+                stages = kwargs['currentStage'] != None or kwargs['split'] == 'currentStage'
+                refresh = snapshot.refresh(listing, kwargs['project'], kwargs['componentType'], getComponents = self.getComponents if stages else None)
+                INFO('Snapshot refreshed (%s component(s) written, %s removed, %s fetched).' % (refresh['written'], refresh['removed'], refresh['fetched']))
+                for code, error in refresh['errors']:
+                    WARNING('Component \'%s\' failed due to %s: %s' % (code, type(error).__name__, error))
+            elif snapshot.refreshed(kwargs['project'], kwargs['componentType']) is None:
+                WARNING('Project/componentType \'%s/%s\' was never refreshed in the snapshot: %s' % (kwargs['project'], kwargs['componentType'], snapshot.path))
+            table = snapshot.table(kwargs['project'], kwargs['componentType'], type = kwargs['type'], currentStage = kwargs['currentStage'])
+            snapshot.close()
+            INFO('List of components successfully read from the snapshot (%s entries).' % len(table))
+            return table
         data = {'project': kwargs['project'], 'componentType': kwargs['componentType']}
         if kwargs['type'] != None:
             data['type'] = kwargs['type']
         if kwargs['currentStage'] != None:
             data['currentStage'] = kwargs['currentStage']
+        # The components are fetched lazily page by page (see pagination.PageIterator) and converted into a columnar table as they arrive
+        # With stream, each page is also decoded incrementally as it arrives (see jsonStream.JSONListStream)
         INFO('Fetching a list of components filtered by project/componentType/type/currentStage from the ITkPD...')
-        components = self.doSomething(action = 'listComponents', method = 'GET', data = data)
-        INFO('List of components successfully fetched (%s entries).' % len(components))
+        table = ComponentTable.fromComponents(self.doSomethingPaged(action = 'listComponents', method = 'GET', data = data, stream = kwargs.get('stream', False)))
+        INFO('List of components successfully fetched (%s entries).' % len(table))
+        return table
 
-        # Get our cuts
-        cuts = self.__getCuts(**kwargs)
+    # Define a function for applying the cuts of a plot to a ComponentTable and generating its counter ({} if no components pass the cuts)
+    def __makeCounter(self, table, **kwargs):
 
-        # Apply our cuts to each component and keep only the components which pass all cuts
+        # The cuts are applied to all of the components at once
         INFO('Applying cuts to the list of components and generating counter...')
-        if kwargs['currentStage'] != None or kwargs['split'] == 'currentStage':
-            addToCounter = self.__addToCounterWithStages
-            finalizeCounter = lambda counter: self.__finalizeCounterWithStages(counter, **kwargs)
+        mask = self.__cutMask(table, self.__getCuts(**kwargs))
+
+        # The stage histories come from the stage log, which only fetches the components it does not know at their current stage
+        # (see stageTimeline.updateLog), and the number of components in each stage over time is computed from the whole log at once
+        # With a snapshot, its refresh has already fetched them (see __fetchTable())
+        if (kwargs['currentStage'] != None or kwargs['split'] == 'currentStage') and kwargs.get('snapshot'):
+            snapshot = SnapshotStore(kwargs['snapshot'])
+            timeline = StageTimeline.fromEvents(snapshot.events([table.value('code', i) for i in np.nonzero(mask)[0]]))
+            snapshot.close()
+            counter = timeline.counts(binning = kwargs.get('binning', 'day'), lowerDate = kwargs['lowerDate'], upperDate = kwargs['upperDate'], stages = kwargs['currentStage'])
+        elif kwargs['currentStage'] != None or kwargs['split'] == 'currentStage':
+            listing = [(table.value('code', i), table.value('currentStage', i)) for i in np.nonzero(mask)[0]]
+            stageLog = StageLog(kwargs.get('stageLog') or STAGE_LOG_PATH)
+            INFO('Updating the stage log: %s' % stageLog.path)
+            fetched, errors = updateLog(self, stageLog, listing)
+            INFO('Fetched the stage histories of %s component(s).' % fetched)
+            for code, error in errors:
+                WARNING('Component \'%s\' failed due to %s: %s' % (code, type(error).__name__, error))
+            timeline = StageTimeline.fromEvents(stageLog.events([code for code, currentStage in listing]))
+            stageLog.close()
+            counter = timeline.counts(binning = kwargs.get('binning', 'day'), lowerDate = kwargs['lowerDate'], upperDate = kwargs['upperDate'], stages = kwargs['currentStage'])
+
+        # Otherwise, the counter is binned and accumulated from the creation dates in one go (see dateCounts.cumulativeCounts)
         else:
-            addToCounter = self.__addToCounter
-            finalizeCounter = lambda counter: self.__finalizeCounter(counter, **kwargs)
-        split = kwargs['split']
-        passedComponents = 0
-        counter = {'total': []}
-        for component in components:
-            if self.__applyCuts(component, cuts):
-                passedComponents += 1
-                addToCounter(component, counter, split)
-
-        if [0 for value in counter.values() if value == []] != []:
+            counter = cumulativeCounts(table, mask, kwargs['split'], binning = kwargs.get('binning', 'day'), lowerDate = kwargs['lowerDate'], upperDate = kwargs['upperDate'])
+
+        if counter == {}:
             INFO('Cuts successfully applied to list of components (0 entries).')
             WARNING('No components passed the cuts -- no plot to be generated.')
-
         else:
+            INFO('Cuts successfully applied to list of components (%s entries).' % int(mask.sum()))
+        return counter
 
-            # Finalize the counter and delete our old reference to components
-            finalizeCounter(counter)
-            del components
-            INFO('Cuts successfully applied to list of components (%s entries).' % passedComponents)
+    # Define our main makePlots function
+    def makePlots(self, **kwargs):
 
-            self.__drawPlots(counter, **kwargs)
+        # Perform some argument checking
+        INFO('Peforming argument checking...')
+        try:
+            self.__checkArguments(**kwargs)
+        except PlotError as e:
+            ERROR(e.message)
+            STATUS('Finished with error.', False)
+            sys.exit(1)
+        INFO('Argument checking passed.')
+
+        counter = self.__makeCounter(self.__fetchTable(**kwargs), **kwargs)
+        if counter != {}:
+            drawPlots(counter, **kwargs)
+
+    # Define a function for generating the counters of many plots (each a kwargs dictionary as for makePlots(), see loadBatch())
+    # Each distinct listing (project/componentType/type/currentStage) is fetched once and shared by all of the plots which need it
+    # Return a list of (counter, kwargs) for the plots to draw, plots whose arguments do not check out or with no components are skipped
+    def makeCounters(self, plots):
+        jobs = []
+        tables = {}
+        for kwargs in plots:
+            INFO('Preparing plot: %s' % kwargs['savePath'])
+            try:
+                self.__checkArguments(**kwargs)
+            except PlotError as e:
+                ERROR(e.message + ' -- skipping.')
+                continue
+            key = (kwargs['project'], kwargs['componentType'], tuple(kwargs['type'] or []) or None, tuple(kwargs['currentStage'] or []) or None)
+            if key not in tables:
+                tables[key] = self.__fetchTable(**kwargs)
+            counter = self.__makeCounter(tables[key], **kwargs)
+            if counter != {}:
+                jobs.append((counter, kwargs))
+        return jobs
+
+    # Define a function for making many plots at once, drawing them over workers processes (1 := in this process)
+    # Return the save paths of the plots drawn
+    def makeBatch(self, plots, workers = None):
+        jobs = self.makeCounters(plots)
+        workers = max(1, min(workers if workers is not None else multiprocessing.cpu_count(), len(jobs)))
+        INFO('Drawing %s plot(s) over %s process(es)...' % (len(jobs), workers))
+        if workers == 1:
+            return [drawPlots(counter, **kwargs) for counter, kwargs in jobs]
+        pool = multiprocessing.Pool(workers)
+        try:
+            return pool.map(_drawJob, jobs)
+        finally:
+            pool.close()
+            pool.join()
 
 if __name__ == '__main__':
     
@@ -506,7 +417,7 @@ if __name__ == '__main__':
         # Define our required arguments
         required = parser.add_argument_group('required arguments')
         required.add_argument('-p', '--project', dest = 'project', type = str, choices = ['S', 'P', 'CM', 'CE'], default = 'S', help = 'project code for a component type')
-        required.add_argument('-c', '--componentType', dest = 'componentType', type = str, required = True, help = 'component type code')
+        required.add_argument('-c', '--componentType', dest = 'componentType', type = str, help = 'component type code (unless --batch is used)')
         required.add_argument('-S', '--savePath', dest = 'savePath', type = str, default = '{0}/ITkPDProdPlot_{1}.pdf'.format(os.getcwd(), startTime4SavePath), help = 'save path for the plot (choose suffix [\'.pdf\'|\'.png\'])')
 
         # Define an argparse type for converting str to bool
@@ -560,15 +471,26 @@ if __name__ == '__main__':
         optional.add_argument('-v', '--verbose', dest = 'verbose', action = 'store_true', help = 'enable detailed printout')
         optional.add_argument('--rrulewrapperFrequency', dest = 'rrulewrapperFrequency', type = str, choices = ['DAILY', 'MONTHLY', 'YEARLY'], default = 'MONTHLY', help = 'frequency for the intervals on the plot')
         optional.add_argument('--rrulewrapperInterval', dest = 'rrulewrapperInterval', type = int, default = 2, help = 'number of steps to take in frequency per major tick on the plot')
+        optional.add_argument('--binning', dest = 'binning', type = str, choices = sorted(BINNINGS), default = 'day', help = 'bin the component counts by day, week, or month')
+        optional.add_argument('--stageLog', dest = 'stageLog', type = str, default = os.getenv('ITK_DB_STAGE_LOG', None), help = 'SQLite log of the stage histories fetched by previous runs (default: ~/.itk_pdb/stage_log.sqlite)')
+        optional.add_argument('--snapshot', dest = 'snapshot', type = str, default = os.getenv('ITK_DB_SNAPSHOT', None), help = 'SQLite snapshot of the ITkPD to refresh (incrementally) and make the plots from (see snapshotStore.py)')
+        optional.add_argument('--offline', dest = 'offline', action = 'store_true', help = 'make the plots from --snapshot as it is, without connecting to the ITkPD')
         optional.add_argument('--includeTotal', dest = 'includeTotal', action = 'store_true', help = 'show the total number of component counts when --split != None')
         optional.add_argument('--saveJson', dest = 'saveJson', action = 'store_true', help = 'save the json associated the plot (same filename with suffix == \'.json\')')
+        optional.add_argument('-B', '--batch', dest = 'batch', type = str, help = 'YAML/JSON file of plots to make at once, sharing the listings they need (see loadBatch())')
+        optional.add_argument('-w', '--workers', dest = 'workers', type = int, default = None, help = 'number of processes drawing the plots of a batch (default: one per CPU)')
+        optional.add_argument('--stream', dest = 'stream', action = 'store_true', help = 'decode the component listing incrementally (flat memory for very large listings)')
 
         # Fetch our args and generate our kwargs dict
         args = parser.parse_args()
+        if args.batch is None and args.componentType is None:
+            parser.error('the following arguments are required: -c/--componentType (or -B/--batch)')
+        if args.offline and args.snapshot is None:
+            parser.error('--offline requires --snapshot (or ITK_DB_SNAPSHOT)')
         kwargs =    {   'startTime':                startTime,
                         'project':                  args.project.upper(),
                         'savePath':                 args.savePath,
-                        'componentType':            args.componentType.upper(),
+                        'componentType':            args.componentType.upper() if args.componentType != None else None,
                         'type':                     [arg.upper() for arg in args.type] if args.type != None else None,
                         'currentStage':             [arg.upper() for arg in args.currentStage] if args.currentStage != None else None,
                         'currentLocation':          [arg.upper() for arg in args.currentLocation] if args.currentLocation != None else None,
@@ -585,8 +507,13 @@ if __name__ == '__main__':
                         'split':                    args.split,
                         'rrulewrapperFrequency':    args.rrulewrapperFrequency,
                         'rrulewrapperInterval':     args.rrulewrapperInterval,
+                        'binning':                  args.binning,
+                        'stageLog':                 args.stageLog,
+                        'snapshot':                 args.snapshot,
+                        'offline':                  args.offline,
                         'includeTotal':             args.includeTotal,
-                        'saveJson':                 args.saveJson
+                        'saveJson':                 args.saveJson,
+                        'stream':                   args.stream
                     }
 
         print('')
@@ -594,9 +521,7 @@ if __name__ == '__main__':
 
         # Try to import matplotlib
         try:
-            global matplotlib
-            import matplotlib.pyplot as plt
-            from matplotlib.dates import DAILY, MONTHLY, YEARLY, DateFormatter, rrulewrapper, RRuleLocator
+            import matplotlib
         except ImportError:
             ERROR('Python module \'matplotlib\' is not installed.')
             INFO('To install, please type \'sudo apt-get install python-matplotlib\' for Python 2.')
@@ -604,10 +529,29 @@ if __name__ == '__main__':
             STATUS('Finished with error', False)
             sys.exit(1)
 
+        # Load our batch of plots (if any)
+        if args.batch is not None:
+            try:
+                plots = loadBatch(args.batch, startTime)
+            except (PlotError, IOError, ValueError) as e:
+                ERROR('Could not load batch file %s: %s' % (args.batch, e))
+                STATUS('Finished with error.', False)
+                sys.exit(1)
+            INFO('Loaded %s plot(s) from: %s' % (len(plots), args.batch))
+            # The snapshot given on the command line applies to every plot of the batch
+            for plot in plots:
+                if args.snapshot is not None:
+                    plot['snapshot'] = args.snapshot
+                plot['offline'] = plot['offline'] or args.offline
+
         # Generate our PlotMaker object and make our plots
         plotMaker = PlotMaker(args.verbose)
-        plotMaker.authenticate()
-        plotMaker = plotMaker.makePlots(**kwargs)
+        if not args.offline:
+            plotMaker.authenticate()
+        if args.batch is not None:
+            plotMaker.makeBatch(plots, workers = args.workers)
+        else:
+            plotMaker.makePlots(**kwargs)
         STATUS('Finished successfully.', True)
         sys.exit(0)
 
@@ -3,8 +3,10 @@
 # Created: 2018/09/06, Updated: 2019/01/28
 # Written by Matthew Basso
 
-import sys, datetime
-from itk_pdb.databaseUtilities import checkITkDBAuth, commands as dbCommands, Colours, INFO, PROMPT, WARNING, ERROR, STATUS
+import sys, os, argparse, datetime
+from itk_pdb.componentTable import ComponentTable
+from itk_pdb.snapshotStore import SnapshotStore
+from itk_pdb.databaseUtilities import checkITkDBAuth, commands as dbCommands, getComponents, Colours, INFO, PROMPT, WARNING, ERROR, STATUS
 
 # Fix the input (python3) versus raw_input (python2) issue
 # See: https://stackoverflow.com/questions/954834/how-do-i-use-raw-input-in-python-3
@@ -22,10 +24,13 @@ class ContentSummaryInferface(object):
 
     # _institutions will contain the list of institutions returned by the DB, _projects contains a list of all possible projects
     # and _always_print will print all available options at each prompt
-    def __init__(self):
+    # _snapshot is the path of a local snapshot of the DB (see snapshotStore.SnapshotStore) to read the components and their stages from,
+    # refreshed incrementally for each summary, or None to fetch them all from the DB every time
+    def __init__(self, snapshot = None):
         self._institutions = []
         self._projects = []
         self._always_print = False
+        self._snapshot = snapshot
 
     # Update our list of institutions if it's empty
     def __startUp(self):
@@ -344,68 +349,38 @@ class ContentSummaryInferface(object):
                 print('')
                 INFO('Getting count information from the database.')
 
-                # Check if the component has stages
+                # Get all of the components associated with the project and component type as a columnar table, and filter them by whether they
+                # match one of the selected institutions and one of the selected types (components without an institution or type never match)
+                # With a snapshot, only the components which changed since its last refresh are fetched in full (with their stages)
                 stages_DETAILED = component['stages']
+                if self._snapshot != None:
+                    snapshot = SnapshotStore(self._snapshot)
+                    INFO('Refreshing the snapshot: {0}'.format(snapshot.path))
+                    refresh = snapshot.refresh(dbCommands['listComponents'].iterate(project = project, componentType = component_type), project, component_type,
+                                                getComponents = getComponents if stages_DETAILED != None else None)
+                    INFO('Snapshot refreshed ({0} component(s) written, {1} removed, {2} fetched).'.format(refresh['written'], refresh['removed'], refresh['fetched']))
+                    components = snapshot.table(project, component_type)
+                else:
+                    components = ComponentTable.fromComponents(dbCommands['listComponents'].iterate(project = project, componentType = component_type))
+                mask = components.isIn('institution', institutions) & components.isIn('type', types)
+
+                # Check if the component has stages
                 if stages_DETAILED == None:
 
-                    try:
-
-                        # Get all of the components associated with the project and component type and filter them by the creation time stamp (cts)
-                        # (should be between lower and upper dates), whether they match one of the selected institutions, and whether they match one of the
-                        # selected types
-                        components = list(filter(lambda item: (item['institution']['code'] in institutions and item['type']['code'] in types 
-                                                    and date_lower <= item['cts'][0:10].split('-') and item['cts'][0:10].split('-') <= date_upper), 
-                                                    dbCommands['listComponents'].run(project = project, componentType = component_type)))
-
-                    # Some components seem to not have insitution or more likely a type associated with them so you get a TypeError
-                    # The below will sift through each individual component and skip it if we get a TypeError
-                    except TypeError:
-
-                        component_list_db =  dbCommands['listComponents'].run(project = project, componentType = component_type)
-                        components = []
-                        for item in component_list_db:
-                            try:
-                                if (item['institution']['code'] in institutions and item['type']['code'] in types
-                                    and date_lower <= item['cts'][0:10].split('-') and item['cts'][0:10].split('-') <= date_upper):
-                                    components.append(item)
-                                else:
-                                    pass
-                            except TypeError:
-                                continue
+                    # Also filter by the creation time stamp (cts), which should be between lower and upper dates
+                    mask &= components.dateMask('-'.join(date_lower), '-'.join(date_upper))
 
                     # Generate our dictionary of counts for each institution
+                    counts = components.groupCounts('institution', mask)
                     component_counts = {}
-                    for institution in insitutions:
-                        component_counts[institution]['TOTAL'] = 0
-                    component_counts['TOTAL']['TOTAL'] = 0
-
-                    # Increment our totals for each institution and overall by checking each of our filtered components
-                    for component in components:
-                        component_counts[component['institution']['code']]['TOTAL'] += 1
-                        component_counts['TOTAL']['TOTAL'] += 1
+                    for institution in institutions:
+                        component_counts[institution] = {'TOTAL': counts.get(institution, 0)}
+                    component_counts['TOTAL'] = {'TOTAL': int(mask.sum())}
 
                 else:
 
-                    try:
-
-                        # We can't filter by cts as we don't know what the most recent component stage in the specified date range
-                        components = list(filter(lambda item: item['institution']['code'] in institutions and item['type']['code'] in types, 
-                                                    dbCommands['listComponents'].run(project = project, componentType = component_type)))
-
-                    # Some components seem to not have insitution or more likely a type associated with them so you get a TypeError
-                    # The below will sift through each individual component and skip it if we get a TypeError
-                    except TypeError:
-
-                        component_list_db =  dbCommands['listComponents'].run(project = project, componentType = component_type)
-                        components = []
-                        for item in component_list_db:
-                            try:
-                                if item['institution']['code'] in institutions and item['type']['code'] in types:
-                                    components.append(item)
-                                else:
-                                    pass
-                            except TypeError:
-                                continue
+                    # We can't filter by cts as we don't know what the most recent component stage in the specified date range
+                    institutions_by_code = dict((row['code'], row['institution']) for row in components.rows(mask, columns = ['code', 'institution']))
 
                     # Get our list of stage codes
                     stages = [stage['code'] for stage in stages_DETAILED]
@@ -422,11 +397,17 @@ class ContentSummaryInferface(object):
                         component_counts['TOTAL'][stage] = 0
                     component_counts['TOTAL']['TOTAL'] = 0
 
-                    # Iterate over each filtered component
-                    for component in components:
-
-                        # Fetch the component from the database
-                        component_DETAILED = dbCommands['getComponent'].run(component = component['code'])
+                    # Fetch each filtered component from the database (concurrently, as they complete) and iterate over them
+                    # With a snapshot, their stages are read from it instead
+                    if self._snapshot != None:
+                        histories = dict((code, {'stages': []}) for code in institutions_by_code)
+                        for code, stage, dateTime in snapshot.events(histories.keys()):
+                            histories[code]['stages'].append({'code': stage, 'dateTime': dateTime})
+                        detailed = histories.items()
+                    else:
+                        detailed = getComponents(list(institutions_by_code.keys()))
+                    for code, component_DETAILED in detailed:
+                        institution = institutions_by_code[code]
 
                         # Initialize date (so dateTime for a stage should certainly be <=)
                         date = ['0000', '00', '00']
@@ -451,16 +432,19 @@ class ContentSummaryInferface(object):
                             continue
 
                         # Increment our totals for each stage at each institution and overall
-                        component_counts[component['institution']['code']][stage_code] += 1
-                        component_counts[component['institution']['code']]['TOTAL'] += 1
+                        component_counts[institution][stage_code] += 1
+                        component_counts[institution]['TOTAL'] += 1
                         component_counts['TOTAL'][stage_code] += 1
                         component_counts['TOTAL']['TOTAL'] += 1
 
+                if self._snapshot != None:
+                    snapshot.close()
+
                 INFO('Printing summary:\n')
 
                 # Order our stages according to the DB (so {'1': <first stage>, '2': <second stage>, etc.})
                 stage_order = {}
-                for stage in stages_DETAILED:
+                for stage in stages_DETAILED or []:
                     stage_order[stage['order']] = stage['code']
 
                 # Print the count info, using alphabetically order for institution codes
@@ -497,11 +481,16 @@ if __name__ == '__main__':
 
     try:
 
+        # Define our parser
+        parser = argparse.ArgumentParser(description = 'Get a summary of the component counts in the ITkPD', formatter_class = argparse.ArgumentDefaultsHelpFormatter)
+        parser.add_argument('--snapshot', dest = 'snapshot', type = str, default = os.getenv('ITK_DB_SNAPSHOT', None), help = 'SQLite snapshot of the ITkPD to refresh (incrementally) and count the components from')
+        args = parser.parse_args()
+
         # Check if the ITk auth token exists as an environmental variable
         checkITkDBAuth()
 
         # Open summary interface and run it
-        interface = ContentSummaryInferface()
+        interface = ContentSummaryInferface(snapshot = args.snapshot)
         interface.openInterface()
 
     # In the case of a keyboard interrupt, quit with error
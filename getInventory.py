@@ -4,6 +4,8 @@
 # Written by Matthew Basso
 
 import argparse, sys, os, json, time
+from itk_pdb.componentTable import ComponentTable
+from itk_pdb.snapshotStore import SnapshotStore
 from itk_pdb.databaseUtilities import checkITkDBAuth, commands as dbCommands, INFO, PROMPT, WARNING, ERROR, STATUS, Colours
 from itk_pdb.dbAccess import dbAccessError
 
@@ -26,6 +28,9 @@ class Inventory(object):
         self.savePath = args.savePath
         self.useCurrentLocation = args.useCurrentLocation
         self.includeTrashed = args.includeTrashed
+        self.stream = getattr(args, 'stream', False)
+        self.snapshot = getattr(args, 'snapshot', None)
+        self.offline = getattr(args, 'offline', False)
 
     # Save a dictionary to json
     def __save(self, data):
@@ -33,6 +38,23 @@ class Inventory(object):
         with open(self.savePath, 'w') as file:
             json.dump(data, file)
 
+    # Read the components of our component type(s) from the snapshot as a ComponentTable, refreshing it first unless offline
+    # Only the components which changed since the last refresh are written to the snapshot (see snapshotStore.SnapshotStore)
+    def __snapshotTable(self):
+        snapshot = SnapshotStore(self.snapshot)
+        for componentType in self.componentType:
+            if self.offline:
+                if snapshot.refreshed(self.project, componentType) is None:
+                    WARNING('Component type \'{0}\' was never refreshed in the snapshot: {1}'.format(componentType, snapshot.path))
+                continue
+            INFO('Refreshing the snapshot of component type \'{0}\': {1}'.format(componentType, snapshot.path))
+            refresh = snapshot.refresh(dbCommands['listComponents'].iterate(project = self.project, componentType = componentType, stream = self.stream),
+                                        self.project, componentType)
+            INFO('Snapshot refreshed ({0} component(s) written, {1} removed).'.format(refresh['written'], refresh['removed']))
+        components = snapshot.table(self.project, self.componentType)
+        snapshot.close()
+        return components
+
     # Print a list of names and codes for a dictionary obtained from the ITkPD
     def __printNamesAndCodes(self, list):
         print('    {0}{1}{2:<60} {3:<20}{4}'.format(Colours.BOLD, Colours.WHITE, 'Name:', 'Code:', Colours.ENDC))
@@ -72,17 +94,23 @@ class Inventory(object):
         INFO('Fetching an inventory list associated with project code \'{0}\', component type(s) [\'{1}\'], and institution(s) [\'{2}\'] from the ITkPD...'.format(
                 self.project, '\', \''.join(self.componentType), '\', \''.join(self.institution)))
         timestamp = time.strftime('%Y/%m/%d-%H:%M:%S')
-        components = dbCommands['listComponents'].run(project = 'S', componentType = self.componentType)
+        # The components are streamed in page by page, so the full list is never held in memory
+        # With --stream, each page is also decoded incrementally as it arrives, so not even a full page is held in memory
+        # They are converted into a columnar table as they arrive, so that the filtering and grouping below are vectorised
+        # With --snapshot, they are read from the local snapshot instead
+        if self.snapshot != None:
+            components = self.__snapshotTable()
+        else:
+            components = ComponentTable.fromComponents(dbCommands['listComponents'].iterate(project = 'S', componentType = self.componentType, stream = self.stream))
 
         # Filter the components by institution (or by current location)
         if self.useCurrentLocation:
             locationKey = 'currentLocation'
         else:
             locationKey = 'institution'
-        if self.includeTrashed:
-            filterFunction = lambda component: component[locationKey]['code'] in self.institution
-        else:
-            filterFunction = lambda component: component[locationKey]['code'] in self.institution and not component['trashed']
+        mask = components.isIn(locationKey, self.institution)
+        if not self.includeTrashed:
+            mask &= components.column('trashed') != 1
 
         # Preallocate our inventory dictionary
         inventory = {}
@@ -93,21 +121,15 @@ class Inventory(object):
 
         # Sort through our list of components and filter our the desired keys
         keys = ['dummy', 'currentGrade', 'reworked', 'trashed', 'assembled', 'qaPassed', 'qaState']
+        # Components missing any of the codes we need are skipped (as are those without a location at all)
         KeyErrorCounter = 0
-        TypeErrorCounter = 0
-        for component in components:
-            try:
-                if filterFunction(component):
-                    data = dict((key, component[key]) for key in keys)
-                    data['type'] = component['type']['code']
-                    data['currentStage'] = component['currentStage']['code']
-                    data['code'] = component['serialNumber'] if component['serialNumber'] != None else component['code']
-                    inventory[component[locationKey]['code']][component['componentType']['code']].append(data)
-                else:
-                    pass
-            except TypeError as error:
-                print('Encountered TypeError %s for component \'%s\' -- skipping.' % (error, component['code']))
-                TypeErrorCounter += 1                
+        required = components.isSet(locationKey) & components.isSet('componentType') & components.isSet('type') & components.isSet('currentStage')
+        TypeErrorCounter = int((~required & (mask | ~components.isSet(locationKey))).sum())
+        for data in components.rows(mask & required, columns = keys + ['type', 'currentStage', 'code', 'serialNumber', 'componentType', locationKey]):
+            location, componentType, serialNumber = data.pop(locationKey), data.pop('componentType'), data.pop('serialNumber')
+            if serialNumber != None:
+                data['code'] = serialNumber
+            inventory[location][componentType].append(data)
 
         if KeyErrorCounter > 1:
             WARNING('%s components skipped due to key errors.' % KeyErrorCounter)
@@ -270,9 +292,14 @@ if __name__ == '__main__':
         optional.add_argument('-s', '--savePath', dest = 'savePath', type = str, help = 'save path for the resulting content (suffix with .json)')
         optional.add_argument('--useCurrentLocation', dest = 'useCurrentLocation', action = 'store_true', help = 'filter by current location when using \'listInventory\'')
         optional.add_argument('--includeTrashed', dest = 'includeTrashed', action = 'store_true', help = 'include trashed components when using \'listInventory\'')
+        optional.add_argument('--stream', dest = 'stream', action = 'store_true', help = 'decode the component listing incrementally (flat memory for very large listings)')
+        optional.add_argument('--snapshot', dest = 'snapshot', type = str, default = os.getenv('ITK_DB_SNAPSHOT', None), help = 'SQLite snapshot of the ITkPD to refresh (incrementally) and read the inventory from when using \'listInventory\'')
+        optional.add_argument('--offline', dest = 'offline', action = 'store_true', help = 'read the inventory from --snapshot as it is, without connecting to the ITkPD')
 
         # Fetch our args
         args = parser.parse_args()
+        if args.offline and args.snapshot is None:
+            parser.error('--offline requires --snapshot (or ITK_DB_SNAPSHOT)')
 
         # Check if our savepath already exists, if the parent directory doesn't exist, and if suffix is not .json
         # Raise an error and quit if any of these are true
@@ -0,0 +1,533 @@
+#!/usr/bin/env python
+# ITSDAQParser.py -- a streaming, single pass parser for ITSDAQ results summary files
+# The file is consumed as a line iterator: every '%' header line dispatches to the parser of its block, which reads the lines of the
+# block from the same iterator (only as far as the block reaches), so memory is bounded by the largest block rather than the file
+# Tests are emitted as soon as their block closes, each line is read once and split at most once, and tables are converted by column
+# NOTE: like ResultsFile.getTests() before it, this relies on the (hardcoded) layout of most results summary files
+
+import os, re, multiprocessing
+from functools import partial
+from itertools import islice
+from pprint import PrettyPrinter
+pp = PrettyPrinter(indent = 1, width = 200)
+
+# NumPy is only needed for the array mode (see gainArrays.py)
+try:
+    from itk_pdb.gainArrays import GainResults
+except ImportError:
+    GainResults = None
+
+# Value of Loop B rows which are missing or nan
+MISSING = '-1000000'
+TOO_MANY_DEFECTS = 'Too many defects in this chip!'
+
+NEW_TEST = re.compile(br'^%NewTest', re.MULTILINE)
+
+# Results keys (in the order in which they are read from the summary file) of the gain tests
+THREE_POINT_GAIN_KEYS   = ['P0', 'P1', 'VT50', 'VT50_RMS', 'GAIN', 'GAIN_RMS', 'OFFSET', 'OFFSET_RMS', 'OUTNSE', 'INNSE', 'INNSE_RMS']
+RESPONSE_CURVE_KEYS     = ['P0', 'P1', 'P2', 'VT50', 'VT50_RMS', 'GAIN', 'GAIN_RMS', 'OFFSET', 'OFFSET_RMS', 'OUTNSE', 'INNSE', 'INNSE_RMS']
+
+def _yesNo(value):
+    return True if value == 'YES' else (False if value == 'NO' else None)
+
+# 'DD.MM.YYYY' -> 'YYYYMMDD' and 'HH:MM:SS' -> 'HHMMSS', as used in the names of the files produced by a test
+def _dateStamp(test):
+    return ''.join(test['JSON']['date'].split('.')[::-1])
+
+def _timeStamp(test):
+    return ''.join(test['JSON']['properties']['TIME'].split(':'))
+
+# The next n lines of a file (StopIteration if the file ends before)
+def _take(lines, n):
+    block = list(islice(lines, n))
+    if len(block) < n:
+        raise StopIteration
+    return block
+
+# Pairs of (identifier line, data line), up to (and including) a line with only '#'
+def _pairs(lines):
+    pairs = []
+    line = next(lines)
+    while line != '#\n':
+        pairs.append((line, next(lines)))
+        line = next(lines)
+    return pairs
+
+# Define our parser
+# Iterate over ResultsParser(lines) to get the tests (dictionaries, as in ResultsFile.tests) in the order in which they appear
+# arrays := if True, the results of the 3PG and response curve tests are parsed into a gainArrays.GainResults (rather than lists)
+class ResultsParser(object):
+
+    def __init__(self, lines, debug = False, arrays = False):
+        if arrays and GainResults is None:
+            raise ImportError('The array mode of ResultsParser requires numpy')
+        self.lines = iter(lines)
+        self.debug = debug
+        self.arrays = arrays
+        # The test whose block is open (from its %NewTest until its results have been read)
+        self.test = None
+        # The most recent SCAN_INFO, passed on to the type = -1 trim range scan (which has none of its own)
+        self.scanInfo = None
+        # Header tokens in the order in which they are checked against a '%' line
+        self.handlers = [   ('%NewTest', self.__newTest), ('%DAQ_INFO', self.__daqInfo), ('%DCS_INFO', self.__dcsInfo),
+                            ('%SCAN_INFO', self.__scanInfo), ('%StrobeDelay', self.__strobeDelay), ('%ThreePointGain', self.__threePointGain),
+                            ('%ResponseCurve', self.__responseCurve), ('%Trim', self.__trim), ('%NO', self.__noiseOccupancy)   ]
+
+    # The handlers read the lines of their block (following the header) from self.lines, in which block[k] is the line k lines below the header
+    def __iter__(self):
+        lines = self.lines
+        for line in lines:
+            if line[:1] != '%':
+                continue
+            for token, handler in self.handlers:
+                if token in line:
+                    if self.debug:
+                        print('ResultsParser -- DEBUG : adding %s' % token[1:])
+                    try:
+                        test = handler([line], lines)
+                    except StopIteration:
+                        raise IndexError('Unexpected end of results file in %s block' % token)
+                    if test is not None:
+                        if self.debug:
+                            print('ResultsParser -- DEBUG : the following test has been parsed:')
+                            print('')
+                            pp.pprint(test)
+                            print('')
+                        yield test
+                    break
+        # A test left open at the end of the file is kept (as getTests() always did)
+        if self.test is not None:
+            yield self.__close()
+
+    def __current(self):
+        if self.test is None:
+            raise IndexError('block does not belong to a %NewTest')
+        return self.test
+
+    def __close(self):
+        test, self.test = self.test, None
+        return test
+
+    ######################
+    # Parse general info #
+    ######################
+    def __newTest(self, block, lines):
+
+        # NOTE: a %NewTest with no results associated with it is purged once the next one begins
+        if self.test is not None and self.debug:
+            print('ResultsParser -- DEBUG : previous NewTest yielded empty test[\'JSON\'][\'results\'] -- PURGING!')
+
+        # Read serial number, user, location, run number, date, passed, and problem
+        # Properties which are needed for the JSON input to the database are thrown in extra_data
+        w = block + _take(lines, 8)
+        self.test = test = {'JSON': {'properties': {}, 'results': {}}, 'extra_data': {'NewTest_EXTRA': {}, 'DAQ_INFO_EXTRA': {}, 'DCS_INFO': {}, 'SCAN_INFO': {},
+                                'identifiers': {}}, 'files_to_upload': {}, 'files_to_upload_FULL': {}}
+        test['JSON']['properties']['SERIAL_NUMBER'] = w[2][17:-1]
+        test['JSON'].update({
+            'runNumber':        w[5][17:-1],
+            'date':             w[6][17:-1].replace('/', '.'),
+            'passed':           _yesNo(w[7][17:-1]),
+            'problems':         _yesNo(w[8][17:-1])
+        })
+        test['extra_data']['NewTest_EXTRA'].update({
+            'user':             w[3][17:-1],
+            'location':         w[4][17:-1]
+        })
+
+    ############################
+    # Parse DAQ info all tests #
+    ############################
+    def __daqInfo(self, block, lines):
+        test = self.__current()
+        w = block + _take(lines, 9)
+
+        # Read host, version, DUT, and time
+        test['JSON']['properties'].update({
+            'ITSDAQ_VERSION':   w[5][1:-2],
+            'TIME':             w[9][1:-2]
+        })
+        test['extra_data']['DAQ_INFO_EXTRA'].update({
+            'host':             w[3][1:-2],
+            'DUT':              w[7][1:-2]
+        })
+
+    ##################
+    # Parse DCS info #
+    ##################
+    def __dcsInfo(self, block, lines):
+        test = self.__current()
+        w = block + _take(lines, 11)
+
+        # Read T0, T1, VDET, IDET, VCC, ICC, VDD, and IDD, and time_powered (all thrown into extra_data)
+        T, DET, CC, DD = w[3].split(), w[5].split(), w[7].split(), w[9].split()
+        test['extra_data']['DCS_INFO'].update({
+            'T0':               float(T[0]),
+            'T1':               float(T[1]),
+            'VDET':             float(DET[0]),
+            'IDET':             float(DET[1]),
+            'VCC':              float(CC[0]),
+            'ICC':              float(CC[1]),
+            'VDD':              float(DD[0]),
+            'IDD':              float(DD[1]),
+            'time_powered':     w[11][:-2]
+        })
+
+    ##################################################################
+    # Parse scan info (only for 3PG, response curve, and trim range) #
+    ##################################################################
+    def __scanInfo(self, block, lines):
+        test = self.__current()
+
+        # Read point_type, N_points, and points (all thrown into extra data)
+        # The points start 7 lines below the header and can be distributed over several lines (up to the next '#' line) or have .'s included
+        w = block + _take(lines, 6)
+        points = []
+        line = next(lines)
+        while '#' not in line:
+            points += [float(point) for point in line.split() if point != '.']
+            line = next(lines)
+        test['extra_data']['SCAN_INFO'].update({
+            'point_type':       w[3][1:-2],
+            'N_points':         int(w[5]),
+            'points':           points
+        })
+
+        # Save the scan info for the type = -1 trim range scan
+        self.scanInfo = test['extra_data']['SCAN_INFO']
+
+    ###################################
+    # Parse StrobeDelay specific info #
+    ###################################
+    def __strobeDelay(self, block, lines):
+        test = self.__current()
+        test['JSON']['testType'] = 'STROBE_DELAY'
+        w = block + _take(lines, 10)
+
+        # Read the strobe delay fraction, 11 or more lines below the header (skipping any defects listed before it)
+        line = next(lines)
+        while 'Strobe Delay Fraction' not in line:
+            line = next(lines)
+        test['JSON']['properties']['FRACTION'] = float(line.split()[5])
+
+        # Read stream delays and identifiers (excluding delays = -1 as they indicate missing ABCs)
+        delays_stream0 = [int(delay) for delay in w[4].split()]
+        delays_stream1 = [int(delay) for delay in w[7].split()]
+        identifiers_stream0 = w[3].split()[1:]
+        identifiers_stream1 = w[6].split()[1:]
+        test['JSON']['results'].update({
+            'STREAM0_DELAYS':   [delay for delay in delays_stream0 if delay != -1],
+            'STREAM1_DELAYS':   [delay for delay in delays_stream1 if delay != -1]
+        })
+        test['extra_data']['identifiers'].update({
+            'stream0':          [identifiers_stream0[k] for k in range(len(identifiers_stream0)) if delays_stream0[k] != -1],
+            'stream1':          [identifiers_stream1[k] for k in range(len(identifiers_stream1)) if delays_stream1[k] != -1]
+        })
+
+        # Include the filename(s) to be uploaded
+        serial_number = test['JSON']['properties']['SERIAL_NUMBER']
+        test['files_to_upload']['strobe_delay_filename'] = serial_number + '_StrobeDelayPlot_' + _dateStamp(test) + '_' + _timeStamp(test) + '.pdf'
+        test['files_to_upload']['det_filename'] = serial_number + '.det'
+        return self.__close()
+
+    ######################################
+    # Parse ThreePointGain specific info #
+    ######################################
+    def __threePointGain(self, block, lines):
+        test = self.__current()
+        test['JSON']['testType'] = 'THREE_POINT_GAIN'
+
+        # We fetched the midpoint earlier (the second value in points in SCAN_INFO)
+        test['JSON']['properties']['MIDPOINT'] = test['extra_data']['SCAN_INFO']['points'][1]
+        self.__readGain(lines, test, THREE_POINT_GAIN_KEYS, 3, 'three_point_gain_filename')
+        return self.__close()
+
+    #####################################
+    # Parse ResponseCurve specific info #
+    #####################################
+    def __responseCurve(self, block, lines):
+        test = self.__current()
+        test['JSON']['testType'] = 'RESPONSE_CURVE'
+
+        # CHECK ME: We fetched the input charge earlier (the sixth value in points in SCAN_INFO)
+        test['JSON']['properties']['INPUT_CHARGE'] = test['extra_data']['SCAN_INFO']['points'][5]
+        self.__readGain(lines, test, RESPONSE_CURVE_KEYS, None, 'response_curve_filename')
+        return self.__close()
+
+    # Read the Loop A/Loop B tables of a gain test (3PG or response curve)
+    # keys := results keys (without the 'STREAM0/1_' prefix), loopA_end := end of the slice of Loop A columns we keep (None := all of them)
+    def __readGain(self, lines, test, keys, loopA_end, filename_key):
+
+        # Loop A: pairs of identifier ('#M16') and data lines, starting 4 lines below the header, up to a line with only '#'
+        _take(lines, 3)
+        data_loopA = []
+        identifiers = []
+        for identifier, data in _pairs(lines):
+            data_loopA.append(data.split()[1:loopA_end])
+            identifiers.append(identifier[1:-1])
+        number_of_chips = len(identifiers) // 2
+
+        # Loop B: every other line from 4 lines below the end of Loop A (i.e., each line after a chip identifier), stream 0 chips first
+        # nan's go to -1000000 and so do the 'Too many defects in this chip!' rows (should be recognized as an error)
+        rows = []
+        loopB = _take(lines, 3 + 4 * number_of_chips - 1)[3::2] if number_of_chips > 0 else []
+        if self.arrays:
+            # The nan's are kept (and masked by GainResults) instead
+            for k, line in enumerate(loopB):
+                row = data_loopA[k] + (9 * ['nan'] if TOO_MANY_DEFECTS in line else line.split())
+                if len(row) < len(keys):
+                    raise IndexError('Expected %s values for chip \'%s\', got %s' % (len(keys), identifiers[k], len(row)))
+                rows.append(row[:len(keys)])
+            results = GainResults.fromRows(keys, rows, identifiers[:2 * number_of_chips])
+        else:
+            for k, line in enumerate(loopB):
+                if TOO_MANY_DEFECTS in line:
+                    row = data_loopA[k] + 9 * [MISSING]
+                elif 'nan' in line:
+                    row = data_loopA[k] + [datum if 'nan' not in datum else MISSING for datum in line.split()]
+                else:
+                    row = data_loopA[k] + line.split()
+                if len(row) < len(keys):
+                    raise IndexError('Expected %s values for chip \'%s\', got %s' % (len(keys), identifiers[k], len(row)))
+                rows.append(row)
+
+            # Convert the table one column at a time ('STREAM0/1_INNSE' and 'STREAM0/1_INNSE_RMS' look like integers?)
+            results = {}
+            for stream in range(2):
+                columns = list(zip(*rows[stream * number_of_chips:(stream + 1) * number_of_chips])) or [() for key in keys]
+                for key, column in zip(keys, columns):
+                    results['STREAM%s_%s' % (stream, key)] = list(map(int if key in ['INNSE', 'INNSE_RMS'] else float, column))
+
+        # Update results, identifiers, and filename(s)
+        test['JSON']['results'] = results
+        test['extra_data']['identifiers'].update({'stream0': identifiers[:number_of_chips], 'stream1': identifiers[number_of_chips:]})
+        test['files_to_upload'][filename_key] = test['JSON']['properties']['SERIAL_NUMBER'] + '_RCPlot_' + _dateStamp(test) + '_' + _timeStamp(test) + '.pdf'
+
+    ############################
+    # Parse Trim specific info #
+    ############################
+    def __trim(self, block, lines):
+        test = self.__current()
+
+        # We only want the last trim range scan of a given set (type = -1), the others are dropped
+        w = block + _take(lines, 3)
+        if int(w[3].split()[1]) != -1:
+            self.test = None
+            return None
+        test['JSON']['testType'] = 'TRIM_RANGE'
+
+        # Scan info must be passed to the type = -1 scan as it does not have scan info associated with its %NewTest
+        test['extra_data']['SCAN_INFO'].update(self.scanInfo or {})
+
+        # Pairs of channel identifier ('#Ch16') and data lines, starting 7 lines below the header, up to a line with only '#'
+        _take(lines, 3)
+        data = []
+        identifiers = []
+        for identifier, row in _pairs(lines):
+            data.append(row.split()[0:2])
+            identifiers.append(identifier[1:-1])
+        number_of_channels = len(identifiers) // 2
+
+        # Sort through the elements of data and append them appropriately to results
+        results = {'STREAM0_RANGE': [], 'STREAM0_TARGET': [], 'STREAM1_RANGE': [], 'STREAM1_TARGET': []}
+        for ii in range(number_of_channels):
+            results['STREAM0_RANGE'].append(int(data[ii][0]))
+            results['STREAM0_TARGET'].append(float(data[ii][1]))
+            results['STREAM1_RANGE'].append(int(data[ii+number_of_channels][0]))
+            results['STREAM1_TARGET'].append(float(data[ii+number_of_channels][1]))
+
+        # Update results, identifiers, and filename(s)
+        test['JSON']['results'] = results
+        test['extra_data']['identifiers'].update({'stream0': identifiers[:number_of_channels], 'stream1': identifiers[number_of_channels:]})
+        serial_number = test['JSON']['properties']['SERIAL_NUMBER']
+        test['files_to_upload']['trim_filename'] = serial_number + '_tr-1_' + _dateStamp(test) + '.trim'
+        test['files_to_upload']['mask_filename'] = serial_number + '_tr-1_' + _dateStamp(test) + '.mask'
+        return self.__close()
+
+    #######################################
+    # Parse noise occupancy specific info #
+    #######################################
+    def __noiseOccupancy(self, block, lines):
+        test = self.__current()
+        test['JSON']['testType'] = 'NOISE_OCCUPANCY'
+
+        # Pairs of chip identifier ('#M16') and data lines, starting 3 lines below the header, up to a line with only '#'
+        # Rows of all 0's are left out, otherwise we keep the last element in the row (EstENC)
+        _take(lines, 2)
+        data = []
+        identifiers = []
+        for identifier, row in _pairs(lines):
+            row = row.split()
+            if [float(datum) for datum in row] != [0, 0, 0, 0]:
+                data.append(int(MISSING) if 'nan' in row[3] else int(row[3]))
+                identifiers.append(identifier[1:-1])
+        number_of_chips = len(data) // 2
+
+        # Update results, identifiers, and filename(s)
+        test['JSON']['results'].update({'STREAM0_ESTENC':   data[:number_of_chips], 'STREAM1_ESTENC':   data[number_of_chips:]})
+        test['extra_data']['identifiers'].update({'stream0': identifiers[:number_of_chips], 'stream1': identifiers[number_of_chips:]})
+        test['files_to_upload']['no_filename'] = test['JSON']['properties']['SERIAL_NUMBER'] + '_NoScurve_' + _dateStamp(test) + '_' + _timeStamp(test) + '.pdf'
+        return self.__close()
+
+# Generate the tests in a results summary file, one at a time
+def iterTests(results_file_path, debug = False, arrays = False):
+    with open(results_file_path, 'r') as lines:
+        for test in ResultsParser(lines, debug = debug, arrays = arrays):
+            yield test
+
+# A FullTest is a sequence of 7 tests whose run numbers ('<run>-<scan>') share a run and are 41 scans apart
+# Return the (lower, upper) indices of the last FullTest in tests, or None
+# start := index of the first test which may begin a FullTest (e.g., len(old_tests) - 6 when tests were appended to old_tests)
+def findFullTest(tests, start = 0):
+    full_test = None
+    for i in range(max(0, start), len(tests) - 6):
+        lower, upper = tests[i]['JSON']['runNumber'].split('-'), tests[i+6]['JSON']['runNumber'].split('-')
+        if lower[0] == upper[0] and int(upper[1]) - int(lower[1]) == 41:
+            full_test = (i, i + 6)
+    return full_test
+
+# Define the tail of a results summary file, which ITSDAQ keeps appending %NewTest blocks to
+# offset := byte offset of the first test which has not been read yet (always the start of a %NewTest line, or 0)
+# Each read() parses from offset and moves it past the tests which are complete (i.e., followed by another %NewTest), so that a file
+# is never parsed twice over; the last test of the file (which may still be being written) is left pending, see peek()
+# skipErrors := skip the blocks which cannot be parsed (recording their exceptions in errors) rather than raising, e.g., to keep watching
+# a file (see resultsWatcher.ResultsWatcher); otherwise a malformed block raises, as when the whole file is parsed
+class ResultsTail(object):
+
+    def __init__(self, path, offset = 0, debug = False, arrays = False, skipErrors = False):
+        self.path = path
+        self.offset = offset
+        self.debug = debug
+        self.arrays = arrays
+        self.skipErrors = skipErrors
+        # State carried over from one read to the next (the SCAN_INFO passed on to a type = -1 trim range scan)
+        self.scanInfo = None
+        self.pending = False
+        # Exceptions raised by the blocks (from one %NewTest to the next) which could not be parsed, and were skipped (if skipErrors)
+        self.errors = []
+
+    # Scan the file from offset, one line at a time, returning (byte offset of the last %NewTest line, byte offset of its end, whether
+    # anything but whitespace follows offset), None if it cannot be read
+    def __scan(self):
+        try:
+            with open(self.path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size < self.offset:
+                    # The file was truncated or replaced, start over
+                    self.offset = 0
+                    self.scanInfo = None
+                f.seek(self.offset)
+                position, last, content = self.offset, None, False
+                for line in f:
+                    if NEW_TEST.match(line):
+                        last = position
+                    content = content or line.strip() != b''
+                    position += len(line)
+                return last, position, content
+        except (IOError, OSError):
+            return None
+
+    # Generate the (decoded) lines of the file from offset up to the byte offset end (None := the end of the file), read a buffer at a time
+    def __lines(self, end = None):
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            position = self.offset
+            for line in f:
+                if end is not None and position + len(line) > end:
+                    line = line[:end - position]
+                position += len(line)
+                for text in line.decode('utf-8', 'replace').replace('\r\n', '\n').splitlines(True):
+                    yield text
+                if end is not None and position >= end:
+                    break
+
+    def __parse(self, lines):
+        parser = ResultsParser(lines, debug = self.debug, arrays = self.arrays)
+        parser.scanInfo = self.scanInfo
+        return list(parser), parser.scanInfo
+
+    # Parse the tests which are complete since the last read (all of them if final, e.g., once the file is idle)
+    # Only the lines of one test at a time are held in memory (the file is streamed through the parser), never the whole tail
+    def read(self, final = False):
+        scan = self.__scan()
+        if scan is None:
+            return []
+        last, size, content = scan
+        end = size if final else (last if last is not None else self.offset)
+        self.pending = not final and content
+        if end == self.offset:
+            return []
+        try:
+            tests, self.scanInfo = self.__parse(self.__lines(end))
+        except (IOError, OSError):
+            return []
+        except Exception:
+            if not self.skipErrors:
+                raise
+            tests = self.__parseBlocks(end)
+        self.offset = end
+        # A %NewTest without results is purged once the next one begins (as when the whole file is parsed), and the next one has
+        if not final and tests and tests[-1]['JSON']['results'] == {}:
+            tests.pop()
+        return tests
+
+    # Generate the blocks (lists of lines from one %NewTest to the next) of the file from offset up to the byte offset end
+    def __blocks(self, end):
+        block = []
+        for line in self.__lines(end):
+            if line.startswith('%NewTest') and block:
+                yield block
+                block = []
+            block.append(line)
+        yield block
+
+    # Parse the file one block at a time, skipping the blocks which cannot be parsed (e.g., a malformed number) and recording their errors
+    def __parseBlocks(self, end):
+        tests = []
+        blocks = self.__blocks(end)
+        block = next(blocks)
+        while block is not None:
+            following = next(blocks, None)
+            try:
+                parsed, self.scanInfo = self.__parse(block)
+            except Exception as e:
+                self.errors.append(e)
+            else:
+                # As when the blocks are parsed together, a %NewTest without results is purged unless it is the last
+                tests += parsed if following is None else [test for test in parsed if test['JSON']['results'] != {}]
+            block = following
+        return tests
+
+    # Parse the pending tests (those from offset to the end of the file) without moving past them
+    def peek(self):
+        scan = self.__scan()
+        if scan is None or not scan[2]:
+            return []
+        try:
+            return self.__parse(self.__lines())[0]
+        except (IOError, OSError):
+            return []
+
+# Parse a whole results file, returning (tests, full_test, error) where error is None or a 'Type: message' string (tests = [] on error)
+# NOTE: this is the unit of work of parseFiles(), so it must remain a module-level function (picklable) which never raises
+def parseResultsFile(results_file_path, arrays = False):
+    try:
+        tests = list(iterTests(results_file_path, arrays = arrays))
+    except Exception as e:
+        return [], None, '%s: %s' % (type(e).__name__, e)
+    return tests, findFullTest(tests), None
+
+# Parse several results files over a pool of worker processes, returning the parseResultsFile() results in the order of paths
+# workers := number of processes (None := one per CPU, 1 := parse in this process), arrays := see ResultsParser
+def parseFiles(paths, workers = None, arrays = False):
+    paths = list(paths)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    workers = max(1, min(workers, len(paths)))
+    if workers == 1:
+        return [parseResultsFile(path, arrays = arrays) for path in paths]
+    pool = multiprocessing.Pool(workers)
+    try:
+        # Small chunks, since the files can be of very different sizes
+        return pool.map(partial(parseResultsFile, arrays = arrays), paths, chunksize = max(1, len(paths) // (8 * workers)))
+    finally:
+        pool.close()
+        pool.join()
@@ -5,14 +5,33 @@
 
 import os, re
 from itk_pdb.databaseUtilities import INFO, WARNING, Colours
+from itk_pdb.ITSDAQParser import iterTests, findFullTest, parseFiles, ResultsTail
+from itk_pdb.fileIndex import FileIndex
+from itk_pdb.uploadJournal import JSON, UPLOADED, FAILED
+from itk_pdb.attachmentUploader import Attachment, AttachmentUploader, DEFAULT_WORKERS
+from itk_pdb.componentResolver import ComponentResolver, checkSerialNumber, localName
+try:
+    from itk_pdb.gainArrays import serializeJSON
+except ImportError:
+    serializeJSON = lambda json: json
 from pprint import PrettyPrinter
 pp = PrettyPrinter(indent = 1, width = 200)
-from requests_toolbelt.multipart.encoder import MultipartEncoder
 
 # ComponentNotFound := component could not be identified in the ITkPD
 class ComponentNotFound(Exception):
     pass
 
+# Descriptions of the files uploaded alongside a test (filled in with its run number and date, except for the config file)
+FILE_DESCRIPTIONS = {
+    'det_filename':                 'ITSDAQ config file.',
+    'strobe_delay_filename':        'ITSDAQ strobe delay scan PDF file, run number %s. Obtained on %s.',
+    'three_point_gain_filename':    'ITSDAQ 3PG scan PDF file, run number %s. Obtained on %s.',
+    'response_curve_filename':      'ITSDAQ response curve scan PDF file, run number %s. Obtained on %s.',
+    'trim_filename':                'ITSDAQ trim file, run number %s. Obtained on %s.',
+    'mask_filename':                'ITSDAQ mask file, run number %s. Obtained on %s.',
+    'no_filename':                  'ITSDAQ noise occupancy scan PDF file, run number %s. Obtained on %s.'
+}
+
 # Define our ResultsFile object
 class ResultsFile(object):
 
@@ -20,6 +39,10 @@ class ResultsFile(object):
         self.results_file_path = results_file_path
         self.tests = []
         self.full_test = {'state': False, 'lower_index': None, 'upper_index': None}
+        self.error = None
+        # Checkpoint of getTests(): the tail of the file past the tests which are complete (see ITSDAQParser.ResultsTail)
+        self.results_tail = None
+        self.complete_tests = []
         self.iter_index = 0
         self.enable_printing = enable_printing
 
@@ -27,6 +50,10 @@ class ResultsFile(object):
         self.results_file_path = results_file_path
         self.tests = []
         self.full_test = {'state': False, 'lower_index': None, 'upper_index': None}
+        self.error = None
+        # Checkpoint of getTests(): the tail of the file past the tests which are complete (see ITSDAQParser.ResultsTail)
+        self.results_tail = None
+        self.complete_tests = []
         self.iter_index = 0
         self.enable_printing = enable_printing
 
@@ -59,566 +86,96 @@ class ResultsFile(object):
     # Python 2 iterator fix, see: https://stackoverflow.com/questions/29578469/how-to-make-an-object-both-a-python2-and-python3-iterator
     next = __next__
         
-    # Return every line in results file
-    def __getLines(self):
-        with open(self.results_file_path, 'r') as file:
-            lines = file.readlines()
-        return lines
-
-    # Parse lines in order to identify all of the tests performed, returned as a list of dictionaries
+    # Generate the tests found in the results file one at a time, as they are parsed (see ITSDAQParser.ResultsParser)
+    # Unlike getTests(), the tests are not kept in self.tests, so arbitrarily large files can be parsed in bounded memory
+    # arrays := keep the results of 3PG and response curve tests as gainArrays.GainResults (serialized only when uploaded/printed)
+    def iterTests(self, debug = False, arrays = False):
+        return iterTests(self.results_file_path, debug = debug, arrays = arrays)
+
+    # Parse the results file in order to identify all of the tests performed, stored as a list of dictionaries in self.tests
+    # ITSDAQ keeps appending to the same results file, so the byte offset (and parser state) past the complete tests is checkpointed:
+    # a later call only parses what was appended since, plus the last test of the file (which may have been incomplete at the last call)
+    # The tests which were complete are kept as they were (e.g., finalized), only the last one is parsed again
     ######################################################################################################################
-    # NOTE: the following function is heavily hardcoded and relies on the patterns present in most results summary files #
+    # NOTE: the parser is heavily hardcoded and relies on the patterns present in most results summary files             #
     # As a result, it is important to check that the output of the function appears to make sense                        #
     ######################################################################################################################
-    def getTests(self, debug = False):
-
-        # Get our lines
-        lines = self.__getLines()
-
-        # Initialize our list of tests and test_number (= number of tests found in the provided lines)
-        tests = []
-        test_number = 0
+    def getTests(self, debug = False, arrays = False):
 
         # DEBUG
         if debug:
             print('ResultsFile.getTests() -- DEBUG : looking in file: %s' % self.results_file_path)
 
-        # Read every line
-        for i, line in enumerate(lines):
-
-            # DEBUG
-            if debug:
-                print('ResultsFile.getTests() -- DEBUG : looking at line: %s' % i)
-
-            # Throw away the line if the first character is not %
-            if line[0] == '%':
-
-                ######################
-                # Parse general info #
-                ######################
-                if '%NewTest' in line:
-
-                    # NOTE: check for the peculiar cases where we have a %NewTest but no results associated with it
-                    # i.e., test_number does not get incremented, in which case we should purge the results
-                    if len(tests) != test_number:
-                        if tests[test_number]['JSON']['results'] == {}:
-                            if debug:
-                                print('ResultsFile.getTests() -- DEBUG : previous NewTest yielded empty test[\'JSON\'][\'results\'] -- PURGING!')
-                            del tests[test_number]
-
-                    if debug:
-                        print('ResultsFile.getTests() -- DEBUG : adding NewTest at line: %s' % i)
-                    tests.append({'JSON': {'properties': {}, 'results': {}}, 'extra_data': {'NewTest_EXTRA': {}, 'DAQ_INFO_EXTRA': {}, 'DCS_INFO': {}, 'SCAN_INFO': {},
-                                    'identifiers': {}}, 'files_to_upload': {}, 'files_to_upload_FULL': {}})
-
-                    # Read serial number, user, location, run number, date, passed, and problem
-                    # Properties which are needed for the JSON input to the database are thrown in extra_data
-                    tests[test_number]['JSON']['properties']['SERIAL_NUMBER'] = lines[i+2][17:-1]
-                    tests[test_number]['JSON'].update({
-                        'runNumber':        lines[i+5][17:-1],
-                        'date':             lines[i+6][17:-1].replace('/', '.'),
-                        'passed':           True if lines[i+7][17:-1] == 'YES' else (False if lines[i+7][17:-1] == 'NO' else None),
-                        'problems':         True if lines[i+8][17:-1] == 'YES' else (False if lines[i+8][17:-1] == 'NO' else None)
-                    })
-                    tests[test_number]['extra_data']['NewTest_EXTRA'].update({
-                        'user':             lines[i+3][17:-1],
-                        'location':         lines[i+4][17:-1]
-                    })
-
-                ############################
-                # Parse DAQ info all tests #
-                ############################
-                elif '%DAQ_INFO' in line:
-                    if debug:
-                        print('ResultsFile.getTests() -- DEBUG : adding DAQ_INFO at line: %s' % i)
-
-                    # Read host, version, DUT, and time
-                    tests[test_number]['JSON']['properties'].update({
-                        'ITSDAQ_VERSION':   lines[i+5][1:-2],
-                        'TIME':             lines[i+9][1:-2]
-                    })
-                    tests[test_number]['extra_data']['DAQ_INFO_EXTRA'].update({
-                        'host':             lines[i+3][1:-2],
-                        'DUT':              lines[i+7][1:-2]
-                    })
-                
-                ##################
-                # Parse DCS info #
-                ##################
-                elif '%DCS_INFO' in line:
-                    if debug:
-                        print('ResultsFile.getTests() -- DEBUG : adding DCS_INFO at line: %s' % i)
-
-                    # Read T0, T1, VDET, IDET, VCC, ICC, VDD, and IDD, and time_powered (all thrown into extra_data)
-                    tests[test_number]['extra_data']['DCS_INFO'].update({
-                        'T0':               float(lines[i+3].split()[0]),
-                        'T1':               float(lines[i+3].split()[1]),
-                        'VDET':             float(lines[i+5].split()[0]),
-                        'IDET':             float(lines[i+5].split()[1]),
-                        'VCC':              float(lines[i+7].split()[0]),
-                        'ICC':              float(lines[i+7].split()[1]),
-                        'VDD':              float(lines[i+9].split()[0]),
-                        'IDD':              float(lines[i+9].split()[1]),
-                        'time_powered':     lines[i+11][:-2]
-                    })
-
-                ##################################################################
-                # Parse scan info (only for 3PG, response curve, and trim range) #
-                ##################################################################
-                elif '%SCAN_INFO' in line:
-                    if debug:
-                        print('ResultsFile.getTests() -- DEBUG : adding SCAN_INFO at line: %s' % i)
-
-                    # Read point_type, N_points, and points (all thrown into extra data)
-
-                    # Use a special function to get the points as sometimes the points can be distributed over 2 lines or have .'s included
-                    j = 7
-                    points = []
-                    while True:
-                        if '#' in lines[i+j]:
-                            break
-                        else:
-                            points += list(map(float, filter(lambda point: point != '.', lines[i+j].split())))
-                            j += 1
-
-                    tests[test_number]['extra_data']['SCAN_INFO'].update({
-                        'point_type':       lines[i+3][1:-2],
-                        'N_points':         int(lines[i+5]),
-                        'points':           points
-                    })
-
-                    # Save the scan info to SCAN_INFO for the type = -1 trim range scan
-                    SCAN_INFO = tests[test_number]['extra_data']['SCAN_INFO']
-
-                ###################################
-                # Parse StrobeDelay specific info #
-                ###################################
-                elif '%StrobeDelay' in line:
-                    if debug:
-                        print('ResultsFile.getTests() -- DEBUG : adding StrobeDelay at line: %s' % i)
-
-                    # Read test type
-                    tests[test_number]['JSON']['testType'] = 'STROBE_DELAY'
-
-                    # Read the strobe delay fraction
-                    # We use this while loop to skip defects
-                    j = 11
-                    while True:
-                        if 'Strobe Delay Fraction' in lines[i+j]:
-                            break
-                        else:
-                            j += 1
-                    tests[test_number]['JSON']['properties']['FRACTION'] = float(lines[i+j].split()[5])
-
-                    # Read stream delays (excluding delays = -1 as they indicate missing ABCs)
-                    delays_stream0 = list(map(int, lines[i+4].split()))
-                    delays_stream1 = list(map(int, lines[i+7].split()))
-                    tests[test_number]['JSON']['results'].update({
-                        'STREAM0_DELAYS':   [delay for delay in delays_stream0 if delay != -1],
-                        'STREAM1_DELAYS':   [delay for delay in delays_stream1 if delay != -1]
-                    })
-
-                    # Read our identifiers
-                    identifiers_stream0 = lines[i+3].split()[1:]
-                    identifiers_stream1 = lines[i+6].split()[1:]
-                    tests[test_number]['extra_data']['identifiers'].update({
-                        'stream0':          [identifiers_stream0[i] for i in range(len(identifiers_stream0)) if delays_stream0[i] != -1],
-                        'stream1':          [identifiers_stream1[i] for i in range(len(identifiers_stream1)) if delays_stream1[i] != -1]
-                    })
-
-                    # Include the filename(s) to be uploaded
-                    tests[test_number]['files_to_upload']['strobe_delay_filename'] = tests[test_number]['JSON']['properties']['SERIAL_NUMBER'] + '_StrobeDelayPlot_' + ''.join(tests[test_number]['JSON']['date'].split('.')[::-1]) + '_' + ''.join(tests[test_number]['JSON']['properties']['TIME'].split(':')) + '.pdf'
-                    tests[test_number]['files_to_upload']['det_filename'] = tests[test_number]['JSON']['properties']['SERIAL_NUMBER'] + '.det'
-
-                    # Increment test_number
-                    if debug:
-                        print('ResultsFile.getTests() -- DEBUG : the following test (test_number = %s) has been parsed:' % test_number)
-                        print('')
-                        pp.pprint(tests[test_number])
-                        print('')
-                    test_number += 1
-
-                ######################################
-                # Parse ThreePointGain specific info #
-                ######################################
-                elif '%ThreePointGain' in line:
-                    if debug:
-                        print('ResultsFile.getTests() -- DEBUG : adding ThreePointGain at line: %s' % i)
-
-                    # Read test type
-                    tests[test_number]['JSON']['testType'] = 'THREE_POINT_GAIN'
-
-                    # We fetched the midpoint earlier (the second value in points in SCAN_INFO)
-                    tests[test_number]['JSON']['properties']['MIDPOINT'] = tests[test_number]['extra_data']['SCAN_INFO']['points'][1]
-
-                    # The following lists contains the keys for our results dictionary in the order in which the keys will be read from the lines in the summary file
-                    stream0_keys = ['STREAM0_P0', 'STREAM0_P1', 'STREAM0_VT50', 'STREAM0_VT50_RMS', 'STREAM0_GAIN', 'STREAM0_GAIN_RMS', 'STREAM0_OFFSET', 'STREAM0_OFFSET_RMS',
-                                    'STREAM0_OUTNSE', 'STREAM0_INNSE', 'STREAM0_INNSE_RMS']
-                    stream1_keys = ['STREAM1_P0', 'STREAM1_P1', 'STREAM1_VT50', 'STREAM1_VT50_RMS', 'STREAM1_GAIN', 'STREAM1_GAIN_RMS', 'STREAM1_OFFSET', 'STREAM1_OFFSET_RMS',
-                                    'STREAM1_OUTNSE', 'STREAM1_INNSE', 'STREAM1_INNSE_RMS']
-
-                    # Initialize our results dictionary for all of our stream 0/1 keys
-                    results = {}
-                    for key in stream0_keys:
-                        results[key] = []
-                    for key in stream1_keys:
-                        results[key] = []
-
-                    # j_loopA_identifier refers to the number of lines below line i (i.e., '%ThreePointGain') where the chip identifiers (e.g., '#M16') begin for Loop A
-                    j_loopA_identifier = 4
-                    j = j_loopA_identifier
-
-                    # We'll dump the data from Loop A into data_loopA and our identifiers (chip IDs)
-                    data_loopA = []
-                    identifiers = []
-
-                    while True:
-                        
-                        # If the line has only '#\n' on it, we know we reached the end of Loop A and need to break
-                        if lines[i+j] == '#\n':
-                            break
-
-                        # Else we'll append the data line (1 line below i+j) to data_loopA as well as our identifiers to identifiers
-                        else:
-                            data_loopA.append(lines[i+j+1].split()[1:3])
-                            identifiers.append(lines[i+j][1:-1])
-                            j += 2
-
-                    # Calculate the number of chips
-                    number_of_chips = int((j - j_loopA_identifier) / 4)
-
-                    # j_loopB_data refers to the number of lines below line i where the data lines begin for Loop B
-                    j_loopB_data = j + 4
-
-                    # Iterate over the number of chips
-                    for k in range(0, number_of_chips):
-
-                        # Get the line data for both stream 0/1 for Loop B and add it to the corresponding line for Loop A
-                        # We filter the lines so nan's go to -1000000 and so do the 'Too many defects in this chip!' Loop B rows (should be recognized as an error)
-                        if 'Too many defects in this chip!' in lines[i+j_loopB_data+2*k]:
-                            line_data_stream0 = data_loopA[k] + 9 * ['-1000000']
-                        else:
-                            line_data_stream0 = data_loopA[k] + [datum if 'nan' not in datum else '-1000000' for datum in lines[i+j_loopB_data+2*k].split()]
-                        if 'Too many defects in this chip!' in lines[i+j_loopB_data+2*(number_of_chips+k)]:
-                            line_data_stream1 = data_loopA[k+number_of_chips] + 9 * ['-1000000']
-                        else:
-                            line_data_stream1 = data_loopA[k+number_of_chips] + [datum if 'nan' not in datum else '-1000000' for datum in
-                                                                                    lines[i+j_loopB_data+2*(number_of_chips+k)].split()]
-
-                        # Assuming len(stream0_keys) == len(stream1_keys), we can append the data lines from above to their respective dictionaries
-                        # 'STREAM0/1_INNSE' and 'STREAM0/1_INNSE_RMS' look like integers?
-                        for ii in range(len(stream0_keys)):
-                            results[stream0_keys[ii]].append(int(line_data_stream0[ii]) if (stream0_keys[ii] == 'STREAM0_INNSE' or  stream0_keys[ii] == 'STREAM0_INNSE_RMS')
-                                                                else float(line_data_stream0[ii]))
-                            results[stream1_keys[ii]].append(int(line_data_stream1[ii]) if (stream1_keys[ii] == 'STREAM1_INNSE' or  stream1_keys[ii] == 'STREAM1_INNSE_RMS') 
-                                                                else float(line_data_stream1[ii]))
-
-                    # Update results, identifiers, filename(s), and increment test_number
-                    tests[test_number]['JSON']['results'] = results
-                    tests[test_number]['extra_data']['identifiers'].update({'stream0': identifiers[:number_of_chips], 'stream1': identifiers[number_of_chips:]})
-                    tests[test_number]['files_to_upload']['three_point_gain_filename'] = tests[test_number]['JSON']['properties']['SERIAL_NUMBER'] + '_RCPlot_' + ''.join(tests[test_number]['JSON']['date'].split('.')[::-1]) + '_' + ''.join(tests[test_number]['JSON']['properties']['TIME'].split(':')) + '.pdf'
-                    if debug:
-                        print('ResultsFile.getTests() -- DEBUG : the following test (test_number = %s) has been parsed:' % test_number)
-                        print('')
-                        pp.pprint(tests[test_number])
-                        print('')
-                    test_number += 1
-
-                #####################################
-                # Parse ResponseCurve specific info #
-                #####################################
-                elif '%ResponseCurve' in line:
-
-                    if debug:
-                        print('ResultsFile.getTests() -- DEBUG : adding ResponseCurve at line: %s' % i)
-
-                    # Read test type
-                    tests[test_number]['JSON']['testType'] = 'RESPONSE_CURVE'
-
-                    # CHECK ME: We fetched the input charge earlier (the sixth value in points in SCAN_INFO)
-                    tests[test_number]['JSON']['properties']['INPUT_CHARGE'] = tests[test_number]['extra_data']['SCAN_INFO']['points'][5]
-           
-                    # The following lists contains the keys for our results dictionary in the order in which the keys will be read from the lines in the summary file
-                    stream0_keys = ['STREAM0_P0', 'STREAM0_P1', 'STREAM0_P2', 'STREAM0_VT50', 'STREAM0_VT50_RMS', 'STREAM0_GAIN', 'STREAM0_GAIN_RMS', 'STREAM0_OFFSET',
-                                    'STREAM0_OFFSET_RMS', 'STREAM0_OUTNSE', 'STREAM0_INNSE', 'STREAM0_INNSE_RMS']
-                    stream1_keys = ['STREAM1_P0', 'STREAM1_P1', 'STREAM1_P2', 'STREAM1_VT50', 'STREAM1_VT50_RMS', 'STREAM1_GAIN', 'STREAM1_GAIN_RMS', 'STREAM1_OFFSET',
-                                    'STREAM1_OFFSET_RMS', 'STREAM1_OUTNSE', 'STREAM1_INNSE', 'STREAM1_INNSE_RMS']
-
-                    # Initialize our results dictionary for all of our stream 0/1 keys
-                    results = {}
-                    for key in stream0_keys:
-                        results[key] = []
-                    for key in stream1_keys:
-                        results[key] = []
-
-                    # j_loopA_identifier refers to the number of lines below line i (i.e., '%ResponseCurve') where the chip identifiers (e.g., '#M16') begin for Loop A
-                    j_loopA_identifier = 4
-                    j = j_loopA_identifier
-
-                    # We'll dump the data from Loop A into data_loopA and our identifiers (chip IDs) to identifiers
-                    data_loopA = []
-                    identifiers = []
-
-                    while True:
-                        
-                        # If the line has only '#\n' on it, we know we reached the end of Loop A and need to break
-                        if lines[i+j] == '#\n':
-                            break
-
-                        # Else we'll append the data line (1 line below i+j) to data_loopA as well as our identifiers to identifiers
-                        else:
-                            data_loopA.append(lines[i+j+1].split()[1:])
-                            identifiers.append(lines[i+j][1:-1])
-                            j += 2
-
-                    # Calculate the number of chips
-                    number_of_chips = int((j - j_loopA_identifier) / 4)
-
-                    # j_loopB_data refers to the number of lines below line i where the data lines begin for Loop B
-                    j_loopB_data = j + 4
-
-                    # Iterate over the number of chips
-                    for k in range(number_of_chips):
-
-                        # Get the line data for both stream 0/1 for Loop B and add it to the corresponding line for Loop A
-                        # We filter the lines so nan's go to -1000000 and so do the 'Too many defects in this chip!' Loop B rows (should be recognized as an error)
-                        if 'Too many defects in this chip!' in lines[i+j_loopB_data+2*k]:
-                            line_data_stream0 = data_loopA[k] + 9 * ['-1000000']
-                        else:
-                            line_data_stream0 = data_loopA[k] + [datum if 'nan' not in datum else '-1000000' for datum in lines[i+j_loopB_data+2*k].split()]
-                        if 'Too many defects in this chip!' in lines[i+j_loopB_data+2*(number_of_chips+k)]:
-                            line_data_stream1 = data_loopA[k+number_of_chips] + 9 * ['-1000000']
-                        else:
-                            line_data_stream1 = data_loopA[k+number_of_chips] + [datum if 'nan' not in datum else '-1000000' for datum in
-                                                                                    lines[i+j_loopB_data+2*(number_of_chips+k)].split()]
-
-                        # Assuming len(stream0_keys) == len(stream1_keys), we can append the data lines from above to their respective dictionaries
-                        # 'STREAM0/1_INNSE' and 'STREAM0/1_INNSE_RMS' look like integers?
-                        for ii in range(len(stream0_keys)):
-                            results[stream0_keys[ii]].append(int(line_data_stream0[ii]) if (stream0_keys[ii] == 'STREAM0_INNSE' or  stream0_keys[ii] == 'STREAM0_INNSE_RMS')
-                                                                else float(line_data_stream0[ii]))
-                            results[stream1_keys[ii]].append(int(line_data_stream1[ii]) if (stream1_keys[ii] == 'STREAM1_INNSE' or  stream1_keys[ii] == 'STREAM1_INNSE_RMS') 
-                                                                else float(line_data_stream1[ii]))
-
-                    # Update results, identifiers, filename(s), and increment test_number
-                    tests[test_number]['JSON']['results'] = results
-                    tests[test_number]['extra_data']['identifiers'].update({'stream0': identifiers[:number_of_chips], 'stream1': identifiers[number_of_chips:]})
-                    tests[test_number]['files_to_upload']['response_curve_filename'] = tests[test_number]['JSON']['properties']['SERIAL_NUMBER'] + '_RCPlot_' + ''.join(tests[test_number]['JSON']['date'].split('.')[::-1]) + '_' + ''.join(tests[test_number]['JSON']['properties']['TIME'].split(':')) + '.pdf'
-                    if debug:
-                        print('ResultsFile.getTests() -- DEBUG : the following test (test_number = %s) has been parsed:' % test_number)
-                        print('')
-                        pp.pprint(tests[test_number])
-                        print('')
-                    test_number += 1
-
-                ############################
-                # Parse Trim specific info #
-                ############################
-                elif '%Trim' in line:
-
-                    # We only want the last trim range scan of a given set (type = -1)
-                    trim_type = int(lines[i+3].split()[1])
-                    if trim_type == -1:
-
-                        if debug:
-                            print('ResultsFile.getTests() -- DEBUG : adding Trim at line: %s' % i)
-
-                        # Update the test type
-                        tests[test_number]['JSON']['testType'] = 'TRIM_RANGE'
-
-                        # Assuming the scan info is the same for every trim range scan up to the type = -1 scan, we can grab scan info from the last scan
-                        # Scan info must be passed to the type = -1 scan as it does not have scan info associated with its %NewTest
-                        tests[test_number]['extra_data']['SCAN_INFO'].update(SCAN_INFO)
-
-                        # Initialize our results dictionary
-                        results = {'STREAM0_RANGE': [], 'STREAM0_TARGET': [], 'STREAM1_RANGE': [], 'STREAM1_TARGET': []}
-
-                        # j_identifier refers to the number of lines below line i (i.e., '%Trim') where the channel identifiers (e.g., '#Ch16') begin
-                        j_identifier = 7
-                        j = j_identifier
-
-                        # We'll dump the data from Loop A into data_loopA and our identifiers (channels) to identifiers
-                        data = []
-                        identifiers = []
-
-                        while True:
-                        
-                            # If the line has only '#\n' on it, we break
-                            if lines[i+j] == '#\n':
-                                break
-
-                            # Else we'll append the data line (1 line below i+j) to data as well as our identifiers to identifiers
-                            else:
-                                data.append(lines[i+j+1].split()[0:2])
-                                identifiers.append(lines[i+j][1:-1])
-                                j += 2
-
-                        # Calculate the number of channels
-                        number_of_channels = int((j - j_identifier) / 4)
-
-                        # Iterate over the number of channels
-                        for ii in range(number_of_channels):
-
-                            # Sort through the elements of data and append them appropriately to results
-                            results['STREAM0_RANGE'].append(int(data[ii][0]))
-                            results['STREAM0_TARGET'].append(float(data[ii][1]))
-                            results['STREAM1_RANGE'].append(int(data[ii+number_of_channels][0]))
-                            results['STREAM1_TARGET'].append(float(data[ii+number_of_channels][1]))
-
-                        # Update results, identifiers, filename(s), and increment test_number
-                        tests[test_number]['JSON']['results'] = results
-                        tests[test_number]['extra_data']['identifiers'].update({'stream0': identifiers[:number_of_channels], 'stream1': identifiers[number_of_channels:]})
-                        tests[test_number]['files_to_upload']['trim_filename'] = tests[test_number]['JSON']['properties']['SERIAL_NUMBER'] + '_tr-1_' + ''.join(tests[test_number]['JSON']['date'].split('.')[::-1]) + '.trim'
-                        tests[test_number]['files_to_upload']['mask_filename'] = tests[test_number]['JSON']['properties']['SERIAL_NUMBER'] + '_tr-1_' + ''.join(tests[test_number]['JSON']['date'].split('.')[::-1]) + '.mask'                           
-                        if debug:
-                            print('ResultsFile.getTests() -- DEBUG : the following test (test_number = %s) has been parsed:' % test_number)
-                            print('')
-                            pp.pprint(tests[test_number])
-                            print('')
-                        test_number += 1
-
-                    # If it's not the type = -1 trim range test, we want to delete it from tests
-                    else:
-                        del tests[test_number]
-
-                #######################################
-                # Parse noise occupancy specific info #
-                #######################################
-                elif '%NO' in line:
-                    if debug:
-                        print('ResultsFile.getTests() -- DEBUG : adding NO at line: %s' % i)
-
-                    # Read test type
-                    tests[test_number]['JSON']['testType'] = 'NOISE_OCCUPANCY'
-
-                    # j_identifier refers to the number of lines below line i (i.e., '%NO') where the chip identifiers (e.g., '#M16') begin
-                    j_identifier = 3
-                    j = j_identifier
-
-                    # We'll dump the data from the chips to data as well as our identifiers to identifiers
-                    data = []
-                    identifiers = []
-
-                    while True:
-
-                        # If the line has only '#\n' on it, we break
-                        if lines[i+j] == '#\n':
-                                break
-
-                        # Else if the line is all 0's, we don't want to include it
-                        elif [float(datum) for datum in lines[i+j+1].split()] == [0, 0, 0, 0]:
-                            j += 2
-
-                        # Else we can append the last element in the row (EstENC) to data as well as our identifiers to identifiers
-                        else:
-                            data.append(-1000000 if 'nan' in lines[i+j+1].split()[3] else int(lines[i+j+1].split()[3]))
-                            identifiers.append(lines[i+j][1:-1])
-                            j += 2
-
-                    # Get the number of chips
-                    number_of_chips = int(len(data) / 2)
-
-                    # Update results and identifiers and increment test_number
-                    tests[test_number]['JSON']['results'].update({'STREAM0_ESTENC':   data[:number_of_chips], 'STREAM1_ESTENC':   data[number_of_chips:]})
-                    tests[test_number]['extra_data']['identifiers'].update({'stream0': identifiers[:number_of_chips], 'stream1': identifiers[number_of_chips:]})
-                    tests[test_number]['files_to_upload']['no_filename'] = tests[test_number]['JSON']['properties']['SERIAL_NUMBER'] + '_NoScurve_' + ''.join(tests[test_number]['JSON']['date'].split('.')[::-1]) + '_' + ''.join(tests[test_number]['JSON']['properties']['TIME'].split(':')) + '.pdf'
-                    if debug:
-                        print('ResultsFile.getTests() -- DEBUG : the following test (test_number = %s) has been parsed:' % test_number)
-                        print('')
-                        pp.pprint(tests[test_number])
-                        print('')
-                    test_number += 1
+        # Start over if the file was never read (or was read in the other mode, or has been truncated/replaced since)
+        size = os.path.getsize(self.results_file_path)
+        if self.results_tail is None or self.results_tail.arrays != arrays or size < self.results_tail.offset:
+            self.results_tail = ResultsTail(self.results_file_path, arrays = arrays)
+            self.complete_tests = []
+            self.full_test = {'state': False, 'lower_index': None, 'upper_index': None}
+        self.results_tail.debug = debug
+        # A malformed test raises (the tail does not move past it) and is described by self.error, rather than leaving a partial run in self.tests
+        try:
+            complete_tests = self.results_tail.read()
+            previous = len(self.complete_tests)
+            self.complete_tests += complete_tests
+            try:
+                tests = self.complete_tests + self.results_tail.peek()
+            except IndexError:
+                # The last block is still being written, it will be parsed by the next call
+                if debug:
+                    print('ResultsFile.getTests() -- DEBUG : last test is incomplete -- leaving it for later.')
+                tests = list(self.complete_tests)
+        except Exception as e:
+            self.error = '%s: %s' % (type(e).__name__, e)
+            raise
+        self.error = None
 
         # DEBUG
         if debug:
-            print('ResultsFile.getTests() -- DEBUG : %s tests found.' % len(tests))
-            print('ResultsFile.getTests() -- DEBUG : the following tests have been parsed:')
-            print('')
-            pp.pprint(tests)
-            print('')
-
-        # Check to see if a fullTest is present
-        if len(tests) >= 7:
-            for i in range(len(tests) - 6):
-                if (tests[i]['JSON']['runNumber'].split('-')[0] == tests[i+6]['JSON']['runNumber'].split('-')[0]) and ((int(tests[i+6]['JSON']['runNumber'].split('-')[1]) - int(tests[i]['JSON']['runNumber'].split('-')[1])) == 41):
-                    self.full_test.update({'state': True, 'lower_index': i, 'upper_index': i+6})
+            print('ResultsFile.getTests() -- DEBUG : %s tests found (%s new complete tests).' % (len(tests), len(complete_tests)))
+
+        # Check to see if a fullTest is present, only the tests which were not complete before can start a new one
+        # (a FullTest which ended in the previous last test may have changed with it)
+        if self.full_test['state'] and self.full_test['upper_index'] >= previous:
+            self.full_test = {'state': False, 'lower_index': None, 'upper_index': None}
+        full_test = findFullTest(tests, start = previous - 6)
+        if full_test is not None:
+            self.full_test.update({'state': True, 'lower_index': full_test[0], 'upper_index': full_test[1]})
 
         # Update self.tests
         self.tests = tests
 
-        # Explicitly delete lines (?)
-        del lines
-
         # DEBUG
         if debug:
             print('ResultsFile.getTests() -- DEBUG : file scanned successfully!')
 
-    # Check if the serial number for a component is a valid ATLAS ITk serial number
-    # See: https://indico.cern.ch/event/718637/contributions/2963483/attachments/1634097/2607226/serial_numbers_testbeam2.pdf
-    def __checkSerialNumber(self, serial_number):
-        XX = ['SB', 'SE', 'SG', 'PB', 'PE', 'PG']
-        YY = ['HX', 'HY', 'H0', 'H1', 'H2', 'H3', 'H4', 'H5', 'ML', 'MS', 'M0', 'M1', 'M2', 'M3', 'M4', 'M5', 'P0', 'P1', 'P2', 'P3', 'P4', 'P5', 'AB', 'AH', 'AA', 'AM', '00']
-        if ((serial_number[0:3] == '20U') and (len(serial_number) == 14) and (serial_number[3:5] in XX) and (serial_number[5:7] in YY)
-            and (serial_number[7] in ['0', '1', '2', '3']) and (serial_number[8] in ['0', '1', '2']) and serial_number[9:].isdigit()):
-            return True
-        else:
-            return False
-
     # Add the component codes, local object names, and institutions to the JSON for each test
     # Also validate the serial number and, if necessary, replace it
     # We also add the full filepaths for the files which will be uploaded to the ITkPD
-    def finalizeTest(self, test_number, ITkPDSession, upload_files = False, ResultsFolder = None, depth = 0, full_test = False):
+    # resolver := componentResolver.ComponentResolver which has already resolved the components of many tests at once (see
+    # ResultsFolder.resolveComponents()), if None the component of this test is looked up on its own
+    def finalizeTest(self, test_number, ITkPDSession, upload_files = False, ResultsFolder = None, depth = 0, full_test = False, resolver = None):
 
         # Get the serial number
         serial_number = self.tests[test_number]['JSON']['properties']['SERIAL_NUMBER']
 
-        # If it looks like a real serial number, we can probe the database directly
-        if self.__checkSerialNumber(serial_number):
-
-            # Fetch the component and update the component code and institution
-            component = ITkPDSession.doSomething(action = 'getComponent', method = 'GET', data = {'component': serial_number})
-            self.tests[test_number]['JSON'].update({'component': component['code'], 'institution': component['institution']['code']})
-
-            # If it has a local object name, include that in properties
-            for property in component['properties']:
-                if (property['code'] == 'LOCALNAME') or (property['code'] == 'LOCAL_NAME'):
-                    self.tests[test_number]['JSON']['properties']['LOCAL_OBJECT_NAME'] = property['value']
-            if 'LOCAL_OBJECT_NAME' not in self.tests[test_number]['JSON']['properties'].keys():
-                self.tests[test_number]['JSON']['properties']['LOCAL_OBJECT_NAME'] = None
-
-        # Else -- if it is not a valid serial number
-        else:
-
-            # We'll filter the database contents by the local name and RFID, hoping that the serial number actually points to one of those
-            property_filter = [ {'code': 'LOCALNAME', 'operator': '=', 'value': serial_number},
-                                {'code': 'LOCAL_NAME', 'operator': '=', 'value': serial_number},
-                                {'code': 'RFID', 'operator': '=', 'value': serial_number}   ]
-
-            # Get a list of components with our filter
-            component_list = ITkPDSession.doSomething(action = 'listComponentsByProperty', method = 'POST',
-                                                        data = {'project': 'S', 'componentType': 'HYBRID', 'propertyFilter': property_filter})
-
-            # Assert that the list be of length 1, or else we did not find the proper component (e.g., maybe local name is not unique?)
-            if len(component_list) == 1:
+        # If it looks like a real serial number, the database is probed directly, else we'll filter the database contents by the local
+        # name and RFID, hoping that the serial number actually points to one of those
+        if resolver is None:
+            resolver = ComponentResolver(ITkPDSession)
+        component = resolver.get(serial_number)
+        if component is None:
+            if self.enable_printing:
+                WARNING('Component \'%s\' could not be identified using the serial number in the results file -- skipping.' % serial_number)
+            raise ComponentNotFound
 
-                component = component_list[0]
+        # Update JSON with the component code and institution (and the real serial number, if we found it by local name)
+        self.tests[test_number]['JSON'].update({'component': component['code'], 'institution': component['institution']['code']})
+        if not checkSerialNumber(serial_number):
+            self.tests[test_number]['JSON']['properties']['SERIAL_NUMBER'] = component['serialNumber']
 
-                # Update JSON with the component code, real serial number, institution, and local name
-                self.tests[test_number]['JSON'].update({'component': component['code'], 'institution': component['institution']['code']})
-                if component['serialNumber'] == None:
-                    self.tests[test_number]['JSON']['properties']['SERIAL_NUMBER'] = None
-                else:
-                    self.tests[test_number]['JSON']['properties']['SERIAL_NUMBER'] = component['serialNumber']
-                for property in component['properties']:
-                    if (property['code'] == 'LOCALNAME') or (property['code'] == 'LOCAL_NAME'):
-                        self.tests[test_number]['JSON']['properties']['LOCAL_OBJECT_NAME'] = property['value']
-                if 'LOCAL_OBJECT_NAME' not in self.tests[test_number]['JSON']['properties'].keys():
-                    self.tests[test_number]['JSON']['properties']['LOCAL_OBJECT_NAME'] = None
-
-            else:
-                if self.enable_printing:
-                    WARNING('Component \'%s\' could not be identified using the serial number in the results file -- skipping.' % self.tests[test_number]['JSON']['properties']['SERIAL_NUMBER'])
-                raise ComponentNotFound
+        # If it has a local object name, include that in properties
+        self.tests[test_number]['JSON']['properties']['LOCAL_OBJECT_NAME'] = localName(component)
 
         # Now find the files which need to be uploaded alongside our data (if the upload_files is specified)
         if upload_files:
@@ -680,62 +237,89 @@ class ResultsFile(object):
     # Print the JSON associated with a test
     def printJSON(self, test_number):
         if self.enable_printing:
-            pp.pprint(self.tests[test_number]['JSON'])
+            pp.pprint(serializeJSON(self.tests[test_number]['JSON']))
 
     # Print the entire dictionary associated with a test
     def printTest(self, test_number):
         if self.enable_printing:
             pp.pprint(self.tests[test_number])
 
+    # The pieces of a test (uploadJournal.JSON and, if upload_files, the filetypes of its files) which the journal has not seen uploaded
+    # Files which could not be found are never uploaded (see uploadFiles), so they are not pending either
+    def pendingUploads(self, test_number, journal, upload_files = False):
+        files_to_upload = self.tests[test_number]['files_to_upload_FULL']
+        pieces = [JSON] + (sorted(filetype for filetype in files_to_upload.keys() if files_to_upload[filetype] != None) if upload_files else [])
+        return journal.pending(self.results_file_path, self.tests[test_number]['JSON']['runNumber'], self.tests[test_number]['JSON'].get('testType'), pieces)
+
+    # Run upload() for a piece of a test, unless the journal (if not None) says it was already uploaded, and record the outcome in the journal
+    # Return False if the piece was skipped
+    def __journaled(self, test_number, journal, piece, upload):
+        if journal is None:
+            upload()
+            return True
+        key = (self.results_file_path, self.tests[test_number]['JSON']['runNumber'], self.tests[test_number]['JSON'].get('testType'), piece)
+        if journal.isUploaded(*key):
+            return False
+        try:
+            upload()
+        except Exception as e:
+            journal.record(*key, status = FAILED, message = str(e))
+            raise
+        journal.record(*key)
+        return True
+
     # Upload the JSON associated with a test
-    def uploadJSON(self, test_number, ITkPDSession):
-        ITkPDSession.doSomething(action = 'uploadTestRunResults', method = 'POST', data = self.tests[test_number]['JSON'])
-        if self.enable_printing:
-            INFO(Colours.BOLD + Colours.GREEN + 'Successfully' + Colours.ENDC + ' uploaded JSON for run number \'' + self.tests[test_number]['JSON']['runNumber'] + '\'.')
+    # journal := uploadJournal.UploadJournal, if not None the JSON is only uploaded if it was not already
+    def uploadJSON(self, test_number, ITkPDSession, journal = None):
+        run_number = self.tests[test_number]['JSON']['runNumber']
+        upload = lambda: ITkPDSession.doSomething(action = 'uploadTestRunResults', method = 'POST', data = serializeJSON(self.tests[test_number]['JSON']))
+        if not self.__journaled(test_number, journal, JSON, upload):
+            if self.enable_printing:
+                INFO('JSON for run number \'%s\' was already uploaded -- skipping.' % run_number)
+        elif self.enable_printing:
+            INFO(Colours.BOLD + Colours.GREEN + 'Successfully' + Colours.ENDC + ' uploaded JSON for run number \'' + run_number + '\'.')
         return True
 
-    # Upload the files associated with a test
+    # Upload the files associated with a test, several at once (see attachmentUploader.AttachmentUploader), streamed from disk
     # upload_files := enable/disable uploading files
     # filestypes := only upload these filetypes (if not None)
-    def uploadFiles(self, test_number, ITkPDSession, upload_files = False, filetypes = None):
+    # journal := uploadJournal.UploadJournal, if not None only the files which were not already uploaded are
+    # workers := number of files uploaded at once, callback := function(attachment, progress) called as the upload progresses
+    # Return False if any of the files could not be uploaded (the others are uploaded nonetheless)
+    def uploadFiles(self, test_number, ITkPDSession, upload_files = False, filetypes = None, journal = None, workers = DEFAULT_WORKERS, callback = None):
         if upload_files:
-            status = True
             if filetypes is None:
                 files_to_upload = self.tests[test_number]['files_to_upload_FULL']
             else:
                 files_to_upload = {key: self.tests[test_number]['files_to_upload_FULL'][key] for key in filetypes}
             run_number = self.tests[test_number]['JSON']['runNumber']
             date = self.tests[test_number]['JSON']['date']
+            key = (self.results_file_path, run_number, self.tests[test_number]['JSON'].get('testType'))
+            attachments = []
             for filetype in files_to_upload.keys():
-                if files_to_upload[filetype] != None:
-                    if filetype == 'det_filename':
-                        description = 'ITSDAQ config file.'
-                    elif filetype == 'strobe_delay_filename':
-                        description = 'ITSDAQ strobe delay scan PDF file, run number %s. Obtained on %s.' % (run_number, date)
-                    elif filetype == 'three_point_gain_filename':
-                        description = 'ITSDAQ 3PG scan PDF file, run number %s. Obtained on %s.' % (run_number, date)
-                    elif filetype == 'response_curve_filename':
-                        description = 'ITSDAQ response curve scan PDF file, run number %s. Obtained on %s.' % (run_number, date)
-                    elif filetype == 'trim_filename':
-                        description = 'ITSDAQ trim file, run number %s. Obtained on %s.' % (run_number, date)
-                    elif filetype == 'mask_filename':
-                        description = 'ITSDAQ mask file, run number %s. Obtained on %s.' % (run_number, date)
-                    elif filetype == 'no_filename':
-                        description = 'ITSDAQ noise occupancy scan PDF file, run number %s. Obtained on %s.' % (run_number, date)
-                    fields = {  'data': (os.path.basename(files_to_upload[filetype]), open(files_to_upload[filetype], 'rb')),
-                                'type': 'file',
-                                'component': self.tests[test_number]['JSON']['component'],
-                                'title': os.path.basename(files_to_upload[filetype]),
-                                'description': description  }
-                    data = MultipartEncoder(fields = fields)
-                    ITkPDSession.doSomething(action = 'createComponentAttachment', method = 'POST', data = data)
+                if files_to_upload[filetype] == None:
                     if self.enable_printing:
-                        INFO(Colours.BOLD + Colours.GREEN + 'Successfully' + Colours.ENDC + ' uploaded file \'%s\' for run number \'%s\'.' % (files_to_upload[filetype], run_number))
-                    status |= True
+                        WARNING('File \'%s\' could not be found for run number \'%s\' -- skipping.' % (filetype, run_number))
+                elif journal is not None and journal.isUploaded(*(key + (filetype,))):
+                    if self.enable_printing:
+                        INFO('File \'%s\' for run number \'%s\' was already uploaded -- skipping.' % (files_to_upload[filetype], run_number))
                 else:
+                    description = FILE_DESCRIPTIONS.get(filetype, 'ITSDAQ file, run number %s. Obtained on %s.') % ((run_number, date) if filetype != 'det_filename' else ())
+                    attachments.append(Attachment(self.tests[test_number]['JSON']['component'], files_to_upload[filetype], description = description, key = filetype))
+            uploader = AttachmentUploader(ITkPDSession, workers = workers, callback = callback) if attachments else None
+            status = True
+            for attachment in (uploader.upload(attachments) if uploader is not None else []):
+                if journal is not None:
+                    journal.record(*(key + (attachment.key,)), status = UPLOADED if attachment.status else FAILED, message = str(attachment.error) if attachment.error else None)
+                if attachment.status:
                     if self.enable_printing:
-                        WARNING('File \'%s\' could not be found for run number \'%s\' -- skipping.' % (filetype, run_number))
-                    status |= False
+                        INFO(Colours.BOLD + Colours.GREEN + 'Successfully' + Colours.ENDC + ' uploaded file \'%s\' for run number \'%s\'.' % (attachment.path, run_number))
+                else:
+                    status = False
+                    if self.enable_printing:
+                        WARNING('File \'%s\' could not be uploaded for run number \'%s\': %s' % (attachment.path, run_number, attachment.error))
+            if self.enable_printing and uploader is not None:
+                INFO('Uploaded %s.' % uploader.progress)
             return status
         else:
             return True
@@ -762,6 +346,7 @@ class ResultsFolder(object):
             self.ps_folder_path = os.path.dirname(ps_folder_path) if ps_folder_path != None else None
             self.config_folder_path = os.path.dirname(config_folder_path) if config_folder_path != None else None
         self.files = []
+        self.file_indices = {}
         self.iter_index = 0
         self.enable_printing = enable_printing
 
@@ -775,6 +360,7 @@ class ResultsFolder(object):
             self.ps_folder_path = os.path.dirname(ps_folder_path) if ps_folder_path != None else None
             self.config_folder_path = os.path.dirname(config_folder_path) if config_folder_path != None else None
         self.files = []
+        self.file_indices = {}
         self.iter_index = 0
         self.enable_printing = enable_printing
 
@@ -807,6 +393,40 @@ class ResultsFolder(object):
     # Python 2 iterator fix, see: https://stackoverflow.com/questions/29578469/how-to-make-an-object-both-a-python2-and-python3-iterator
     next = __next__
 
+    # Parse all of the files in self.files (see ResultsFile.getTests()) over a pool of worker processes
+    # Return a list of ResultsFile objects, in the order of self.files, whose tests have been filled in
+    # A file which could not be parsed does not stop the others: its ResultsFile has no tests and results_file.error describes the failure
+    # workers := number of processes (None := one per CPU, 1 := parse serially in this process), arrays := see ResultsFile.iterTests()
+    # journal := uploadJournal.UploadJournal, if not None only the files which changed since they were last parsed are parsed again
+    # (the journal only keeps the parses of the default, list mode)
+    def parseAll(self, workers = None, arrays = False, journal = None):
+        journal = journal if not arrays else None
+        parsed = [journal.getParsed(file) if journal is not None else None for file in self.files]
+        fresh = iter(parseFiles([file for file, result in zip(self.files, parsed) if result is None], workers = workers, arrays = arrays))
+        results_files = []
+        for file, result in zip(self.files, parsed):
+            if result is None:
+                result = next(fresh)
+                if journal is not None:
+                    journal.putParsed(file, *result)
+            tests, full_test, error = result
+            results_file = ResultsFile(file, enable_printing = self.enable_printing)
+            results_file.tests = tests
+            results_file.error = error
+            if full_test is not None:
+                results_file.full_test.update({'state': True, 'lower_index': full_test[0], 'upper_index': full_test[1]})
+            if error is not None and self.enable_printing:
+                WARNING('Could not parse \'%s\' -- %s' % (file, error))
+            results_files.append(results_file)
+        return results_files
+
+    # Resolve the components of all of the tests in results_files (ResultsFile objects, e.g., from parseAll()) in as few calls as possible
+    # Return the componentResolver.ComponentResolver, to be passed to ResultsFile.finalizeTest()
+    def resolveComponents(self, results_files, ITkPDSession, resolver = None):
+        resolver = resolver if resolver is not None else ComponentResolver(ITkPDSession)
+        resolver.resolveTests([test for results_file in results_files for test in results_file.tests])
+        return resolver
+
     # Define a function for finding all of the results summary files in SCTVAR
     # depth := level of recursion in SCTVAR/results/ (0 := just search in /results/, 1 := one level deeper, etc.)
     # extension := file extension for results summary files
@@ -853,21 +473,14 @@ class ResultsFolder(object):
             pass
 
     # Find a file available in the results folder file structure up to a certain depth
+    # Each folder is only walked once (see fileIndex.FileIndex), later lookups go through its index
     def findFile(self, filename, folder, depth = 0):
-        ignore_folders = ['IGNORE']
-        regex = re.compile(r'^(?=.*' + r')(?=.*'.join(os.path.splitext(filename)[0][:-1].split('_')) + r').*$')
         if folder == 'results':
             folder = self.results_folder_path
         elif folder == 'ps':
             folder = self.ps_folder_path
         elif folder == 'config':
             folder = self.config_folder_path
-        for root, dirs, files in os.walk(folder):
-            dirs = [d for d in dirs if d not in ignore_folders]
-            if root[len(folder):].count(os.sep) < (depth + 1):
-                for file in files:
-                    if filename == file:
-                        return os.path.join(root, filename)
-                    elif regex.search(file):
-                        return os.path.join(root, file)
-        return None
+        if (folder, depth) not in self.file_indices:
+            self.file_indices[(folder, depth)] = FileIndex(folder, depth = depth)
+        return self.file_indices[(folder, depth)].find(filename)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# asyncAccess.py -- an asyncio counterpart to dbAccess.ITkPDSession (Python 3 only)
+# Many uuCMDs can be in flight at once on a single event loop, bounded by a concurrency limiter
+# aiohttp is used if it is installed, otherwise requests are run in the default executor on the pooled dbAccess transport
+
+import asyncio, functools, getpass, json, os
+
+import requests
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    from requests_toolbelt.multipart.encoder import MultipartEncoder
+except ImportError:
+    MultipartEncoder = None
+
+from itk_pdb.dbAccess import _AUTH_URL, _SITE_URL, dbAccessError, getTransport, pp
+
+# Define our asynchronous session
+# max_concurrency := maximum number of requests in flight at once
+# session := an (authenticated) ITkPDSession whose token should be shared, i.e., token refreshes on that session are picked up here too
+# token := an explicit token (ignored if session has one)
+class AsyncITkPDSession(object):
+
+    def __init__(self, enable_printing = True, max_concurrency = 16, session = None, token = None):
+        if max_concurrency < 1:
+            raise ValueError('max_concurrency must be >= 1: %s' % max_concurrency)
+        self.enable_printing = enable_printing
+        self.max_concurrency = max_concurrency
+        self.session = session
+        self.token = token
+        self.dbAccessString = '\033[1m' + '\033[97m' + 'dbAccess:' + '\033[0m' + ' '
+        self.__semaphore = None
+        self.__client = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    # Close the underlying aiohttp client (if any)
+    async def close(self):
+        if self.__client is not None:
+            await self.__client.close()
+            self.__client = None
+
+    def __sessionPrinter(self, string, style = None):
+        if self.enable_printing:
+            if style in ['h', 'header']:
+                print(self.dbAccessString + string)
+            elif style in ['p', 'pretty']:
+                pp.pprint(string)
+            else:
+                print(string)
+
+    # The semaphore and client must be created inside the running event loop
+    def __getSemaphore(self):
+        if self.__semaphore is None:
+            self.__semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self.__semaphore
+
+    def __getClient(self):
+        if self.__client is None:
+            connector = aiohttp.TCPConnector(limit = self.max_concurrency)
+            self.__client = aiohttp.ClientSession(connector = connector, headers = {'Accept-Encoding': 'gzip, deflate'})
+        return self.__client
+
+    def __getToken(self):
+        if self.session is not None and self.session.tokenManager is not None:
+            return self.session.tokenManager.token()
+        if self.session is not None and self.session.token is not None:
+            return self.session.token
+        return self.token
+
+    def updateToken(self, token):
+        self.token = token
+
+    async def authenticate(self, accessCode1 = None, accessCode2 = None):
+        self.__sessionPrinter('Getting token.', 'h')
+        if os.getenv('ITK_DB_AUTH'):
+            self.__sessionPrinter('Token already exists in shell environment.', 'h')
+            self.token = os.getenv('ITK_DB_AUTH')
+        else:
+            data = {'grant_type': 'password'}
+            if accessCode1 is None or accessCode2 is None:
+                data['accessCode1'] = getpass.getpass(self.dbAccessString + 'Enter AccessCode 1:')
+                data['accessCode2'] = getpass.getpass(self.dbAccessString + 'Enter AccessCode 2:')
+            else:
+                data['accessCode1'] = accessCode1
+                data['accessCode2'] = accessCode2
+            self.__sessionPrinter('Sending credentials to get a token.', 'h')
+            token = await self.doSomething(action = 'grantToken', method = 'POST', data = data, url = _AUTH_URL)
+            self.token = token['id_token']
+        return self.token
+
+    # Encode data the same way as ITkPDSession.doSomething
+    def __encode(self, data):
+        headers = {'Content-Type': 'application/json'}
+        token = self.__getToken()
+        if token is not None:
+            headers['Authorization'] = 'Bearer ' + token
+        if data is None:
+            return b'{}', headers
+        if MultipartEncoder is not None and isinstance(data, MultipartEncoder):
+            headers['Content-Type'] = data.content_type
+            return data, headers
+        if type(data) is bytes:
+            return data, headers
+        return json.dumps(data).encode('utf-8'), headers
+
+    # Decode the response the same way as ITkPDSession.doSomething (including the uuAppErrorMap printout for bad status codes)
+    def __decode(self, url, status, text, headers):
+        if status != 200:
+            self.__sessionPrinter('Bad status code.', 'h')
+            self.__sessionPrinter('requests status code: %s' % status, 'h')
+            self.__sessionPrinter('requests header:', 'h')
+            self.__sessionPrinter(dict(headers), 'p')
+            try:
+                uuAppErrorMap = json.loads(text)['uuAppErrorMap']
+                self.__sessionPrinter('uAppErrorMap:', 'h')
+                self.__sessionPrinter(uuAppErrorMap, 'p')
+            except (KeyError, ValueError, TypeError):
+                self.__sessionPrinter('No uuAppErrorMap available.', 'h')
+                self.__sessionPrinter('requests text:', 'h')
+                self.__sessionPrinter(text, 'h')
+            raise requests.exceptions.HTTPError('%s Error for url: %s' % (status, url))
+        try:
+            return json.loads(text)
+        except ValueError:
+            self.__sessionPrinter('No json could be decoded.', 'h')
+            return text
+
+    async def __request(self, action, method, data = None, url = _SITE_URL):
+        if method not in ['GET', 'POST']:
+            self.__sessionPrinter('Unknown method \'{0}\'.'.format(method), 'h')
+            raise dbAccessError('Unknown method \'%s\'' % method)
+        body, headers = self.__encode(data)
+        async with self.__getSemaphore():
+
+            # Multipart bodies are streamed by requests_toolbelt, so those always go through requests
+            if aiohttp is not None and not (MultipartEncoder is not None and isinstance(body, MultipartEncoder)):
+                async with self.__getClient().request(method, url + action, data = body, headers = headers) as response:
+                    text = await response.text()
+                    return self.__decode(url + action, response.status, text, response.headers)
+            else:
+                loop = asyncio.get_running_loop()
+                response = await loop.run_in_executor(None, functools.partial(getTransport().request, method, url + action, data = body, headers = headers))
+                return self.__decode(url + action, response.status_code, response.text, response.headers)
+
+    async def doSomething(self, action, method, data = None, url = _SITE_URL):
+        dataOut = await self.__request(action, method, data = data, url = url)
+        if 'pageItemList' in dataOut:
+            return dataOut['pageItemList']
+        elif 'itemList' in dataOut:
+            return dataOut
+        else:
+            return dataOut
+
+    # Run many commands (dictionaries of doSomething kwargs) concurrently and return their outputs in order
+    # If return_exceptions, failed commands return their exception rather than cancelling the others
+    async def doMany(self, commands, return_exceptions = False):
+        return await asyncio.gather(*[self.doSomething(**command) for command in commands], return_exceptions = return_exceptions)
+
+# Convenience function for synchronous callers (e.g., a worker thread): run the commands on a fresh event loop and return their outputs in order
+def runMany(commands, session = None, token = None, max_concurrency = 16, enable_printing = True, return_exceptions = False):
+    async def run():
+        async with AsyncITkPDSession(enable_printing = enable_printing, max_concurrency = max_concurrency, session = session, token = token) as asyncSession:
+            return await asyncSession.doMany(commands, return_exceptions = return_exceptions)
+    return asyncio.run(run())
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# attachmentUploader.py -- a concurrent pipeline for uploading component attachments (createComponentAttachment)
+# Each file is streamed from disk by a MultipartEncoder (never read into memory as a whole), several uploads run at once over a thread pool
+# (with at most per_host of them going to the same host), progress and throughput are reported as the bytes are sent, and the file
+# handles are always closed, whether the upload succeeds or not
+
+import os, threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+try:
+    from requests_toolbelt.multipart.encoder import MultipartEncoder
+except ImportError:
+    MultipartEncoder = None
+
+DEFAULT_WORKERS = 4
+DEFAULT_PER_HOST = 4
+
+# Define an attachment to upload
+# key := anything identifying the attachment to the caller (e.g., the filetype of an ITSDAQ test file)
+# url := site to upload to (None := the session's default)
+# After the upload: status is True/False, error is the exception which made it fail, elapsed is the duration of the upload [s]
+class Attachment(object):
+
+    def __init__(self, component, path, title = None, description = '', key = None, url = None):
+        self.component = component
+        self.path = path
+        self.title = title if title is not None else os.path.basename(path)
+        self.description = description
+        self.key = key
+        self.url = url
+        self.size = os.path.getsize(path) if os.path.isfile(path) else 0
+        self.sent = 0
+        self.status = None
+        self.error = None
+        self.elapsed = None
+
+    def __repr__(self):
+        return 'Attachment(%s, %s, status = %s)' % (self.component, self.path, self.status)
+
+# A file object counting the bytes read from it (by the MultipartEncoder, i.e., as they are sent)
+# fileno() lets the encoder take the length of the body from the file, without reading it
+class _CountingFile(object):
+
+    def __init__(self, file, callback):
+        self.file = file
+        self.callback = callback
+
+    def read(self, size = -1):
+        chunk = self.file.read(size)
+        if chunk:
+            self.callback(len(chunk))
+        return chunk
+
+    def fileno(self):
+        return self.file.fileno()
+
+# Progress of a batch of uploads (updated from the worker threads)
+class Progress(object):
+
+    def __init__(self, attachments):
+        self.files = len(attachments)
+        self.total_bytes = sum(attachment.size for attachment in attachments)
+        self.sent_bytes = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    @property
+    def finished(self):
+        return self.succeeded + self.failed
+
+    # Average throughput since the start [bytes/s]
+    def throughput(self):
+        elapsed = time.time() - self.started
+        return self.sent_bytes / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self):
+        return '%s/%s files (%s failed), %.1f/%.1f MB, %.2f MB/s' % (self.finished, self.files, self.failed, self.sent_bytes / 1e6,
+                                                                    self.total_bytes / 1e6, self.throughput() / 1e6)
+
+# Define our uploader
+# session := (authenticated) ITkPDSession, or anything with the same doSomething(action, method, data, url)
+# workers := number of uploads in flight at once, per_host := of which at most this many to the same host
+# callback := function(attachment, progress) called (from the worker threads) whenever bytes have been sent and when an upload ends
+class AttachmentUploader(object):
+
+    def __init__(self, session, workers = DEFAULT_WORKERS, per_host = DEFAULT_PER_HOST, callback = None):
+        if workers < 1 or per_host < 1:
+            raise ValueError('workers and per_host must be >= 1: %s, %s' % (workers, per_host))
+        if MultipartEncoder is None:
+            raise ImportError('AttachmentUploader requires requests_toolbelt')
+        self.session = session
+        self.workers = workers
+        self.per_host = per_host
+        self.callback = callback
+        # Progress of the last batch
+        self.progress = None
+        self.__hosts = {}
+        self.__lock = threading.Lock()
+
+    def __hostLimit(self, url):
+        host = urlparse(url).netloc if url is not None else None
+        with self.__lock:
+            if host not in self.__hosts:
+                self.__hosts[host] = threading.BoundedSemaphore(self.per_host)
+            return self.__hosts[host]
+
+    def __upload(self, attachment, progress):
+        def sent(n):
+            with progress.lock:
+                attachment.sent += n
+                progress.sent_bytes += n
+            if self.callback is not None:
+                self.callback(attachment, progress)
+        start = time.time()
+        with self.__hostLimit(attachment.url):
+            try:
+                with open(attachment.path, 'rb') as file:
+                    fields = {  'data': (os.path.basename(attachment.path), _CountingFile(file, sent)),
+                                'type': 'file',
+                                'component': attachment.component,
+                                'title': attachment.title,
+                                'description': attachment.description  }
+                    kwargs = {'url': attachment.url} if attachment.url is not None else {}
+                    self.session.doSomething(action = 'createComponentAttachment', method = 'POST', data = MultipartEncoder(fields = fields), **kwargs)
+                attachment.status = True
+            except Exception as e:
+                attachment.status = False
+                attachment.error = e
+        attachment.elapsed = time.time() - start
+        with progress.lock:
+            if attachment.status:
+                progress.succeeded += 1
+            else:
+                progress.failed += 1
+        if self.callback is not None:
+            self.callback(attachment, progress)
+
+    # Upload the attachments, returning them (with their status and error filled in) once they have all finished
+    # A failed upload does not stop the others
+    def upload(self, attachments):
+        attachments = list(attachments)
+        progress = Progress(attachments)
+        if attachments:
+            executor = ThreadPoolExecutor(max_workers = min(self.workers, len(attachments)))
+            try:
+                for future in [executor.submit(self.__upload, attachment, progress) for attachment in attachments]:
+                    future.result()
+            finally:
+                executor.shutdown(wait = True)
+        self.progress = progress
+        return attachments
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# componentFetcher.py -- bulk getComponent with deduplication, memoization and a parallel fan-out over a worker pool
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+DEFAULT_WORKERS = 8
+
+# Define our ComponentFetcher object
+# getComponent := function taking a component code (or serial number) and returning the component's JSON
+# workers := size of the worker pool used by getComponents()
+# Every component fetched is memoized under the identifier it was requested by as well as its code and serial number
+class ComponentFetcher(object):
+
+    def __init__(self, getComponent, workers = DEFAULT_WORKERS):
+        if workers < 1:
+            raise ValueError('workers must be >= 1: %s' % workers)
+        self.getComponent = getComponent
+        self.workers = workers
+        self.memo = {}
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.memo)
+
+    def __remember(self, identifier, component):
+        with self.__lock:
+            self.memo[identifier] = component
+            if isinstance(component, dict):
+                for key in ['code', 'serialNumber']:
+                    if component.get(key) is not None:
+                        self.memo[component[key]] = component
+
+    # Forget the given identifiers (e.g., after a component was modified), or everything if identifiers is None
+    # Identifiers are compared case-insensitively, and a component is forgotten under all of the identifiers it was memoized as
+    def forget(self, identifiers = None):
+        with self.__lock:
+            if identifiers is None:
+                self.memo.clear()
+                return
+            identifiers = set(identifier.lower() for identifier in identifiers)
+            components = [component for identifier, component in self.memo.items() if identifier.lower() in identifiers]
+            for identifier, component in list(self.memo.items()):
+                if identifier.lower() in identifiers or any(component is other for other in components):
+                    del self.memo[identifier]
+
+    # Fetch (or recall) a single component
+    def get(self, identifier):
+        with self.__lock:
+            if identifier in self.memo:
+                return self.memo[identifier]
+        component = self.getComponent(identifier)
+        self.__remember(identifier, component)
+        return component
+
+    # Generate (identifier, component) pairs for every distinct identifier in identifiers, in order of completion
+    # Memoized components are yielded first, the rest are fetched concurrently over the worker pool
+    # If return_exceptions, a failed fetch yields (identifier, exception), else the first failure is raised (and pending fetches cancelled)
+    # workers := overrides self.workers for this call
+    def getComponents(self, identifiers, workers = None, return_exceptions = False):
+        seen = set()
+        missing = []
+        for identifier in identifiers:
+            if identifier in seen:
+                continue
+            seen.add(identifier)
+            with self.__lock:
+                component = self.memo.get(identifier)
+            if component is not None:
+                yield identifier, component
+            else:
+                missing.append(identifier)
+        if not missing:
+            return
+
+        executor = ThreadPoolExecutor(max_workers = min(workers if workers is not None else self.workers, len(missing)))
+        futures = {}
+        try:
+            futures = dict((executor.submit(self.getComponent, identifier), identifier) for identifier in missing)
+            for future in as_completed(futures):
+                identifier = futures[future]
+                try:
+                    component = future.result()
+                except Exception as error:
+                    if return_exceptions:
+                        yield identifier, error
+                        continue
+                    raise
+                self.__remember(identifier, component)
+                yield identifier, component
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait = False)
+
+    # Same as getComponents(), but wait for everything and return a dictionary {identifier: component}
+    def getComponentsDict(self, identifiers, workers = None, return_exceptions = False):
+        return dict(self.getComponents(identifiers, workers = workers, return_exceptions = return_exceptions))
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# componentResolver.py -- resolve the serial numbers (or local names/RFIDs) found in ITSDAQ results files to ITkPD components in bulk
+# All of the distinct identifiers of a batch of tests are resolved at once: valid serial numbers are fetched concurrently through the
+# session's (memoized) getComponents, and everything else is looked up with a few (paged) listComponentsByProperty calls, each of which
+# carries the LOCALNAME/LOCAL_NAME/RFID filters of many identifiers (a component matches if any of its filters does)
+# Identifiers which a batch does not match at all are looked up again on their own, as they always were, so nothing is reported as not
+# found just because the server combined the filters of a batch differently
+
+# Number of identifiers per listComponentsByProperty call
+BATCH_SIZE = 50
+
+# Properties which may hold the identifier written in a results file in place of a serial number
+NAME_PROPERTIES = ['LOCALNAME', 'LOCAL_NAME', 'RFID']
+
+# Check if the serial number for a component is a valid ATLAS ITk serial number
+# See: https://indico.cern.ch/event/718637/contributions/2963483/attachments/1634097/2607226/serial_numbers_testbeam2.pdf
+def checkSerialNumber(serial_number):
+    XX = ['SB', 'SE', 'SG', 'PB', 'PE', 'PG']
+    YY = ['HX', 'HY', 'H0', 'H1', 'H2', 'H3', 'H4', 'H5', 'ML', 'MS', 'M0', 'M1', 'M2', 'M3', 'M4', 'M5', 'P0', 'P1', 'P2', 'P3', 'P4', 'P5', 'AB', 'AH', 'AA', 'AM', '00']
+    if ((serial_number[0:3] == '20U') and (len(serial_number) == 14) and (serial_number[3:5] in XX) and (serial_number[5:7] in YY)
+        and (serial_number[7] in ['0', '1', '2', '3']) and (serial_number[8] in ['0', '1', '2']) and serial_number[9:].isdigit()):
+        return True
+    else:
+        return False
+
+# The local name of a component (its LOCALNAME or LOCAL_NAME property), or None
+def localName(component):
+    name = None
+    for property in component.get('properties') or []:
+        if (property['code'] == 'LOCALNAME') or (property['code'] == 'LOCAL_NAME'):
+            name = property['value']
+    return name
+
+# Define our resolver
+# ITkPDSession := (authenticated) ITkPDSession
+# project, componentType := where components are looked up by local name/RFID
+class ComponentResolver(object):
+
+    def __init__(self, ITkPDSession, project = 'S', componentType = 'HYBRID', batch_size = BATCH_SIZE):
+        self.ITkPDSession = ITkPDSession
+        self.project = project
+        self.componentType = componentType
+        self.batch_size = batch_size
+        # {identifier: component, None (not found/ambiguous) or the exception raised when fetching it}
+        self.resolved = {}
+
+    def __len__(self):
+        return len(self.resolved)
+
+    # Resolve every distinct identifier (serial number, local name or RFID) in identifiers which has not been resolved yet
+    def resolve(self, identifiers):
+        serial_numbers, names = [], []
+        seen = set(self.resolved)
+        for identifier in identifiers:
+            if identifier in seen:
+                continue
+            seen.add(identifier)
+            (serial_numbers if checkSerialNumber(identifier) else names).append(identifier)
+        if serial_numbers:
+            for identifier, component in self.ITkPDSession.getComponents(serial_numbers, return_exceptions = True):
+                self.resolved[identifier] = component
+        for i in range(0, len(names), self.batch_size):
+            self.__resolveNames(names[i:i + self.batch_size])
+
+    # Resolve the identifiers of a list of tests (dictionaries, as in ResultsFile.tests)
+    def resolveTests(self, tests):
+        self.resolve([test['JSON']['properties']['SERIAL_NUMBER'] for test in tests if test['JSON']['properties'].get('SERIAL_NUMBER')])
+
+    # Every page of the components matching any of the LOCALNAME/LOCAL_NAME/RFID filters of names
+    def __listByName(self, names):
+        property_filter = [{'code': code, 'operator': '=', 'value': name} for name in names for code in NAME_PROPERTIES]
+        return list(self.ITkPDSession.doSomethingPaged(action = 'listComponentsByProperty', method = 'POST',
+                                                        data = {'project': self.project, 'componentType': self.componentType, 'propertyFilter': property_filter}))
+
+    def __resolveNames(self, names):
+        component_list = self.__listByName(names)
+
+        # Each name must match exactly one component, or else we did not find the proper component (e.g., maybe local name is not unique?)
+        if len(names) == 1:
+            self.resolved[names[0]] = component_list[0] if len(component_list) == 1 else None
+            return
+        matches = dict((name, []) for name in names)
+        for component in component_list:
+            values = set(property['value'] for property in component.get('properties') or [] if property['code'] in NAME_PROPERTIES)
+            for name in values.intersection(matches):
+                matches[name].append(component)
+        for name in names:
+            if matches[name] == []:
+                self.__resolveNames([name])
+            else:
+                self.resolved[name] = matches[name][0] if len(matches[name]) == 1 else None
+
+    # The component for an identifier (resolving it if needed), None if it could not be identified
+    # Errors raised when fetching a valid serial number are raised again
+    def get(self, identifier):
+        if identifier not in self.resolved:
+            self.resolve([identifier])
+        component = self.resolved[identifier]
+        if isinstance(component, Exception):
+            raise component
+        return component
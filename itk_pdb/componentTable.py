@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# componentTable.py -- a compact, columnar (NumPy) representation of component listings
+# A listing (e.g., from listComponents) is converted once into flat arrays: codes/serial numbers as fixed-width byte strings, nested
+# {'code': ...} objects as interned category indices, cts/stage dateTimes as datetime64 and flags as small integers
+# Filtering and grouping then become vectorised array operations rather than walks over lists of nested dictionaries
+
+import array
+import numpy as np
+
+# Columns holding the code of a nested {'code': ...} object (or a plain string), stored as indices into a Categories object
+CATEGORY_COLUMNS    = ['project', 'subproject', 'componentType', 'type', 'currentStage', 'institution', 'currentLocation', 'qaState']
+
+# Boolean columns, stored as int8 (1 = True, 0 = False, MISSING = not set)
+FLAG_COLUMNS        = ['trashed', 'dummy', 'assembled', 'reworked', 'qaPassed', 'qaTested']
+
+# Columns of (ASCII) identifiers, stored as fixed-width byte strings
+STRING_COLUMNS      = ['code', 'serialNumber']
+
+MISSING = -1
+
+# Components are converted in blocks of this many rows, so that only a block's worth of Python strings is ever held at once
+BLOCK_SIZE = 65536
+
+def _code(value):
+    if isinstance(value, dict):
+        return value.get('code')
+    return value
+
+def _flag(value):
+    return MISSING if value is None else int(bool(value))
+
+# Grades are numbers (or numeric strings): anything else is stored as missing rather than failing the whole table
+def _grade(value):
+    try:
+        return float(value) if value is not None else np.nan
+    except (TypeError, ValueError):
+        return np.nan
+
+# '2019-01-28T10:11:12.123Z' -> '2019-01-28T10:11:12.123' (NumPy does not accept the timezone designator)
+def _timestamp(value):
+    if not value:
+        return 'NaT'
+    return value[:-1] if value.endswith('Z') else value
+
+def _datetimes(values):
+    try:
+        return np.array(values, dtype = 'datetime64[ms]')
+    except ValueError:
+        out = np.empty(len(values), dtype = 'datetime64[ms]')
+        for i, value in enumerate(values):
+            try:
+                out[i] = np.datetime64(value, 'ms')
+            except ValueError:
+                out[i] = np.datetime64('NaT')
+        return out
+
+def _strings(values):
+    return np.array([(value or '').encode('ascii', 'replace') for value in values], dtype = 'S')
+
+# Interned category codes: each distinct code is stored once and referred to by its index
+class Categories(object):
+
+    def __init__(self, values = None):
+        self.values = []
+        self.index = {}
+        for value in values or []:
+            self.encode(value)
+
+    def __len__(self):
+        return len(self.values)
+
+    def encode(self, value):
+        if value is None:
+            return MISSING
+        i = self.index.get(value)
+        if i is None:
+            i = self.index[value] = len(self.values)
+            self.values.append(value)
+        return i
+
+    def decode(self, i):
+        return self.values[i] if i >= 0 else None
+
+    # Indices of the given values (values which never occur are dropped)
+    def lookup(self, values):
+        return np.array([self.index[value] for value in values if value in self.index], dtype = np.int32)
+
+# Define our table
+# Use ComponentTable.fromComponents(components) to build one from a listing (any iterable of component JSONs, e.g., a stream)
+class ComponentTable(object):
+
+    def __init__(self, columns, categories, stageOffsets, stageCodes, stageTimes):
+        self.columns = columns
+        self.categories = categories
+        self.stageOffsets = stageOffsets
+        self.stageCodes = stageCodes
+        self.stageTimes = stageTimes
+
+    @classmethod
+    def fromComponents(cls, components):
+
+        # Stage codes share their categories with currentStage, so the two can be compared directly
+        categories = dict((name, Categories()) for name in CATEGORY_COLUMNS)
+        indices = dict((name, array.array('i')) for name in CATEGORY_COLUMNS)
+        flags = dict((name, array.array('b')) for name in FLAG_COLUMNS)
+        grades = array.array('d')
+        stageCounts = array.array('l')
+        stageCodes = array.array('i')
+        blocks = dict((name, []) for name in STRING_COLUMNS + ['cts', 'stageTimes'])
+        pending = dict((name, []) for name in blocks)
+
+        def flush():
+            for name, values in pending.items():
+                if values:
+                    blocks[name].append(_datetimes(values) if name in ['cts', 'stageTimes'] else _strings(values))
+                    del values[:]
+
+        for component in components:
+            for name in CATEGORY_COLUMNS:
+                indices[name].append(categories[name].encode(_code(component.get(name))))
+            for name in FLAG_COLUMNS:
+                flags[name].append(_flag(component.get(name)))
+            grades.append(_grade(component.get('currentGrade')))
+            for name in STRING_COLUMNS:
+                pending[name].append(component.get(name))
+            pending['cts'].append(_timestamp(component.get('cts')))
+            stages = component.get('stages') or []
+            stageCounts.append(len(stages))
+            for stage in stages:
+                stageCodes.append(categories['currentStage'].encode(stage.get('code')))
+                pending['stageTimes'].append(_timestamp(stage.get('dateTime')))
+            if len(pending['cts']) >= BLOCK_SIZE:
+                flush()
+        flush()
+
+        columns = {}
+        for name in CATEGORY_COLUMNS:
+            columns[name] = np.frombuffer(indices[name], dtype = np.int32).copy() if len(indices[name]) else np.zeros(0, dtype = np.int32)
+        for name in FLAG_COLUMNS:
+            columns[name] = np.frombuffer(flags[name], dtype = np.int8).copy() if len(flags[name]) else np.zeros(0, dtype = np.int8)
+        columns['currentGrade'] = np.array(grades, dtype = np.float64)
+        for name in STRING_COLUMNS:
+            columns[name] = np.concatenate(blocks[name]) if blocks[name] else np.zeros(0, dtype = 'S1')
+        columns['cts'] = np.concatenate(blocks['cts']) if blocks['cts'] else np.zeros(0, dtype = 'datetime64[ms]')
+        stageOffsets = np.zeros(len(stageCounts) + 1, dtype = np.int64)
+        np.cumsum(np.array(stageCounts, dtype = np.int64), out = stageOffsets[1:])
+        return cls(columns, categories, stageOffsets, np.array(stageCodes, dtype = np.int32),
+                    np.concatenate(blocks['stageTimes']) if blocks['stageTimes'] else np.zeros(0, dtype = 'datetime64[ms]'))
+
+    def __len__(self):
+        return len(self.columns['cts'])
+
+    # Total size of the arrays (in bytes)
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self.columns.values()) + self.stageOffsets.nbytes + self.stageCodes.nbytes + self.stageTimes.nbytes
+
+    def column(self, name):
+        return self.columns[name]
+
+    # Creation day of each component
+    def days(self, mask = None):
+        cts = self.columns['cts'] if mask is None else self.columns['cts'][mask]
+        return cts.astype('datetime64[D]')
+
+    # Boolean mask of the rows whose value for column name is one of values (missing values never match)
+    def isIn(self, name, values):
+        column = self.columns[name]
+        if name in self.categories:
+            return np.isin(column, self.categories[name].lookup(values))
+        if name in FLAG_COLUMNS:
+            return np.isin(column, [_flag(value) for value in values if value is not None])
+        if name in STRING_COLUMNS:
+            return np.isin(column, _strings(values))
+        return np.isin(column, values)
+
+    # Boolean mask of the rows whose column name is set (not None)
+    def isSet(self, name):
+        column = self.columns[name]
+        if name in self.categories or name in FLAG_COLUMNS:
+            return column != MISSING
+        if name == 'currentGrade':
+            return ~np.isnan(column)
+        if name == 'cts':
+            return ~np.isnat(column)
+        return column != b''
+
+    # Boolean mask of the rows created between lower and upper (inclusive, 'YYYY-MM-DD', either may be None)
+    def dateMask(self, lower = None, upper = None):
+        days = self.days()
+        mask = ~np.isnat(days)
+        if lower is not None:
+            mask &= days >= np.datetime64(lower, 'D')
+        if upper is not None:
+            mask &= days <= np.datetime64(upper, 'D')
+        return mask
+
+    # Number of rows (in mask) for each code of category column name, {code: count}
+    def groupCounts(self, name, mask = None):
+        column = self.columns[name] if mask is None else self.columns[name][mask]
+        counts = np.bincount(column[column != MISSING], minlength = len(self.categories[name]))
+        return dict((code, int(counts[i])) for i, code in enumerate(self.categories[name].values) if counts[i] > 0)
+
+    # Row indices (in mask) for each code of category column name, {code: indices}
+    def groupIndices(self, name, mask = None):
+        column = self.columns[name]
+        rows = np.arange(len(self)) if mask is None else np.nonzero(mask)[0]
+        values = column[rows]
+        order = np.argsort(values, kind = 'mergesort')
+        values, rows = values[order], rows[order]
+        bounds = np.nonzero(np.diff(values))[0] + 1
+        groups = {}
+        for chunk, value in zip(np.split(rows, bounds), values[np.concatenate([[0], bounds])] if len(values) else []):
+            if value != MISSING:
+                groups[self.categories[name].values[value]] = chunk
+        return groups
+
+    # Decoded value of column name at row i (None if missing)
+    def value(self, name, i):
+        value = self.columns[name][i]
+        if name in self.categories:
+            return self.categories[name].decode(value)
+        if name in FLAG_COLUMNS:
+            return None if value == MISSING else bool(value)
+        if name in STRING_COLUMNS:
+            return value.decode('ascii') if value != b'' else None
+        if name == 'currentGrade':
+            # Grades are stored as floats: integral grades are given back as ints, the others as they are
+            return None if np.isnan(value) else int(value) if float(value).is_integer() else float(value)
+        if name == 'cts':
+            return None if np.isnat(value) else str(value) + 'Z'
+        return value
+
+    # Decoded (code, dateTime) stages of row i
+    def stages(self, i):
+        start, end = self.stageOffsets[i], self.stageOffsets[i + 1]
+        return [(self.categories['currentStage'].decode(code), str(time) + 'Z' if not np.isnat(time) else None)
+                    for code, time in zip(self.stageCodes[start:end], self.stageTimes[start:end])]
+
+    # Generate one dictionary of decoded values per row (in mask), for the given columns (default: all)
+    def rows(self, mask = None, columns = None):
+        columns = columns if columns is not None else list(self.columns.keys())
+        for i in (range(len(self)) if mask is None else np.nonzero(mask)[0]):
+            yield dict((name, self.value(name, i)) for name in columns)
+
+    # A new table with only the rows in mask (a boolean mask or an array of row indices)
+    def subset(self, mask):
+        rows = np.nonzero(mask)[0] if np.asarray(mask).dtype == bool else np.asarray(mask)
+        columns = dict((name, column[rows]) for name, column in self.columns.items())
+        counts = np.diff(self.stageOffsets)[rows]
+        stageOffsets = np.zeros(len(rows) + 1, dtype = np.int64)
+        np.cumsum(counts, out = stageOffsets[1:])
+        stageRows = np.arange(stageOffsets[-1]) - np.repeat(stageOffsets[:-1], counts) + np.repeat(self.stageOffsets[rows], counts)
+        return ComponentTable(columns, self.categories, stageOffsets, self.stageCodes[stageRows], self.stageTimes[stageRows])
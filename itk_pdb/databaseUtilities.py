@@ -4,6 +4,9 @@
 # Written by Matthew Basso
 
 import itk_pdb.dbAccess as dbAccess, os, sys, collections
+from itk_pdb.pagination import PageIterator, streamPages, DEFAULT_PAGE_SIZE, DEFAULT_WINDOW
+from itk_pdb.componentFetcher import ComponentFetcher, DEFAULT_WORKERS
+from itk_pdb.responseCache import isIdempotent, componentTags
 
 # Fix the str (python3) versus basestring (Python2) issue
 # See: https://stackoverflow.com/questions/11301138/how-to-check-if-variable-is-string-with-python-2-and-3-compatibility
@@ -101,11 +104,13 @@ class StandardCommand(object):
     # Define our init function
     # required_args := keyword arguments requied by the uuCMD
     # allowed_args := keyword arguments allowed by the uuCMD (not exhaustive)
+    # _paged := the uuCMD accepts pageInfo, in which case run() fetches every page unless a page is explicitly requested
     def __init__(self, *args):
         self._action = args[0]
         self._method = args[1]
         self._required_args = args[3]
         self._allowed_args = self._required_args + [arg for arg in args[2] if arg not in self._required_args]
+        self._paged = 'pageInfo__pageIndex' in self._allowed_args
 
     # Check that the arguments pass to run are (a) allowed and (b) meet the required arguments
     # Arguments like '<something>__<something else>' create a dictionary <something> containing a dictionary <something else>
@@ -114,7 +119,7 @@ class StandardCommand(object):
             if arg not in kwargs.keys():
                 print('databaseUtilities.py: Keyword argument \'{0}\' is required for command \'{1}\' -- EXITING'.format(arg, self._action))
                 sys.exit(1)
-        for k in kwargs.keys():
+        for k in list(kwargs.keys()):
             if k not in self._allowed_args:
                 print('databaseUtilities.py: Keyword argument \'{0}\' is not allowed for command \'{1}\' -- EXITING'.format(k, self._action))
                 sys.exit(1)
@@ -127,21 +132,31 @@ class StandardCommand(object):
                 del kwargs[k]
         return kwargs
 
+    # Send the uuCMD and return the raw (decoded) response
+    def __send(self, data):
+        data = dbAccess.doSomething(self._action, method = self._method, data = data)
+
+        # The output from requests with python3 is already in utf-8, so we don't want to convert it further
+        # I don't understand .encode() versus .decode() that well, but running it again converts the entire object to binary, so we don't want that
+        if sys.version_info >= (3, 0):
+            return data
+        else:
+            return convertToUTF8(data)
+
     # Define our run function, which sends method as a uuCMD to the database
+    # For paged commands, every page is fetched (see iterate()) unless pageInfo__pageIndex/pageInfo__pageSize are given explicitly
     def run(self, **kwargs):
 
+        if self._paged and 'pageInfo__pageIndex' not in kwargs and 'pageInfo__pageSize' not in kwargs:
+            return list(self.iterate(**kwargs))
+
         # Disable argument checking for uploadTestRunResults (kind of hacky? -- though dictionary can be highly varied!)
         if self._action != 'uploadTestRunResults':
             kwargs = self.__checkArgs(**kwargs)
 
-        data = dbAccess.doSomething(self._action, method = self._method, data = kwargs)
-
-        # The output from requests with python3 is already in utf-8, so we don't want to convert it further
-        # I don't understand .encode() versus .decode() that well, but running it again converts the entire object to binary, so we don't want that
-        if sys.version_info >= (3, 0):
-            pass
-        else:
-            data = convertToUTF8(data)
+        data = self.__send(kwargs)
+        if not isIdempotent(self._action):
+            componentFetcher.forget(componentTags(kwargs))
 
         # If we ask for more multiple components, we can extract this list using the 'pageItemList' key
         # This key is not present for return values with only one component or test, hence the exception
@@ -153,6 +168,29 @@ class StandardCommand(object):
             except KeyError:
                 return data
 
+    # Lazily iterate over every item returned by a paged command
+    # Pages of pageSize items are requested concurrently, with at most window requests in flight, and yielded in order
+    # For commands which are not paged, this simply iterates over the output of run()
+    # stream := decode each page incrementally as it arrives (see jsonStream.JSONListStream), one page at a time, so memory stays flat
+    def iterate(self, pageSize = DEFAULT_PAGE_SIZE, window = DEFAULT_WINDOW, stream = False, **kwargs):
+
+        if not self._paged:
+            data = self.run(**kwargs)
+            return iter(data if isinstance(data, list) else [data])
+
+        kwargs = self.__checkArgs(**kwargs)
+
+        def pageData(pageIndex, pageSize):
+            data = dict(kwargs)
+            data['pageInfo'] = {'pageIndex': pageIndex, 'pageSize': pageSize}
+            return data
+
+        if stream:
+            items = streamPages(lambda pageIndex, pageSize: dbAccess.doSomething(self._action, method = self._method, data = pageData(pageIndex, pageSize), stream = True),
+                                pageSize = pageSize)
+            return items if sys.version_info >= (3, 0) else (convertToUTF8(item) for item in items)
+        return iter(PageIterator(lambda pageIndex, pageSize: self.__send(pageData(pageIndex, pageSize)), pageSize = pageSize, window = window))
+
 # Define a bunch of useful StandardCommands
 SC = StandardCommand
 commands =  {   
@@ -209,3 +247,11 @@ commands =  {
                 'listInstitutions':             SC('listInstitutions', 'GET', ['pageInfo__pageIndex', 'pageInfo__pageSize'], []),
                 'listProjects':                 SC('listProjects', 'GET', ['pageInfo__pageIndex', 'pageInfo__pageSize'], [])
             }
+
+# Memo of the components fetched through getComponents(), shared by everything using the functional API
+componentFetcher = ComponentFetcher(lambda component: commands['getComponent'].run(component = component))
+
+# Generate (component, JSON) pairs for many components (codes or serial numbers), see componentFetcher.ComponentFetcher.getComponents
+# Duplicates are fetched once, memoized components are not fetched again and the rest are fetched over a pool of workers, in order of completion
+def getComponents(components, workers = DEFAULT_WORKERS, return_exceptions = False):
+    return componentFetcher.getComponents(components, workers = workers, return_exceptions = return_exceptions)
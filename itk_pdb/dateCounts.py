@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# dateCounts.py -- cumulative counts of components as a function of time, computed from the creation days of a ComponentTable
+# The days are binned (by day, week or month) into one integer bucket each, every split category is counted with a single np.bincount
+# over (category, bucket) pairs and the cumulative series come from a cumsum, so the cost is linear in the number of components and
+# does not involve any per-component Python work
+
+import numpy as np
+
+from itk_pdb.componentTable import MISSING
+
+# Binnings of the dates, as NumPy datetime units (a bucket is labelled by its first day, weeks start on Monday)
+BINNINGS = {'day': 'D', 'week': 'W', 'month': 'M'}
+
+# 1970-01-01 (day 0 of datetime64[D]) is a Thursday, so weeks are shifted to start on the Monday before it
+_WEEK_SHIFT = np.timedelta64(3, 'D')
+
+# The bucket of each day (datetime64[D])
+def binDays(days, binning = 'day'):
+    if binning not in BINNINGS:
+        raise ValueError('Unknown binning \'%s\', expected one of %s' % (binning, sorted(BINNINGS)))
+    if binning == 'week':
+        return (days + _WEEK_SHIFT).astype('datetime64[W]')
+    return days.astype('datetime64[%s]' % BINNINGS[binning])
+
+# The labels ('YYYY-MM-DD', the first day) of buckets
+def _labels(buckets, binning):
+    days = buckets.astype('datetime64[D]')
+    if binning == 'week':
+        days = days - _WEEK_SHIFT
+    return [str(day) for day in days]
+
+# Cumulative counts of the components of table in mask, overall ('total') and for each code of the category column split
+# Return {key: {'dates': ['YYYY-MM-DD', ...], 'counts': [cumulative count at each date, ...]}}, with only the buckets in which the count
+# changes, and every series stretched (flat) to lowerDate/upperDate, or else to the first/last date of any series (i.e., of 'total')
+# Components without a creation date are not counted; the result is {} if there is nothing to count
+def cumulativeCounts(table, mask = None, split = None, binning = 'day', lowerDate = None, upperDate = None):
+    rows = np.arange(len(table)) if mask is None else (np.nonzero(mask)[0] if np.asarray(mask).dtype == bool else np.asarray(mask))
+    days = table.days(rows)
+    dated = ~np.isnat(days)
+    rows, days = rows[dated], days[dated]
+    if len(rows) == 0:
+        return {}
+
+    buckets = binDays(days, binning)
+    origin = buckets.min()
+    index = (buckets - origin).astype(np.int64)
+    n_buckets = int(index.max()) + 1
+
+    # One row of counts per series, the first for 'total'
+    keys = ['total']
+    counts = [np.bincount(index, minlength = n_buckets)]
+    if split:
+        column = table.column(split)[rows]
+        categories = table.categories[split]
+        found = column != MISSING
+        grid = np.bincount(column[found].astype(np.int64) * n_buckets + index[found], minlength = len(categories) * n_buckets)
+        grid = grid.reshape(len(categories), n_buckets)
+        for i, code in enumerate(categories.values):
+            if grid[i].any():
+                keys.append(code)
+                counts.append(grid[i])
+    counts = np.vstack(counts)
+    return cumulativeSeries(keys, counts, counts > 0, origin, binning, lowerDate, upperDate)
+
+# Build the counter of cumulativeCounts() from one row of changes per bucket for each series
+# active := boolean rows of the buckets to keep for each series, origin := bucket of column 0 (see binDays)
+def cumulativeSeries(keys, changes, active, origin, binning = 'day', lowerDate = None, upperDate = None):
+    cumulative = np.cumsum(changes, axis = 1)
+    counter = {}
+    for key, row, kept in zip(keys, cumulative, active):
+        counter[key] = {'dates': _labels(origin + np.nonzero(kept)[0], binning), 'counts': row[kept].tolist()}
+
+    # Insert the earliest and latest dates of all series (keeping the number of counts the same as the 2nd earliest/latest date)
+    earliest_date = lowerDate if lowerDate != None else min(series['dates'][0] for series in counter.values() if series['dates'])
+    latest_date = upperDate if upperDate != None else max(series['dates'][-1] for series in counter.values() if series['dates'])
+    for series in counter.values():
+        if series['dates'][0] != earliest_date:
+            series['dates'].insert(0, earliest_date)
+            series['counts'].insert(0, series['counts'][0])
+        if series['dates'][-1] != latest_date:
+            series['dates'].append(latest_date)
+            series['counts'].append(series['counts'][-1])
+    return counter
@@ -1,6 +1,6 @@
 #!/bin/env python3
 
-import os, sys, json, collections, getpass
+import os, sys, json, collections, getpass, atexit
 
 try:
     # Installed by default on lxplus
@@ -17,6 +17,14 @@ try:
 except ImportError:
     MultipartEncoder = None
 
+from itk_pdb.pagination import PageIterator, streamPages, DEFAULT_PAGE_SIZE, DEFAULT_WINDOW
+from itk_pdb.jsonStream import JSONListStream, CHUNK_SIZE
+from itk_pdb.responseCache import ResponseCache, DEFAULT_PATH as DEFAULT_CACHE_PATH, isIdempotent, componentTags, payloadAsDict, baseAction
+from itk_pdb.componentFetcher import ComponentFetcher, DEFAULT_WORKERS
+from itk_pdb.tokenManager import TokenManager, tokenCachePath
+from itk_pdb import instrumentation
+from itk_pdb.retryScheduler import RetryScheduler
+
 # Shouldn't be used outside this module
 _AUTH_URL = 'https://oidc.plus4u.net/uu-oidcg01-main/0-0/'
 _SITE_URL = 'https://itkpd-test.unicorncollege.cz/'
@@ -44,12 +52,161 @@ class ExpiredToken(Exception):
 class NoToken(Exception):
     pass
 
+# Raised by the module-level functions when the server rejects our token
+class InvalidToken(dbAccessError):
+    pass
+
+# 401, or a 500 from the token signature verification (see decodeError)
+def _isAuthFailure(r):
+    if r.status_code == 401:
+        return True
+    return r.status_code == 500 and ("uu-oidc/invalidToken" in r.text or "Signature verification" in r.text)
+
+import threading
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Connection pooling for every request made by this module
+# pool_size := number of keep-alive connections kept per host (should be >= the number of threads sharing a session)
+# max_retries := retries for connection errors (idempotent methods only) -- failed responses are retried by the scheduler (see retryScheduler)
+# backoff_factor := urllib3 exponential backoff between retries ({backoff factor} * 2^({retry number} - 1) seconds)
+_transport_config = {'pool_size': 10, 'max_retries': 3, 'backoff_factor': 0.5}
+_transport = None
+_transport_lock = threading.Lock()
+
+def _makeRetry(max_retries, backoff_factor):
+    kwargs = {'total': max_retries, 'connect': max_retries, 'read': max_retries, 'status': 0,
+              'backoff_factor': backoff_factor, 'raise_on_status': False}
+    try:
+        return Retry(allowed_methods = frozenset(['GET', 'HEAD']), **kwargs)
+    except TypeError:
+        # urllib3 < 1.26
+        return Retry(method_whitelist = frozenset(['GET', 'HEAD']), **kwargs)
+
+# Mount a pooled, retrying adapter on a requests.Session and ask for compressed responses
+def mountPooledAdapter(session, pool_size = None, max_retries = None, backoff_factor = None):
+    pool_size = _transport_config['pool_size'] if pool_size is None else pool_size
+    max_retries = _transport_config['max_retries'] if max_retries is None else max_retries
+    backoff_factor = _transport_config['backoff_factor'] if backoff_factor is None else backoff_factor
+    adapter = HTTPAdapter(pool_connections = pool_size, pool_maxsize = pool_size, max_retries = _makeRetry(max_retries, backoff_factor))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'})
+    return session
+
+# Change the transport settings -- the shared session is rebuilt on its next use
+def configureTransport(pool_size = None, max_retries = None, backoff_factor = None):
+    global _transport
+    with _transport_lock:
+        for key, value in [('pool_size', pool_size), ('max_retries', max_retries), ('backoff_factor', backoff_factor)]:
+            if value is not None:
+                _transport_config[key] = value
+        if _transport is not None:
+            _transport.close()
+        _transport = None
+
+# Return the shared, pooled requests.Session used by the module-level functions (doRequest, doMultiSomething)
+# The session is never mutated after creation (headers are passed per request), so it can be shared between threads
+def getTransport():
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = mountPooledAdapter(requests.Session())
+    return _transport
+
+# Read-through response cache for idempotent uuCMDs (see responseCache.ResponseCache)
+# Disabled by default -- enable with enableCache() or by pointing the ITK_DB_CACHE environment variable at a cache file
+cache = None
+
+def enableCache(path = None, **kwargs):
+    global cache
+    cache = ResponseCache(path if path is not None else DEFAULT_CACHE_PATH, **kwargs)
+    return cache
+
+def disableCache():
+    global cache
+    if cache is not None:
+        cache.close()
+    cache = None
+
+if os.getenv('ITK_DB_CACHE'):
+    enableCache(os.getenv('ITK_DB_CACHE'))
+
+# Request-level metrics (see instrumentation.Metrics), recorded for both ITkPDSession and the module-level functions
+# Disabled by default -- enable with enableMetrics() or by pointing the ITK_DB_METRICS environment variable at an output file (written at exit)
+metrics = None
+
+def enableMetrics(path = None):
+    global metrics
+    if metrics is None:
+        metrics = instrumentation.enable(path)
+    elif path is not None:
+        atexit.register(metrics.dump, path)
+    return metrics
+
+def disableMetrics():
+    global metrics
+    if metrics is not None:
+        instrumentation.removeRecorder(metrics)
+    metrics = None
+
+if os.getenv('ITK_DB_METRICS'):
+    enableMetrics(os.getenv('ITK_DB_METRICS'))
+
+# Retries and adaptive concurrency for every uuCMD (see retryScheduler.RetryScheduler), shared by the module-level functions and sessions
+# Change the settings with configureRetries(max_attempts = ..., ...), or turn it off with disableRetries()
+scheduler = RetryScheduler()
+
+def configureRetries(**kwargs):
+    global scheduler
+    scheduler = RetryScheduler(**kwargs)
+    return scheduler
+
+def disableRetries():
+    global scheduler
+    scheduler = None
+
+# Run send() through the scheduler (if any)
+def _throughScheduler(scheduler, action, send, replayable = None):
+    if scheduler is None:
+        return send()
+    return scheduler.send(action, send, replayable = replayable)
+
+# Run send() through the cache: cacheable commands are looked up first, mutating commands invalidate what they touch
+def _throughCache(cache, action, data, url, send):
+    if cache is None:
+        return send()
+    if cache.isCacheable(action):
+        hit, result = cache.get(action, data, url)
+        if not hit:
+            result = send()
+            cache.put(action, data, result, url)
+        elif instrumentation.recorders:
+            instrumentation.record(baseAction(action), cached = True)
+        return result
+    result = send()
+    cache.invalidate(action, data)
+    return result
+
+# Iterate over the body of a streamed response, releasing the connection once done (or abandoned)
+def _iterContent(response):
+    try:
+        for chunk in response.iter_content(CHUNK_SIZE):
+            yield chunk
+    finally:
+        response.close()
+
 # MJB -- Define a class for wrapping up authentication/doSomething commands but in a single requests session
 class ITkPDSession(requests.Session):
 
-    def __init__(self, enable_printing = True):
+    # cache := a responseCache.ResponseCache (defaults to the module-level dbAccess.cache, pass False to disable)
+    # scheduler := a retryScheduler.RetryScheduler (defaults to the module-level dbAccess.scheduler, pass False to disable retries)
+    def __init__(self, enable_printing = True, cache = None, scheduler = None):
         super(ITkPDSession, self).__init__()
         self.enable_printing = enable_printing
+        self.cache = cache
+        self.scheduler = scheduler
         self.dbAccessString = '\033[1m' + '\033[97m' + 'dbAccess:' + '\033[0m' + ' '
         if sys.version_info >= (3, 0):
             self.__convertToUtf8 = self.__convertToUtf8__Python3
@@ -58,6 +215,10 @@ class ITkPDSession(requests.Session):
         self.accessCode1    = None
         self.accessCode2    = None
         self.token          = None
+        self.tokenManager   = None
+        # Memo of the components fetched through getComponent(s) during this session
+        self.components     = ComponentFetcher(lambda component: self.doSomething(action = 'getComponent', method = 'GET', data = {'component': component}))
+        mountPooledAdapter(self)
         # self.issued_at      = -1
         # self.expires_at     = -1
         # self.expires_in     = -1
@@ -92,60 +253,108 @@ class ITkPDSession(requests.Session):
     def __convertToUtf8__Python3(self, data):
         return data
 
+    # The token is kept fresh by a tokenManager.TokenManager: it is refreshed ahead of expiry and re-granted if the server rejects it
+    # The access codes are kept (in memory) by the token manager for that purpose, save_codes additionally stores them on the session
+    # Tokens are shared with other sessions/processes through the token cache (see tokenManager.tokenCachePath), so we only prompt
+    # for access codes if there is no valid token there
     def authenticate(self, accessCode1 = None, accessCode2 = None, save_codes = False):
         self.__sessionPrinter('Getting token.', 'h')
+        if self.tokenManager is not None:
+            self.tokenManager.stop()
         if os.getenv('ITK_DB_AUTH'):
             self.__sessionPrinter('Token already exists in shell environment.', 'h')
-            self.token = os.getenv('ITK_DB_AUTH')
+            self.tokenManager = TokenManager(lambda prompt: None, path = None)
+            self.tokenManager.seed(os.getenv('ITK_DB_AUTH'))
         else:
-            data = {'grant_type': 'password'}
-            if accessCode1 is None or accessCode2 is None:
-                data['accessCode1'] = getpass.getpass(self.dbAccessString + 'Enter AccessCode 1:')
-                data['accessCode2'] = getpass.getpass(self.dbAccessString + 'Enter AccessCode 2:')
-                if save_codes:
-                    self.accessCode1, self.accessCode2 = data['accessCode1'], data['accessCode2']
-            else:
-                data['accessCode1'] = accessCode1
-                data['accessCode2'] = accessCode2
-            data = self.__toBytes(json.dumps(data))
-            self.__sessionPrinter('Sending credentials to get a token.', 'h')
-            token = self.doSomething(action = 'grantToken', method = 'POST', data = data, url = _AUTH_URL)
-            token = self.__toBytes(token)
-            self.token, self.issued_at, self.expires_at, self.expires_in = token['id_token'], float(token['issued_at']), float(token['expires_at']), float(token['expires_in'])
-        self.headers.update({'Authorization': 'Bearer ' + self.token})
+            codes = [accessCode1, accessCode2]
+            def grant(prompt):
+                if codes[0] is None or codes[1] is None:
+                    if not prompt:
+                        return None
+                    codes[0] = getpass.getpass(self.dbAccessString + 'Enter AccessCode 1:')
+                    codes[1] = getpass.getpass(self.dbAccessString + 'Enter AccessCode 2:')
+                    if save_codes:
+                        self.accessCode1, self.accessCode2 = codes
+                data = self.__toBytes(json.dumps({'grant_type': 'password', 'accessCode1': codes[0], 'accessCode2': codes[1]}))
+                self.__sessionPrinter('Sending credentials to get a token.', 'h')
+                return self.__toBytes(self.doSomething(action = 'grantToken', method = 'POST', data = data, url = _AUTH_URL))
+            self.tokenManager = TokenManager(grant, path = tokenCachePath(), key = _AUTH_URL)
+        self.__setToken(self.tokenManager.token())
         return self.token
 
     def refreshToken(self):
-        if self.accessCode1 is None or self.accessCode2 is None:
+        if self.tokenManager is not None:
+            self.__setToken(self.tokenManager.refresh())
+        elif self.accessCode1 is None or self.accessCode2 is None:
             pass
         else:
             self.authenticate(self.accessCode1, self.accessCode2)
 
+    # Use an explicit token (this disables the token manager)
     def updateToken(self, token):
-        self.token = token
-        self.headers.update({'Authorization': 'Bearer ' + self.token})
+        if self.tokenManager is not None:
+            self.tokenManager.stop()
+            self.tokenManager = None
+        self.__setToken(token)
 
-    def doSomething(self, action, method, data = None, url = _SITE_URL):
+    def __setToken(self, token):
+        self.token = token
+        if self.tokenManager is not None:
+            self.expires_at = self.tokenManager.expires_at
+        if token is not None:
+            self.headers.update({'Authorization': 'Bearer ' + self.token})
+
+    # Send the uuCMD and return the (successful) response
+    # If the token is rejected (see _isAuthFailure), we re-authenticate and retry exactly once (except for multipart bodies, which cannot be replayed)
+    # stream := do not download the body yet (see doSomethingStreamed)
+    def __send(self, action, method, data = None, url = _SITE_URL, stream = False):
         # if self.token is not None or action == 'grantToken':
         #     if time.time() < self.expires_at or action == 'grantToken':
+                # Pass the content type per request (rather than updating self.headers) so that concurrent requests on this session don't interfere
+                headers = {}
+                multipart = MultipartEncoder is not None and isinstance(data, MultipartEncoder)
                 if data is not None:
-                    if MultipartEncoder is not None and isinstance(data, MultipartEncoder):
-                        self.headers.update({'Content-Type' : data.content_type})
+                    if multipart:
+                        headers['Content-Type'] = data.content_type
                     else:
-                        self.headers.update({'Content-Type' : 'application/json'})
+                        headers['Content-Type'] = 'application/json'
                         if type(data) is bytes:
                             pass
                         else:
                             data = self.__toBytes(json.dumps(data))
                 else:
+                    headers['Content-Type'] = 'application/json'
                     data = {}
-                if method == 'GET':
-                    response = self.get(url = url + action, data = data)
-                elif method == 'POST':
-                    response = self.post(url = url + action, data = data)
-                else:
-                    self.__sessionPrinter('Unknown method \'{0}\' -- EXITING.'.format(method), 'h')
-                    sys.exit(1)
+                managed = self.tokenManager is not None and url != _AUTH_URL
+                name = baseAction(action)
+                retries = self.scheduler if self.scheduler is not None else scheduler
+                retries = retries if retries is not False else None
+                for attempt in range(2):
+                    token = None
+                    if managed:
+                        token = self.tokenManager.token()
+                        if token is not None:
+                            if token != self.token:
+                                self.__setToken(token)
+                            headers['Authorization'] = 'Bearer ' + token
+                    if method == 'GET':
+                        response = _throughScheduler(retries, name, lambda: instrumentation.observe(name, method, data,
+                                        lambda: self.get(url = url + action, data = data, headers = headers, stream = stream), stream))
+                    elif method == 'POST':
+                        # Multipart bodies cannot be sent twice
+                        response = _throughScheduler(retries, name, lambda: instrumentation.observe(name, method, data,
+                                        lambda: self.post(url = url + action, data = data, headers = headers, stream = stream), stream),
+                                        replayable = False if multipart else None)
+                    else:
+                        self.__sessionPrinter('Unknown method \'{0}\' -- EXITING.'.format(method), 'h')
+                        sys.exit(1)
+                    if managed and attempt == 0 and not multipart and _isAuthFailure(response):
+                        self.__sessionPrinter('Token rejected, re-authenticating and retrying.', 'h')
+                        response.close()
+                        self.tokenManager.invalidate(token)
+                        instrumentation.record(name, method = method, retry = True)
+                        continue
+                    break
                 if response.status_code != 200:
                     self.__sessionPrinter('Bad status code.', 'h')
                     self.__sessionPrinter('requests status code: %s' % response.status_code, 'h')
@@ -160,22 +369,66 @@ class ITkPDSession(requests.Session):
                         self.__sessionPrinter('requests text:', 'h')
                         self.__sessionPrinter(response.text, 'h')
                     response.raise_for_status()
-                try:
-                    dataOut = self.__convertToUtf8(response.json())
-                except ValueError:
-                    self.__sessionPrinter('No json could be decoded.', 'h')
-                    dataOut = response.text
-                if 'pageItemList' in dataOut:
-                    return dataOut['pageItemList']
-                elif 'itemList' in dataOut:
-                    return dataOut
-                else:
-                    return dataOut
+                return response
         #     else:
         #         raise ExpiredToken(expired_at = self.expires_at, current_time = time.time())
         # else:
         #     raise NoToken
 
+    # Send the uuCMD and return the full decoded response (including e.g. 'pageInfo' for list commands)
+    def __request(self, action, method, data = None, url = _SITE_URL):
+        response = self.__send(action, method, data = data, url = url)
+        try:
+            dataOut = self.__convertToUtf8(response.json())
+        except ValueError:
+            self.__sessionPrinter('No json could be decoded.', 'h')
+            dataOut = response.text
+        return dataOut
+
+    def doSomething(self, action, method, data = None, url = _SITE_URL):
+        responseCache = None
+        if url == _SITE_URL and self.cache is not False:
+            responseCache = self.cache if self.cache is not None else cache
+        dataOut = _throughCache(responseCache, action, data, url, lambda: self.__request(action, method, data = data, url = url))
+        if not isIdempotent(action):
+            self.components.forget(componentTags(payloadAsDict(data)))
+        if 'pageItemList' in dataOut:
+            return dataOut['pageItemList']
+        elif 'itemList' in dataOut:
+            return dataOut
+        else:
+            return dataOut
+
+    # Lazily iterate over every item of a paged list uuCMD (e.g., listComponents), see pagination.PageIterator
+    # Any pageInfo in data is overridden
+    # stream := decode each page incrementally as it arrives (see doSomethingStreamed), one page at a time, so memory stays flat
+    def doSomethingPaged(self, action, method, data = None, url = _SITE_URL, pageSize = DEFAULT_PAGE_SIZE, window = DEFAULT_WINDOW, stream = False):
+        data = dict(data) if data is not None else {}
+        def pageData(pageIndex, pageSize):
+            pageData = dict(data)
+            pageData['pageInfo'] = {'pageIndex': pageIndex, 'pageSize': pageSize}
+            return pageData
+        if stream:
+            return streamPages(lambda pageIndex, pageSize: self.doSomethingStreamed(action, method, data = pageData(pageIndex, pageSize), url = url), pageSize = pageSize)
+        fetchPage = lambda pageIndex, pageSize: self.__request(action, method, data = pageData(pageIndex, pageSize), url = url)
+        return iter(PageIterator(fetchPage, pageSize = pageSize, window = window))
+
+    # Send a list uuCMD and decode the items of its 'pageItemList'/'itemList' one at a time as the body arrives, see jsonStream.JSONListStream
+    # The rest of the response (e.g., 'pageInfo') is available as .meta once the items have been consumed
+    # Streamed responses bypass the response cache
+    def doSomethingStreamed(self, action, method, data = None, url = _SITE_URL):
+        response = self.__send(action, method, data = data, url = url, stream = True)
+        return JSONListStream(_iterContent(response))
+
+    # Get a single component (by code or serial number), memoized for the rest of the session
+    def getComponent(self, component):
+        return self.components.get(component)
+
+    # Generate (component, JSON) pairs for many components (codes or serial numbers), see componentFetcher.ComponentFetcher.getComponents
+    # Duplicates are fetched once, memoized components are not fetched again and the rest are fetched over a pool of workers, in order of completion
+    def getComponents(self, components, workers = DEFAULT_WORKERS, return_exceptions = False):
+        return self.components.getComponents(components, workers = workers, return_exceptions = return_exceptions)
+
 verbose = False
 
 token = None
@@ -185,12 +438,27 @@ testing = False
 if os.getenv("TEST_OVERRIDE"):
     testing = True
 
+# Keeps the token fresh once setupConnection() has been called (see tokenManager.TokenManager)
+tokenManager = None
+
 def setupConnection():
-    global token
+    global token, tokenManager
 
     print("Setup connection")
 
-    token = authenticate()
+    # The access codes are only asked for if the shared token cache has no valid token, and are then kept for refreshing the token
+    codes = [None, None]
+    def grant(prompt):
+        if codes[0] is None or codes[1] is None:
+            if not prompt:
+                return None
+            codes[0], codes[1] = getAccessCodes()
+        return grantToken(codes[0], codes[1])
+
+    if tokenManager is not None:
+        tokenManager.stop()
+    tokenManager = TokenManager(grant, path = tokenCachePath(), key = _AUTH_URL)
+    token = tokenManager.token()
 
 def to_bytes(s):
     try:
@@ -220,7 +488,13 @@ def fix_encoding(s):
 def myprint(s):
     print(fix_encoding(s))
 
-def authenticate(accessCode1 = None, accessCode2 = None):
+def getAccessCodes():
+    import getpass
+
+    return getpass.getpass("AccessCode1: "), getpass.getpass("AccessCode2: ")
+
+# Return the full grantToken response (id_token, issued_at, expires_at, expires_in)
+def grantToken(accessCode1 = None, accessCode2 = None):
     print("Getting token")
     # post
     # Everything is json header
@@ -231,10 +505,7 @@ def authenticate(accessCode1 = None, accessCode2 = None):
         a["accessCode1"] = accessCode1
         a["accessCode2"] = accessCode2
     else:
-        import getpass
-
-        a["accessCode1"] = getpass.getpass("AccessCode1: ")
-        a["accessCode2"] = getpass.getpass("AccessCode2: ")
+        a["accessCode1"], a["accessCode2"] = getAccessCodes()
 
     a = to_bytes(json.dumps(a))
 
@@ -244,7 +515,10 @@ def authenticate(accessCode1 = None, accessCode2 = None):
 
     # print("Authenticate result:", result)
 
-    j = to_bytes(result)
+    return to_bytes(result)
+
+def authenticate(accessCode1 = None, accessCode2 = None):
+    j = grantToken(accessCode1, accessCode2)
     id_token = j["id_token"]
 
     return id_token
@@ -264,12 +538,16 @@ def doMultiSomething(url, paramdata = None, method = None,
         print("method: POST")
 
     # print paramdata
-    r = requests.post(url, data = paramdata, headers = headers,
-                      files = attachments)
+    # The body is built by requests, so its size is not known here
+    r = instrumentation.observe(baseAction(url), "POST", None,
+                                lambda: getTransport().post(url, data = paramdata, headers = headers,
+                                                            files = attachments))
 
     if r.status_code in [500, 401]:
         print("Presumed auth failure")
         print(r.json())
+        if _isAuthFailure(r):
+            raise InvalidToken("Auth failure, token out of date")
         return None
 
     if r.status_code != 200:
@@ -334,7 +612,8 @@ def decodeError(message, code):
     if not found:
         myprint("Unknown message: %s" % str(message))
 
-def doRequest(url, data = None, headers = None, method = None):
+# stream := return a jsonStream.JSONListStream decoding the items of the response as it arrives
+def doRequest(url, data = None, headers = None, method = None, stream = False):
     if method == "post" or method == "POST" or (method is None and data is not None):
         method = "POST"
     else:
@@ -348,21 +627,22 @@ def doRequest(url, data = None, headers = None, method = None):
 
     if method == "POST":
         # print("Sending post")
-        r = requests.post(url, data = data,
-                          headers = headers)
+        send = lambda: getTransport().post(url, data = data,
+                                           headers = headers, stream = stream)
     else:
         # print("Sending get")
-        r = requests.get(url, data = data,
-                         headers = headers)
+        send = lambda: getTransport().get(url, data = data,
+                                          headers = headers, stream = stream)
+    r = _throughScheduler(scheduler, baseAction(url), lambda: instrumentation.observe(baseAction(url), method, data, send, stream))
 
-    if r.status_code == 401:
+    if _isAuthFailure(r):
         j = r.json()
         if "uuAppErrorMap" in j and len(j["uuAppErrorMap"]) > 0:
-            if "uu-oidc/invalidToken" in j["uuAppErrorMap"]:
+            if "uu-oidc/invalidToken" in j["uuAppErrorMap"] or r.status_code == 401:
                 global token
                 print("Auth failure, need a new token!")
                 token = None
-                raise dbAccessError("Auth failure, token out of date")
+                raise InvalidToken("Auth failure, token out of date")
 
     if r.status_code != 200:
         try:
@@ -382,6 +662,9 @@ def doRequest(url, data = None, headers = None, method = None):
             print(r.text)
             raise dbAccessError("Bad status code")
 
+    if stream:
+        return JSONListStream(_iterContent(r))
+
     if "content-type" in r.headers:
         # Expect "application/json; charset=UTF-8"
         ct = r.headers["content-type"]
@@ -396,10 +679,15 @@ def doRequest(url, data = None, headers = None, method = None):
         print("No json? ", e)
         return r.text
 
+# If the token is rejected and we have a token manager (see setupConnection), we re-authenticate and retry exactly once
+# stream := return a jsonStream.JSONListStream over the items of a list command rather than the decoded response (bypasses the cache)
 def doSomething(action, data = None, url = None, method = None,
-                attachments = None):
+                attachments = None, stream = False):
+    global token
+
     if testing:
-        return doSomethingTesting(action, data, url, method, attachments)
+        result = doSomethingTesting(action, data, url, method, attachments)
+        return JSONListStream([to_bytes(json.dumps(result))]) if stream else result
 
     if token is None and url is None:
         setupConnection()
@@ -416,10 +704,15 @@ def doSomething(action, data = None, url = None, method = None,
 
     if attachments is not None:
         # No encoding of data, as this is passed as k,v pairs
-        headers = {"Authorization": "Bearer %s" % token}
-        return doMultiSomething(baseName, paramdata = data,
-                                headers = headers,
-                                method = method, attachments = attachments)
+        def send():
+            headers = {"Authorization": "Bearer %s" % token}
+            return doMultiSomething(baseName, paramdata = data,
+                                    headers = headers,
+                                    method = method, attachments = attachments)
+        result = _withFreshToken(send, url, attachments, action = action)
+        if cache is not None and url is None:
+            cache.invalidate(action, data)
+        return result
 
     if data is not None:
         if type(data) is bytes:
@@ -431,16 +724,52 @@ def doSomething(action, data = None, url = None, method = None,
     else:
         reqData = None
 
-    headers = {'Content-Type' : 'application/json'}
-    # Header, token
-    if token is not None:
-        headers["Authorization"] = "Bearer %s" % token
-
-    result = doRequest(baseName, data = reqData,
-                       headers = headers, method = method)
+    def send():
+        headers = {'Content-Type' : 'application/json'}
+        # Header, token
+        if token is not None:
+            headers["Authorization"] = "Bearer %s" % token
+        return doRequest(baseName, data = reqData,
+                         headers = headers, method = method, stream = stream)
+
+    if stream:
+        result = _withFreshToken(send, url, action = action)
+    elif url is None:
+        result = _throughCache(cache, action, reqData, _SITE_URL, lambda: _withFreshToken(send, url, action = action))
+    else:
+        result = send()
 
     return result
 
+# Run send() with a fresh token from the token manager (if any), and retry it once with a new token if the token is rejected
+# action := the uuCMD being sent (for the instrumentation of the retry)
+def _withFreshToken(send, url, attachments = None, action = None):
+    global token
+    if tokenManager is None or url is not None:
+        return send()
+    token = tokenManager.token()
+    rejected = token
+    try:
+        return send()
+    except InvalidToken:
+        print("Token rejected, re-authenticating and retrying")
+        token = tokenManager.invalidate(rejected)
+        if token is None:
+            raise
+        if action is not None:
+            instrumentation.record(baseAction(action), retry = True)
+        _rewind(attachments)
+        return send()
+
+# Rewind the files of a multipart request, so that it can be sent again
+def _rewind(attachments):
+    if attachments is None:
+        return
+    for value in attachments.values():
+        f = value[1] if isinstance(value, tuple) else value
+        if hasattr(f, 'seek'):
+            f.seek(0)
+
 def extractList(*args, **kw):
     "Extract data for a list of things (as json)"
     output = None
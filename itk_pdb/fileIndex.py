@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# fileIndex.py -- an in-memory index of the files below a directory, for finding the files produced by ITSDAQ tests
+# The tree is walked once; the names are then indexed by their '_'-separated tokens, so that a lookup only tests the regex of
+# ResultsFolder.findFile() against the files sharing its most selective token rather than walking the tree again
+# Each directory's mtime is remembered, so a refresh only lists the directories which have changed since
+
+import os, re, time
+
+# A query token which can be looked up in the token index (a query without any is matched against every name)
+PLAIN_TOKEN = re.compile(r'^[A-Za-z0-9]+$')
+
+# The regex used to match a filename: every '_'-separated token of the name (without its extension and last character) must appear
+def filenameRegex(filename):
+    return re.compile(r'^(?=.*' + r')(?=.*'.join(filenameTokens(filename)) + r').*$')
+
+def filenameTokens(filename):
+    return os.path.splitext(filename)[0][:-1].split('_')
+
+# Define our index
+# root := directory to index, depth := level of recursion (0 := just root), ignore_folders := names of directories which are skipped
+# max_age := seconds for which the index is trusted without checking the mtimes of its directories (a lookup which finds nothing always checks)
+class FileIndex(object):
+
+    def __init__(self, root, depth = 0, ignore_folders = ['IGNORE'], max_age = 5.0):
+        self.root = root
+        self.depth = depth
+        self.ignore_folders = ignore_folders
+        self.max_age = max_age
+        # {directory: (mtime, files, subdirectories)}, from which the files are collected in the order of os.walk()
+        self.directories = None
+        self.checked = None
+        self.__names = None
+
+    # List a directory, returning (mtime, files, subdirectories) or None if it has gone
+    # As for os.walk(), symbolic links to directories are neither files nor followed
+    def __list(self, directory):
+        try:
+            mtime = os.stat(directory).st_mtime
+            entries = os.listdir(directory)
+        except OSError:
+            return None
+        files, subdirectories = [], []
+        for entry in entries:
+            path = os.path.join(directory, entry)
+            if not os.path.isdir(path):
+                files.append(entry)
+            elif not os.path.islink(path):
+                subdirectories.append(entry)
+        return mtime, files, subdirectories
+
+    # Walk the tree from directory (at level), reusing the listings of unchanged directories in previous
+    def __walk(self, directory, level, previous, directories):
+        listing = None
+        if directory in previous:
+            try:
+                if os.stat(directory).st_mtime == previous[directory][0]:
+                    listing = previous[directory]
+            except OSError:
+                return
+        if listing is None:
+            listing = self.__list(directory)
+            if listing is None:
+                return
+        directories[directory] = listing
+        if level < self.depth:
+            for subdirectory in listing[2]:
+                if subdirectory not in self.ignore_folders:
+                    self.__walk(os.path.join(directory, subdirectory), level + 1, previous, directories)
+
+    # (Re)build the index, only listing the directories whose mtime has changed, returns True if anything changed
+    def refresh(self):
+        previous = self.directories or {}
+        directories = {}
+        self.__walk(self.root, 0, previous, directories)
+        self.checked = time.time()
+        changed = self.directories is None or set(directories) != set(previous) or any(directories[d] is not previous[d] for d in directories)
+        if changed:
+            self.directories = directories
+            self.__build()
+        return changed
+
+    def __build(self):
+        # Files in walk order (directories top-down, as listed), with an index of the files containing each token
+        self.__names, self.__paths = [], []
+        self.__collect(self.root)
+        self.__tokens = {}
+        for i, name in enumerate(self.__names):
+            for token in set(re.split(r'[_.]', name)):
+                self.__tokens.setdefault(token, []).append(i)
+        self.__candidates = {}
+
+    def __collect(self, directory):
+        listing = self.directories.get(directory)
+        if listing is None:
+            return
+        for file in listing[1]:
+            self.__names.append(file)
+            self.__paths.append(os.path.join(directory, file))
+        for subdirectory in listing[2]:
+            self.__collect(os.path.join(directory, subdirectory))
+
+    # Indices of the files whose names contain token (memoized, as the same serial numbers/dates are looked up over and over)
+    def __containing(self, token):
+        candidates = self.__candidates.get(token)
+        if candidates is None:
+            candidates = set()
+            for key, indices in self.__tokens.items():
+                if token in key:
+                    candidates.update(indices)
+            candidates = self.__candidates[token] = sorted(candidates)
+        return candidates
+
+    def __find(self, filename):
+        regex = filenameRegex(filename)
+        # Every match contains each of the tokens, so the files containing any one of them are enough: we take the token which is
+        # the name token ('_'/'.'-separated) of the fewest files (or, if none is, the longest)
+        tokens = [token for token in filenameTokens(filename) if PLAIN_TOKEN.match(token)]
+        if tokens:
+            candidates = self.__containing(min(tokens, key = lambda token: (len(self.__tokens.get(token, ())) or len(self.__names) + 1, -len(token))))
+        else:
+            candidates = range(len(self.__names))
+        for i in candidates:
+            if regex.search(self.__names[i]):
+                return self.__paths[i]
+        return None
+
+    # Find the first file (in walk order) matching filenameRegex(filename), which includes filename itself -- as findFile() always did
+    # Returns None if there is none
+    def find(self, filename):
+        if self.directories is None or time.time() - self.checked > self.max_age:
+            self.refresh()
+        path = self.__find(filename)
+        if path is None and self.refresh():
+            path = self.__find(filename)
+        return path
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# gainArrays.py -- per-chip results of ThreePointGain and ResponseCurve tests as NumPy structured arrays
+# Each stream is a masked structured array with one (typed) field per results key and one row per chip: nan's and the rows of chips with
+# too many defects are masked rather than encoded as -1000000, which only happens when the results are serialized for the upload JSON
+
+import numpy as np
+
+# Value of masked entries in the upload JSON (as in ITSDAQParser.MISSING)
+MISSING = -1000000
+
+# Results keys which are integers
+INTEGER_KEYS = ['INNSE', 'INNSE_RMS']
+
+# Structured dtype for the given results keys
+def gainDtype(keys):
+    return np.dtype([(key, np.int32 if key in INTEGER_KEYS else np.float64) for key in keys])
+
+# Define our per-chip results
+# streams := [stream 0, stream 1] masked structured arrays (see gainDtype), identifiers := [stream 0, stream 1] chip identifiers
+class GainResults(object):
+
+    def __init__(self, keys, streams, identifiers):
+        self.keys = list(keys)
+        self.streams = streams
+        self.identifiers = identifiers
+
+    # Build from the rows of the summary file (lists of len(keys) strings, stream 0 chips first), whose nan's are masked
+    @classmethod
+    def fromRows(cls, keys, rows, identifiers):
+        number_of_chips = len(identifiers) // 2
+        values = np.array(rows, dtype = np.float64).reshape(len(rows), len(keys))
+        mask = np.isnan(values)
+        dtype = gainDtype(keys)
+        data = np.zeros(len(rows), dtype = dtype)
+        fieldMask = np.zeros(len(rows), dtype = np.dtype([(key, np.bool_) for key in keys]))
+        for j, key in enumerate(keys):
+            data[key] = np.where(mask[:, j], 0, values[:, j])
+            fieldMask[key] = mask[:, j]
+        table = np.ma.array(data, mask = fieldMask)
+        return cls(keys, [table[:number_of_chips], table[number_of_chips:2 * number_of_chips]],
+                    [identifiers[:number_of_chips], identifiers[number_of_chips:]])
+
+    def __getitem__(self, key):
+        stream, key = _splitKey(key)
+        return self.streams[stream][key]
+
+    def __eq__(self, other):
+        return isinstance(other, GainResults) and self.toResults() == other.toResults()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'GainResults(%s chips, keys = %s)' % (len(self.streams[0]), self.keys)
+
+    # Both streams as a single masked array, stream 0 chips first
+    def stacked(self):
+        return np.ma.concatenate(self.streams)
+
+    # The results as in the upload JSON, {'STREAM0/1_<key>': [value per chip]} with masked values as -1000000
+    def toResults(self):
+        results = {}
+        for stream in range(2):
+            for key in self.keys:
+                results['STREAM%s_%s' % (stream, key)] = self.streams[stream][key].filled(MISSING).tolist()
+        return results
+
+# 'STREAM1_GAIN' -> (1, 'GAIN')
+def _splitKey(key):
+    if not key.startswith('STREAM') or key[7:8] != '_' or key[6] not in '01':
+        raise KeyError(key)
+    return int(key[6]), key[8:]
+
+# A copy of a test JSON whose results are ready for the upload (i.e., with GainResults serialized)
+def serializeJSON(json):
+    if isinstance(json.get('results'), GainResults):
+        json = dict(json)
+        json['results'] = json['results'].toResults()
+    return json
+
+# Stack the per-chip results of tests (parsed with arrays = True) of the given test type across modules
+# Return (serial number per row, stream per row, masked structured array), e.g., to compare the gains of all of the chips at once
+def stackTests(tests, testType = 'THREE_POINT_GAIN'):
+    serialNumbers, streams, tables = [], [], []
+    for test in tests:
+        results = test['JSON']['results']
+        if test['JSON'].get('testType') != testType or not isinstance(results, GainResults):
+            continue
+        for stream in range(2):
+            n = len(results.streams[stream])
+            serialNumbers += n * [test['JSON']['properties']['SERIAL_NUMBER']]
+            streams += n * [stream]
+            tables.append(results.streams[stream])
+    if not tables:
+        return np.zeros(0, dtype = 'U1'), np.zeros(0, dtype = np.int8), None
+    return np.array(serialNumbers), np.array(streams, dtype = np.int8), np.ma.concatenate(tables)
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# instrumentation.py -- request-level instrumentation for dbAccess (both ITkPDSession and the module-level functions)
+# Every HTTP request, retry and cache hit is passed to the registered recorders (any object with a record(**event) method)
+# The Metrics recorder keeps per-action latency/size histograms, status codes, retries and cache hits, and exports them as JSON or
+# Prometheus text -- enable it with enable(path) or by pointing the ITK_DB_METRICS environment variable at an output file
+# (suffix .json for JSON, anything else for Prometheus text), which is then written at exit
+
+import atexit, json, math, threading, time
+
+# Use the most precise clock available
+timer = getattr(time, 'perf_counter', time.time)
+
+# Histogram bucket upper bounds: latencies in seconds, sizes in bytes
+LATENCY_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+SIZE_BUCKETS    = [1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864]
+
+# The recorders every event is passed to
+recorders = []
+
+def addRecorder(recorder):
+    if recorder not in recorders:
+        recorders.append(recorder)
+    return recorder
+
+def removeRecorder(recorder):
+    if recorder in recorders:
+        recorders.remove(recorder)
+
+# Pass an event to every recorder
+# action := uuCMD (without query string), method := 'GET'/'POST'
+# status := HTTP status code of a request ('error' if it raised), latency := duration of the request [s]
+# sent/received := size of the request/response body [bytes] (None if unknown, e.g., for a response which is still being streamed)
+# retry := the event is a retry of the action, cached := the action was answered from the response cache
+def record(action, method = None, status = None, latency = None, sent = None, received = None, retry = False, cached = False):
+    for recorder in recorders:
+        recorder.record(action = action, method = method, status = status, latency = latency, sent = sent, received = received, retry = retry, cached = cached)
+
+# Size of a request body (bytes, str, MultipartEncoder, ...)
+def bodySize(data):
+    if data is None:
+        return 0
+    if hasattr(data, 'len'):
+        return data.len
+    try:
+        return len(data)
+    except TypeError:
+        return None
+
+# Size of a response body, without consuming a streamed response
+def responseSize(response, stream = False):
+    length = response.headers.get('Content-Length') if response.headers is not None else None
+    if length is not None:
+        return int(length)
+    return None if stream else len(response.content)
+
+# Send a request with send() and record it (including requests which raise, with status 'error')
+def observe(action, method, data, send, stream = False):
+    if not recorders:
+        return send()
+    start = timer()
+    try:
+        response = send()
+    except Exception:
+        record(action, method = method, status = 'error', latency = timer() - start, sent = bodySize(data))
+        raise
+    record(action, method = method, status = response.status_code, latency = timer() - start, sent = bodySize(data), received = responseSize(response, stream))
+    return response
+
+# Define our (cumulative, Prometheus style) histogram
+class Histogram(object):
+
+    def __init__(self, buckets):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    # Estimate a quantile by linear interpolation within the bucket it falls in
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count > 0:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + [float('inf')], self.counts):
+            total += count
+            yield bound, total
+
+    def toDict(self):
+        return {'count': self.count, 'sum': self.sum, 'mean': self.sum / self.count if self.count else None,
+                'p50': self.quantile(0.5), 'p90': self.quantile(0.9), 'p99': self.quantile(0.99),
+                'buckets': dict(('+Inf' if math.isinf(bound) else repr(bound), total) for bound, total in self.cumulative())}
+
+# Per-action statistics
+class ActionStats(object):
+
+    def __init__(self):
+        self.status = {}
+        self.retries = 0
+        self.cacheHits = 0
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.sent = Histogram(SIZE_BUCKETS)
+        self.received = Histogram(SIZE_BUCKETS)
+
+    @property
+    def requests(self):
+        return sum(self.status.values())
+
+    def toDict(self):
+        return {'requests': self.requests, 'status': dict((str(status), count) for status, count in self.status.items()), 'retries': self.retries,
+                'cacheHits': self.cacheHits, 'latency': self.latency.toDict(), 'sent': self.sent.toDict(), 'received': self.received.toDict()}
+
+# Define our metrics recorder
+class Metrics(object):
+
+    def __init__(self):
+        self.started = time.time()
+        self.actions = {}
+        self.__lock = threading.Lock()
+
+    def record(self, action, method = None, status = None, latency = None, sent = None, received = None, retry = False, cached = False):
+        with self.__lock:
+            stats = self.actions.get(action)
+            if stats is None:
+                stats = self.actions[action] = ActionStats()
+            if retry:
+                stats.retries += 1
+            if cached:
+                stats.cacheHits += 1
+            if status is not None:
+                stats.status[status] = stats.status.get(status, 0) + 1
+                if latency is not None:
+                    stats.latency.observe(latency)
+                if sent is not None:
+                    stats.sent.observe(sent)
+                if received is not None:
+                    stats.received.observe(received)
+
+    def toJSON(self):
+        with self.__lock:
+            return {'started': self.started, 'finished': time.time(), 'actions': dict((action, stats.toDict()) for action, stats in self.actions.items())}
+
+    def toPrometheus(self, prefix = 'itkpd'):
+        lines = []
+        def header(name, kind, description):
+            lines.append('# HELP %s_%s %s' % (prefix, name, description))
+            lines.append('# TYPE %s_%s %s' % (prefix, name, kind))
+        with self.__lock:
+            actions = sorted(self.actions.items())
+            header('requests_total', 'counter', 'Requests sent to the ITk Production Database, by uuCMD and status code')
+            for action, stats in actions:
+                for status, count in sorted(stats.status.items(), key = lambda item: str(item[0])):
+                    lines.append('%s_requests_total{action="%s",status="%s"} %s' % (prefix, action, status, count))
+            header('retries_total', 'counter', 'Retried uuCMDs')
+            for action, stats in actions:
+                lines.append('%s_retries_total{action="%s"} %s' % (prefix, action, stats.retries))
+            header('cache_hits_total', 'counter', 'uuCMDs answered from the response cache')
+            for action, stats in actions:
+                lines.append('%s_cache_hits_total{action="%s"} %s' % (prefix, action, stats.cacheHits))
+            for name, attribute, description in [('request_duration_seconds', 'latency', 'Request latency'), ('request_size_bytes', 'sent', 'Request body size'),
+                                                    ('response_size_bytes', 'received', 'Response body size')]:
+                header(name, 'histogram', description)
+                for action, stats in actions:
+                    histogram = getattr(stats, attribute)
+                    for bound, total in histogram.cumulative():
+                        lines.append('%s_%s_bucket{action="%s",le="%s"} %s' % (prefix, name, action, '+Inf' if math.isinf(bound) else repr(bound), total))
+                    lines.append('%s_%s_sum{action="%s"} %r' % (prefix, name, action, histogram.sum))
+                    lines.append('%s_%s_count{action="%s"} %s' % (prefix, name, action, histogram.count))
+        return '\n'.join(lines) + '\n'
+
+    # A short human readable report, actions sorted by the total time spent in them
+    def report(self):
+        with self.__lock:
+            actions = sorted(self.actions.items(), key = lambda item: -item[1].latency.sum)
+            lines = ['{0:<35}{1:>10}{2:>10}{3:>12}{4:>10}{5:>10}{6:>10}'.format('action', 'requests', 'retries', 'total [s]', 'p50 [s]', 'p99 [s]', 'cached')]
+            for action, stats in actions:
+                p50, p99 = stats.latency.quantile(0.5), stats.latency.quantile(0.99)
+                lines.append('{0:<35}{1:>10}{2:>10}{3:>12.3f}{4:>10}{5:>10}{6:>10}'.format(action, stats.requests, stats.retries, stats.latency.sum,
+                                '%.3f' % p50 if p50 is not None else '-', '%.3f' % p99 if p99 is not None else '-', stats.cacheHits))
+        return '\n'.join(lines)
+
+    # Write the metrics to path (JSON if it ends with .json, Prometheus text otherwise)
+    def dump(self, path):
+        with open(path, 'w') as f:
+            if path.endswith('.json'):
+                json.dump(self.toJSON(), f, indent = 4, sort_keys = True)
+            else:
+                f.write(self.toPrometheus())
+
+# Register a Metrics recorder (written to path at exit, if path is given) and return it
+def enable(path = None):
+    metrics = addRecorder(Metrics())
+    if path is not None:
+        atexit.register(metrics.dump, path)
+    return metrics
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# jsonStream.py -- incremental decoding of (very) large list responses
+# The items of 'pageItemList'/'itemList' are decoded one at a time as the body arrives, so a listing never has to be held in memory
+# ijson is used if it is installed, otherwise we fall back on a pure Python scanner built on json.JSONDecoder.raw_decode
+
+import codecs, json
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Keys of the top-level object holding the items of a list response
+LIST_KEYS = ['pageItemList', 'itemList']
+
+# Size of the chunks read from the response
+CHUNK_SIZE = 64 * 1024
+
+# Define our stream object
+# chunks := iterable of bytes (e.g., requests.Response.iter_content(CHUNK_SIZE)) making up a JSON document
+# Iterating yields the items of the first list found under one of LIST_KEYS (or of the document itself, if it is a list)
+# Once iteration has finished:
+#   meta := the rest of the (top-level) document, e.g. {'pageInfo': {...}, 'uuAppErrorMap': {}}
+#   key := the key under which the items were found ('' if the document was a list, None if there were no items at all)
+class JSONListStream(object):
+
+    def __init__(self, chunks, keys = LIST_KEYS, use_ijson = True):
+        self.chunks = chunks
+        self.keys = keys
+        self.use_ijson = use_ijson and ijson is not None
+        self.meta = {}
+        self.key = None
+
+    def __iter__(self):
+        if self.use_ijson:
+            return self.__iterIjson()
+        return self.__iterScanner()
+
+    # Total number of items reported in pageInfo (None if not (yet) known)
+    @property
+    def total(self):
+        total = (self.meta.get('pageInfo') or {}).get('total')
+        return int(total) if total is not None else None
+
+    # The items are a page of a paged listing (rather than a complete list)
+    @property
+    def paged(self):
+        return self.key == 'pageItemList'
+
+    # ijson: build the items from the parser events under '<key>.item', and the rest of the document from all other events
+    def __iterIjson(self):
+        builder = ijson.ObjectBuilder()
+        item = None
+        itemPrefix = None
+        first = True
+        for prefix, event, value in ijson.parse(_ChunkReader(self.chunks), use_float = True):
+            if item is not None:
+                item.event(event, value)
+                if prefix == itemPrefix and event in ['end_map', 'end_array']:
+                    yield item.value
+                    item = None
+                continue
+            if self.key is None and event == 'start_array' and ((first and prefix == '') or prefix in self.keys):
+                self.key = prefix
+                itemPrefix = prefix + '.item' if prefix != '' else 'item'
+            elif prefix == itemPrefix and event != 'end_array':
+                if event in ['start_map', 'start_array']:
+                    item = ijson.ObjectBuilder()
+                    item.event(event, value)
+                else:
+                    yield value
+                continue
+            first = False
+            builder.event(event, value)
+        self.__setMeta(getattr(builder, 'value', None))
+
+    # Fallback: scan the top level of the document by hand and raw_decode everything below it
+    def __iterScanner(self):
+        scanner = _Scanner(self.chunks)
+        first = scanner.next()
+        if first == '[':
+            self.key = ''
+            for item in scanner.iterArray():
+                yield item
+            return
+        if first != '{':
+            self.__setMeta(scanner.decodeValue(first))
+            return
+        meta = {}
+        for key, char in scanner.iterObjectKeys():
+            if key in self.keys and self.key is None and char == '[':
+                self.key = key
+                meta[key] = []
+                for item in scanner.iterArray():
+                    yield item
+            else:
+                meta[key] = scanner.decodeValue(char)
+        self.__setMeta(meta)
+
+    def __setMeta(self, document):
+        if isinstance(document, dict):
+            if self.key:
+                document.pop(self.key, None)
+            self.meta = document
+        elif document is not None and self.key is None:
+            self.meta = {'': document}
+
+# File-like wrapper around an iterable of bytes (for ijson)
+class _ChunkReader(object):
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = b''
+
+    def read(self, size = -1):
+        while size < 0 or len(self.buffer) < size:
+            try:
+                self.buffer += next(self.chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+# Pure Python incremental scanner of the top level of a JSON document
+# Only a window of the text is kept: the consumed part of the buffer is dropped as we go
+class _Scanner(object):
+
+    WHITESPACE = ' \t\n\r'
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = json.JSONDecoder()
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = u''
+        self.position = 0
+        self.eof = False
+
+    def __fill(self):
+        if self.eof:
+            return False
+        try:
+            chunk = next(self.chunks)
+        except StopIteration:
+            self.eof = True
+            self.buffer += self.utf8.decode(b'', True)
+            return True
+        if self.position > len(self.buffer) // 2:
+            self.buffer = self.buffer[self.position:]
+            self.position = 0
+        self.buffer += self.utf8.decode(chunk)
+        return True
+
+    # Return the next non-whitespace character (without consuming it), or None at the end of the document
+    def peek(self):
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in self.WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.__fill():
+                return None
+
+    # Consume and return the next non-whitespace character
+    def next(self):
+        char = self.peek()
+        if char is None:
+            raise ValueError('Unexpected end of JSON document')
+        self.position += 1
+        return char
+
+    # Decode a complete value starting at the current position (whose first character, char, has already been consumed)
+    # The value is only accepted once something follows it, so that e.g. a number split across two chunks is not cut short
+    def decodeValue(self, char):
+        self.position -= 1
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                if end < len(self.buffer) or self.eof:
+                    self.position = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self.__fill()
+
+    # Iterate over the elements of an array whose '[' has been consumed
+    def iterArray(self):
+        if self.peek() == ']':
+            self.position += 1
+            return
+        while True:
+            yield self.decodeValue(self.next())
+            char = self.next()
+            if char == ']':
+                return
+            if char != ',':
+                raise ValueError('Expecting \',\' or \']\' in JSON array, got \'%s\'' % char)
+
+    # Iterate over (key, first character of the value) of an object whose '{' has been consumed
+    # The caller must consume the value before asking for the next key
+    def iterObjectKeys(self):
+        if self.peek() == '}':
+            self.position += 1
+            return
+        while True:
+            key = self.decodeValue(self.next())
+            if self.next() != ':':
+                raise ValueError('Expecting \':\' after key \'%s\' in JSON object' % key)
+            yield key, self.next()
+            char = self.next()
+            if char == '}':
+                return
+            if char != ',':
+                raise ValueError('Expecting \',\' or \'}\' in JSON object, got \'%s\'' % char)
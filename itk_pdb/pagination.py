@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# pagination.py -- a paging engine for the list uuCMDs of the ITk Production Database
+# The list commands (listComponents, listTestRunsByTestType, ...) accept pageInfo = {pageIndex, pageSize} and answer with a single
+# page in 'pageItemList' plus a 'pageInfo' block (which carries the total number of items when the server knows it)
+
+import collections, math
+from concurrent.futures import ThreadPoolExecutor
+
+# Default number of items requested per page and default number of page requests allowed in flight at once
+DEFAULT_PAGE_SIZE   = 500
+DEFAULT_WINDOW      = 4
+
+# Split a decoded response into (items, total, complete)
+# total := total number of items reported by the server (None if not reported)
+# complete := True if the response is known to contain every item (i.e., no further pages should be requested)
+def splitPage(response):
+    if isinstance(response, list):
+        return response, None, True
+    if 'pageItemList' in response:
+        pageInfo = response.get('pageInfo') or {}
+        total = pageInfo.get('total')
+        return response['pageItemList'], (int(total) if total is not None else None), False
+    if 'itemList' in response:
+        return response['itemList'], None, True
+    return [response], None, True
+
+# Define our PageIterator object
+# fetchPage := function taking (pageIndex, pageSize) and returning the raw (decoded) response for that page
+# window := maximum number of page requests in flight at once -- at most window pages are held in memory
+# The first page is fetched on its own to learn the total; the remaining pages are then fetched concurrently, but items are always
+# yielded in page order
+class PageIterator(object):
+
+    def __init__(self, fetchPage, pageSize = DEFAULT_PAGE_SIZE, window = DEFAULT_WINDOW):
+        if pageSize < 1:
+            raise ValueError('pageSize must be >= 1: %s' % pageSize)
+        if window < 1:
+            raise ValueError('window must be >= 1: %s' % window)
+        self.fetchPage = fetchPage
+        self.pageSize = pageSize
+        self.window = window
+        self.total = None
+
+    def __iter__(self):
+        return self.__generate()
+
+    def __generate(self):
+
+        # Fetch the first page (synchronously) and yield its items
+        items, self.total, complete = splitPage(self.fetchPage(0, self.pageSize))
+        for item in items:
+            yield item
+        if complete or len(items) == 0 or (self.total is None and len(items) < self.pageSize) or (self.total is not None and len(items) >= self.total):
+            return
+
+        # A short first page while the total says there is more: the server caps the page size, so we page by its size instead
+        pageSize = self.pageSize if self.total is None else min(self.pageSize, len(items))
+
+        # If the total is known we know exactly which pages to request, else we speculatively request ahead until a short page comes back
+        lastPage = int(math.ceil(float(self.total) / pageSize)) - 1 if self.total is not None else None
+
+        executor = ThreadPoolExecutor(max_workers = self.window)
+        pending = collections.deque()
+        try:
+            nextIndex = 1
+            while True:
+
+                # Keep the window full
+                while len(pending) < self.window and (lastPage is None or nextIndex <= lastPage):
+                    pending.append(executor.submit(self.fetchPage, nextIndex, pageSize))
+                    nextIndex += 1
+                if not pending:
+                    break
+
+                # Yield the oldest page, in order
+                items, _, complete = splitPage(pending.popleft().result())
+                for item in items:
+                    yield item
+                if lastPage is None and (complete or len(items) < pageSize):
+                    break
+
+        # Cancel whatever is still in flight (e.g., speculative pages or an abandoned iterator)
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait = False)
+
+# Iterate over every item of a paged listing, decoding each page as it streams in (see jsonStream.JSONListStream)
+# fetchStream := function taking (pageIndex, pageSize) and returning a JSONListStream for that page
+# Pages are requested one after the other (the total, and whether there is a next page at all, is only known once a page has been read)
+# As for PageIterator, a short page only ends the listing if the server does not report the total (else it caps the page size)
+def streamPages(fetchStream, pageSize = DEFAULT_PAGE_SIZE):
+    if pageSize < 1:
+        raise ValueError('pageSize must be >= 1: %s' % pageSize)
+    pageIndex = 0
+    yielded = 0
+    while True:
+        stream = fetchStream(pageIndex, pageSize)
+        n = 0
+        for item in stream:
+            n += 1
+            yield item
+        if not stream.paged:
+            if stream.key is None and stream.meta:
+                yield stream.meta
+            return
+        yielded += n
+        pageIndex += 1
+        if n == 0 or (stream.total is None and n < pageSize) or (stream.total is not None and yielded >= stream.total):
+            return
+        if pageIndex == 1 and n < pageSize:
+            pageSize = n
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# responseCache.py -- an on-disk (SQLite) read-through cache for idempotent uuCMDs
+# Entries are keyed by url + action + canonicalised payload and expire according to a per-command TTL policy
+# Entries are tagged with the component codes/serial numbers (and test run ids) they refer to, so that mutating commands (setComponentStage,
+# assembleComponent, setTestRunStatus, ...) which touch a component or test run invalidate whatever was cached for it
+
+import os, json, time, hashlib, sqlite3, threading
+
+# Default TTLs (in seconds) for the commands we cache -- any command not listed here is not cached
+# Component types, test types, institutions and projects are (nearly) immutable metadata, components and test runs change more often
+DEFAULT_TTL_POLICIES = {
+    'getComponentType':         24 * 3600,
+    'getComponentTypeByCode':   24 * 3600,
+    'listComponentTypes':       24 * 3600,
+    'listTestTypes':            24 * 3600,
+    'listInstitutions':         24 * 3600,
+    'listProjects':             24 * 3600,
+    'getTestRun':               24 * 3600,
+    'getComponent':             10 * 60,
+}
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.itk_pdb', 'response_cache.sqlite')
+
+# Keys in the payload (and response) of a command which refer to a component
+COMPONENT_KEYS = ['component', 'parent', 'child']
+
+# Keys in the payload of a command which refer to a test run (getTestRun, setTestRunStatus, deleteTestRun, ...)
+TEST_RUN_KEYS = ['testRun']
+
+# Strip any query string (e.g., 'listComponentTypes?project=S') and service prefix from an action
+def baseAction(action):
+    return action.split('?')[0].split('/')[-1]
+
+# Commands which do not modify the DB
+def isIdempotent(action):
+    action = baseAction(action)
+    return action.startswith('get') or action.startswith('list') or action == 'grantToken'
+
+# Turn whatever was passed as data (dict, JSON bytes/str, MultipartEncoder, None) into a plain dict
+def payloadAsDict(data):
+    if data is None:
+        return {}
+    if isinstance(data, dict):
+        return data
+    if hasattr(data, 'fields'):
+        # requests_toolbelt MultipartEncoder
+        return dict((k, v) for k, v in dict(data.fields).items() if not isinstance(v, tuple))
+    try:
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        payload = json.loads(data)
+        return payload if isinstance(payload, dict) else {'': payload}
+    except (ValueError, TypeError, AttributeError):
+        return {'': repr(data)}
+
+# Collect the component codes/serial numbers and test run ids referred to by a payload (and optionally a getComponent response)
+def componentTags(payload, response = None):
+    tags = set()
+    for key in COMPONENT_KEYS + TEST_RUN_KEYS:
+        value = payload.get(key)
+        if isinstance(value, (str, type(u''))):
+            tags.add(value.lower())
+    if isinstance(response, dict):
+        for key in ['code', 'serialNumber']:
+            value = response.get(key)
+            if isinstance(value, (str, type(u''))):
+                tags.add(value.lower())
+    return tags
+
+# Define our cache
+# path := SQLite file (created with its parent directory if needed)
+# ttl_policies := {action: TTL in seconds}, merged on top of DEFAULT_TTL_POLICIES (a TTL <= 0 disables caching for that action)
+# max_entries/max_bytes := least recently used entries are evicted past either limit
+class ResponseCache(object):
+
+    def __init__(self, path = DEFAULT_PATH, ttl_policies = None, max_entries = DEFAULT_MAX_ENTRIES, max_bytes = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl_policies = dict(DEFAULT_TTL_POLICIES)
+        if ttl_policies is not None:
+            self.ttl_policies.update(ttl_policies)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()
+        if path != ':memory:' and os.path.dirname(path) != '' and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        self.__connection = sqlite3.connect(path, timeout = 30, check_same_thread = False)
+        with self.__lock:
+            self.__connection.executescript('''
+                CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, action TEXT, response TEXT, expires REAL, accessed REAL, size INTEGER);
+                CREATE TABLE IF NOT EXISTS tags (tag TEXT, key TEXT);
+                CREATE INDEX IF NOT EXISTS tags_tag ON tags (tag);
+                CREATE INDEX IF NOT EXISTS tags_key ON tags (key);
+                CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+            ''')
+            self.__connection.commit()
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
+
+    def ttl(self, action):
+        return self.ttl_policies.get(baseAction(action), 0)
+
+    def isCacheable(self, action):
+        return self.ttl(action) > 0
+
+    # Canonical key: the same action and payload always map to the same key, whatever the ordering of the keys in the payload
+    def key(self, action, data, url = ''):
+        canonical = json.dumps(payloadAsDict(data), sort_keys = True, separators = (',', ':'), default = str)
+        return hashlib.sha256((url + '\n' + action + '\n' + canonical).encode('utf-8')).hexdigest()
+
+    # Return (True, response) on a hit, (False, None) on a miss/expired entry
+    def get(self, action, data, url = ''):
+        key = self.key(action, data, url)
+        now = time.time()
+        with self.__lock:
+            row = self.__connection.execute('SELECT response, expires FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None or row[1] < now:
+                if row is not None:
+                    self.__delete([key])
+                    self.__connection.commit()
+                self.misses += 1
+                return False, None
+            self.__connection.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+            self.__connection.commit()
+            self.hits += 1
+        return True, json.loads(row[0])
+
+    def put(self, action, data, response, url = ''):
+        ttl = self.ttl(action)
+        if ttl <= 0:
+            return
+        key = self.key(action, data, url)
+        text = json.dumps(response)
+        now = time.time()
+        tags = componentTags(payloadAsDict(data), response if baseAction(action) == 'getComponent' else None)
+        with self.__lock:
+            self.__delete([key])
+            self.__connection.execute('INSERT INTO entries (key, action, response, expires, accessed, size) VALUES (?, ?, ?, ?, ?, ?)',
+                                        (key, baseAction(action), text, now + ttl, now, len(text)))
+            self.__connection.executemany('INSERT INTO tags (tag, key) VALUES (?, ?)', [(tag, key) for tag in tags])
+            self.__evict()
+            self.__connection.commit()
+
+    # Invalidate every entry referring to a component touched by a (mutating) command
+    def invalidate(self, action, data):
+        if isIdempotent(action):
+            return 0
+        tags = componentTags(payloadAsDict(data))
+        if not tags:
+            return 0
+        with self.__lock:
+            keys = [row[0] for tag in tags for row in self.__connection.execute('SELECT key FROM tags WHERE tag = ?', (tag,))]
+            self.__delete(keys)
+            self.__connection.commit()
+        return len(keys)
+
+    def clear(self):
+        with self.__lock:
+            self.__connection.execute('DELETE FROM entries')
+            self.__connection.execute('DELETE FROM tags')
+            self.__connection.commit()
+
+    def stats(self):
+        with self.__lock:
+            entries, size = self.__connection.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        return {'entries': entries, 'bytes': size, 'hits': self.hits, 'misses': self.misses}
+
+    # The following must be called with the lock held
+    def __delete(self, keys):
+        for key in keys:
+            self.__connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+            self.__connection.execute('DELETE FROM tags WHERE key = ?', (key,))
+
+    def __evict(self):
+        expired = self.__connection.execute('DELETE FROM entries WHERE expires < ?', (time.time(),)).rowcount
+        entries, size = self.__connection.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        if entries > self.max_entries or size > self.max_bytes:
+            for key, entry_size in self.__connection.execute('SELECT key, size FROM entries ORDER BY accessed ASC').fetchall():
+                if entries <= self.max_entries and size <= self.max_bytes:
+                    break
+                self.__delete([key])
+                entries -= 1
+                size -= entry_size
+        if expired > 0:
+            self.__connection.execute('DELETE FROM tags WHERE key NOT IN (SELECT key FROM entries)')
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# resultsWatcher.py -- watch an ITSDAQ results directory and hand over the tests of the summary files as they are written
+# Changes are picked up with inotify (if inotify_simple is installed, on Linux) or else by polling the mtimes of the summary files
+# A file is only read once it has been quiet for settle seconds, and only from where the last read stopped: each read parses the tests
+# which are complete (i.e., followed by another %NewTest), while the last test of the file is kept pending until the next %NewTest
+# appears or until the file has been idle for idle seconds
+# Tests are handed to handler(path, tests) on a separate thread, so that slow uploads never hold up the watching
+# The summary files already present when the watch starts are only followed from their current end, unless backfill is set
+# Whatever could not be read or handled is reported (a WARNING, if enable_printing) and kept in errors, up to the last MAX_ERRORS
+
+import os, threading, time
+
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+from itk_pdb.ITSDAQParser import ResultsTail
+from itk_pdb.databaseUtilities import WARNING
+
+# Results summary files (as in ResultsFolder.getFiles())
+EXTENSION = '.txt'
+IGNORE_FILES = ['st_diagnostics_', '_RC_']
+IGNORE_FOLDERS = ['IGNORE']
+
+# Number of (path, exception) errors kept by a ResultsWatcher, the older ones are dropped
+MAX_ERRORS = 100
+
+def isResultsFile(filename):
+    name, extension = os.path.splitext(os.path.basename(filename))
+    return extension == EXTENSION and not any(flag in name for flag in IGNORE_FILES)
+
+# The directories below root, up to depth (0 := just root)
+def _directories(root, depth):
+    directories = [root]
+    if depth > 0:
+        try:
+            entries = sorted(os.listdir(root))
+        except OSError:
+            return directories
+        for entry in entries:
+            path = os.path.join(root, entry)
+            if entry not in IGNORE_FOLDERS and os.path.isdir(path) and not os.path.islink(path):
+                directories += _directories(path, depth - 1)
+    return directories
+
+# Define our observers, whose changes(timeout) waits for up to timeout seconds and returns the set of summary files which may have changed
+# The first call returns all of the summary files present
+class PollingObserver(object):
+
+    def __init__(self, root, depth = 0):
+        self.root = root
+        self.depth = depth
+        self.stamps = {}
+
+    def changes(self, timeout):
+        if self.stamps:
+            time.sleep(timeout)
+        changed = set()
+        stamps = {}
+        for directory in _directories(self.root, self.depth):
+            try:
+                entries = os.listdir(directory)
+            except OSError:
+                continue
+            for entry in entries:
+                if not isResultsFile(entry):
+                    continue
+                path = os.path.join(directory, entry)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                stamps[path] = (stat.st_mtime, stat.st_size)
+                if self.stamps.get(path) != stamps[path]:
+                    changed.add(path)
+        self.stamps = stamps
+        return changed
+
+class InotifyObserver(object):
+
+    def __init__(self, root, depth = 0):
+        if INotify is None:
+            raise ImportError('InotifyObserver requires inotify_simple')
+        self.root = root
+        self.depth = depth
+        self.inotify = INotify()
+        self.watches = {}
+        self.started = False
+        for directory in _directories(root, depth):
+            self.__watch(directory)
+
+    def __watch(self, directory):
+        mask = flags.CREATE | flags.MODIFY | flags.CLOSE_WRITE | flags.MOVED_TO
+        self.watches[self.inotify.add_watch(directory, mask)] = directory
+
+    def __level(self, directory):
+        return os.path.relpath(directory, self.root).count(os.sep) + (0 if os.path.normpath(directory) == os.path.normpath(self.root) else 1)
+
+    def changes(self, timeout):
+        if not self.started:
+            self.started = True
+            return PollingObserver(self.root, self.depth).changes(0)
+        changed = set()
+        for event in self.inotify.read(timeout = int(1000 * timeout)):
+            directory = self.watches.get(event.wd)
+            if directory is None or not event.name:
+                continue
+            path = os.path.join(directory, event.name)
+            if event.mask & flags.ISDIR:
+                if event.mask & (flags.CREATE | flags.MOVED_TO) and event.name not in IGNORE_FOLDERS and self.__level(directory) < self.depth:
+                    self.__watch(path)
+            elif isResultsFile(event.name):
+                changed.add(path)
+        return changed
+
+    def close(self):
+        self.inotify.close()
+
+def makeObserver(root, depth = 0):
+    if INotify is not None:
+        try:
+            return InotifyObserver(root, depth)
+        except OSError:
+            pass
+    return PollingObserver(root, depth)
+
+# Define our watcher
+# results_folder_path := directory of the summary files (e.g., SCTDAQ_VAR/results), depth := as for ResultsFolder.getFiles()
+# handler := function(path, tests) called (on the handler thread) with the new tests of a summary file
+# settle := seconds a file must have been quiet before it is read, idle := seconds after which its last test is taken as complete
+# interval := longest wait for changes [s], observer := overrides makeObserver(results_folder_path, depth)
+# backfill := also read the tests already in the summary files present when the watch starts
+class ResultsWatcher(object):
+
+    def __init__(self, results_folder_path, handler, depth = 0, settle = 5.0, idle = 60.0, interval = 2.0, observer = None, enable_printing = True,
+                    backfill = False):
+        self.results_folder_path = results_folder_path
+        self.handler = handler
+        self.settle = settle
+        self.idle = idle
+        self.interval = interval
+        self.observer = observer if observer is not None else makeObserver(results_folder_path, depth)
+        self.enable_printing = enable_printing
+        self.tails = {}
+        # {path: time of the last change which has not been read yet}
+        self.changed = {}
+        # {path: time of the last change}
+        self.modified = {}
+        self.backfill = backfill
+        self.started = False
+        self.queue = Queue()
+        self.errors = []
+
+    # Watch for changes once (waiting for up to timeout seconds) and read whatever is due, returns the number of tests queued
+    def poll(self, timeout = None):
+        changes = self.observer.changes(self.interval if timeout is None else timeout)
+        # The first changes are the files already present: unless backfilling, their tests so far are left alone
+        if not self.started:
+            self.started = True
+            if not self.backfill:
+                for path in changes:
+                    self.tails[path] = ResultsTail(path, offset = os.path.getsize(path) if os.path.exists(path) else 0, skipErrors = True)
+                changes = set()
+        for path in changes:
+            self.changed[path] = self.modified[path] = time.time()
+        now = time.time()
+        queued = 0
+        for path, changed in list(self.changed.items()):
+            if now - changed >= self.settle:
+                del self.changed[path]
+                queued += self.__read(path)
+        for path, tail in self.tails.items():
+            if tail.pending and path not in self.changed and now - self.modified.get(path, 0) >= self.idle:
+                queued += self.__read(path, final = True)
+        return queued
+
+    def __read(self, path, final = False):
+        tail = self.tails.setdefault(path, ResultsTail(path, skipErrors = True))
+        try:
+            tests = tail.read(final = final)
+        except Exception as e:
+            # Whatever could not be read: skip what we have, the rest of the file will still be read as it grows
+            self.__error(path, e, 'Could not read')
+            tail.offset = os.path.getsize(path) if os.path.exists(path) else 0
+            tail.pending = False
+            return 0
+        # Malformed blocks (e.g., a number which does not parse) are skipped by the tail, the other tests of the read are kept
+        for e in tail.errors:
+            self.__error(path, e, 'Skipped a malformed test in')
+        del tail.errors[:]
+        if tests:
+            self.queue.put((path, tests))
+        return len(tests)
+
+    # Report an error as it happens, keeping only the last MAX_ERRORS
+    def __error(self, path, e, message):
+        if self.enable_printing:
+            WARNING('%s \'%s\' -- %s: %s' % (message, path, type(e).__name__, e))
+        self.errors.append((path, e))
+        del self.errors[:-MAX_ERRORS]
+
+    # Hand over queued tests until stop is set (and the queue is empty)
+    def __handle(self, stop):
+        while not (stop.is_set() and self.queue.empty()):
+            try:
+                path, tests = self.queue.get(timeout = 0.5)
+            except Empty:
+                continue
+            try:
+                self.handler(path, tests)
+            except Exception as e:
+                self.__error(path, e, 'Could not handle the tests of')
+            finally:
+                self.queue.task_done()
+
+    # Watch until stop (a threading.Event) is set, or forever
+    def run(self, stop = None):
+        stop = stop if stop is not None else threading.Event()
+        handler = threading.Thread(target = self.__handle, args = (stop,))
+        handler.daemon = True
+        handler.start()
+        try:
+            while not stop.is_set():
+                self.poll()
+        finally:
+            stop.set()
+            handler.join()
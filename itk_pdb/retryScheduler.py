@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# retryScheduler.py -- adaptive retries and rate-limit aware scheduling of uuCMD requests
+# Failed responses are classified from their status code and uuAppErrorMap; commands which are safe to send again are retried with
+# jittered exponential backoff (or after the server's Retry-After), and the number of requests in flight is adapted to throttling:
+# it grows by one for every window of successful requests and is halved whenever the server throttles us (AIMD)
+
+import random, threading, time
+from email.utils import parsedate_tz, mktime_tz
+
+import requests
+
+from itk_pdb.responseCache import baseAction, isIdempotent
+from itk_pdb import instrumentation
+
+# Error classes
+THROTTLED   = 'throttled'   # the server asks us to slow down (429, or 503 with Retry-After), the request was not processed
+TRANSIENT   = 'transient'   # gateway/availability errors and timeouts, which are likely to go away
+AUTH        = 'auth'        # the token was rejected (handled by the token manager, not retried here)
+CLIENT      = 'client'      # the request itself is wrong (invalidDtoIn, unknown component, ...), sending it again will not help
+SERVER      = 'server'      # any other server error
+
+# Parts of uuAppErrorMap keys identifying an error class (compared case-insensitively)
+THROTTLED_KEYS  = ['toomanyrequests', 'ratelimit', 'throttl', 'quota']
+TRANSIENT_KEYS  = ['timeout', 'unavailable', 'connectionfailed', 'temporar']
+AUTH_KEYS       = ['invalidtoken', 'unauthorized', 'signature verification']
+CLIENT_KEYS     = ['invaliddtoin', 'daogetbycodefailed', 'notfound', 'doesnotexist']
+
+# Classify a failed response from its status code, uuAppErrorMap (dict, may be None) and Retry-After (seconds or None)
+def classifyError(status, errorMap = None, retryAfter = None):
+    keys = ' '.join(list(errorMap.keys()) + [str(value.get('message', '')) for value in errorMap.values() if isinstance(value, dict)]).lower() if errorMap else ''
+    if status == 429 or (status == 503 and retryAfter is not None) or any(key in keys for key in THROTTLED_KEYS):
+        return THROTTLED
+    if status == 401 or any(key in keys for key in AUTH_KEYS):
+        return AUTH
+    if any(key in keys for key in CLIENT_KEYS):
+        return CLIENT
+    if status in [408, 502, 503, 504] or any(key in keys for key in TRANSIENT_KEYS):
+        return TRANSIENT
+    if 400 <= status < 500:
+        return CLIENT
+    return SERVER
+
+# Seconds to wait according to a Retry-After header (either a number of seconds or an HTTP date), None if absent or unreadable
+def parseRetryAfter(value, now = None):
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        date = parsedate_tz(value)
+    except (TypeError, AttributeError):
+        return None
+    if date is None:
+        return None
+    return max(0.0, mktime_tz(date) - (now if now is not None else time.time()))
+
+def _errorMap(response):
+    try:
+        errorMap = response.json().get('uuAppErrorMap')
+    except (ValueError, AttributeError):
+        return None
+    return errorMap if isinstance(errorMap, dict) else None
+
+# Classify a (non-200) requests.Response, returns (error class, Retry-After in seconds or None)
+def classifyResponse(response):
+    retryAfter = parseRetryAfter(response.headers.get('Retry-After'))
+    return classifyError(response.status_code, _errorMap(response), retryAfter), retryAfter
+
+# Commands which modify the DB but only assign a value, so that sending one twice leaves the DB as sending it once
+# NOTE: not every set* command is one -- e.g., setComponentStage appends to the stage history (and setComponentGrade to the grades),
+# so sending it again after a timeout could record it twice
+REPLAYABLE_ACTIONS = ['setComponentTrashed', 'setComponentCompleted', 'setComponentProperty', 'setParentChildRelationPropertyBySlot', 'setTestRunStatus']
+
+# Commands which may be sent again after a failure which could have reached the server: commands which do not modify the DB, and
+# those in REPLAYABLE_ACTIONS (the others are only sent again when they were throttled, i.e., not processed)
+def isReplayable(action):
+    action = baseAction(action)
+    return isIdempotent(action) or action in REPLAYABLE_ACTIONS
+
+# Define our adaptive concurrency limit
+# limit := initial number of requests allowed in flight, minimum/maximum := bounds of the limit
+# Every success raises the limit by 1/limit (i.e., by one per window of successes), throttling halves it -- at most once per cooldown
+# seconds, so that a burst of throttled responses to the same window only counts once
+class AdaptiveLimit(object):
+
+    def __init__(self, limit = 16, minimum = 1, maximum = 64, cooldown = 1.0):
+        if not 1 <= minimum <= limit <= maximum:
+            raise ValueError('Expected 1 <= minimum <= limit <= maximum: %s, %s, %s' % (minimum, limit, maximum))
+        self.limit = float(limit)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.cooldown = cooldown
+        self.inflight = 0
+        self.__decreased = None
+        self.__condition = threading.Condition()
+
+    def acquire(self):
+        with self.__condition:
+            while self.inflight >= int(self.limit):
+                self.__condition.wait()
+            self.inflight += 1
+
+    def release(self):
+        with self.__condition:
+            self.inflight -= 1
+            self.__condition.notify()
+
+    def onSuccess(self):
+        with self.__condition:
+            if self.limit < self.maximum:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+                self.__condition.notify()
+
+    def onThrottle(self):
+        with self.__condition:
+            now = time.time()
+            if self.__decreased is None or now - self.__decreased >= self.cooldown:
+                self.limit = max(float(self.minimum), self.limit / 2)
+                self.__decreased = now
+
+# Define our scheduler
+# max_attempts := attempts per request (including the first)
+# backoff := base of the exponential backoff [s], the n-th retry waits a random time in [0, min(max_backoff, backoff * 2^n)] ("full jitter")
+# max_retry_after := longest Retry-After we are prepared to honour [s] (longer ones fail the request)
+# concurrency, min_concurrency, max_concurrency := see AdaptiveLimit
+# replayable := function deciding whether an action may be sent again after a transient or server error (default: isReplayable)
+class RetryScheduler(object):
+
+    def __init__(self, max_attempts = 5, backoff = 0.5, max_backoff = 30.0, max_retry_after = 120.0,
+                    concurrency = 16, min_concurrency = 1, max_concurrency = 64, replayable = isReplayable, sleep = time.sleep):
+        if max_attempts < 1:
+            raise ValueError('max_attempts must be >= 1: %s' % max_attempts)
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self.limit = AdaptiveLimit(concurrency, min_concurrency, max_concurrency)
+        self.replayable = replayable
+        self.sleep = sleep
+
+    # Time to wait before retry number attempt (1, 2, ...)
+    def delay(self, attempt, retryAfter = None):
+        if retryAfter is not None:
+            return retryAfter
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    # Decide whether to retry after an error of class kind -- throttled requests were not processed, so they can always be sent again
+    def shouldRetry(self, action, kind, attempt, retryAfter = None, replayable = None):
+        if attempt >= self.max_attempts:
+            return False
+        if retryAfter is not None and retryAfter > self.max_retry_after:
+            return False
+        if kind == THROTTLED:
+            return replayable is not False
+        if kind in [TRANSIENT, SERVER]:
+            return replayable if replayable is not None else self.replayable(action)
+        return False
+
+    # Send a request with send() (which returns a requests.Response), retrying it as needed, and return the final response
+    # Connection errors are retried like transient errors, and raised once we give up
+    # replayable := overrides self.replayable(action) (e.g., False for a body which cannot be sent twice)
+    def send(self, action, send, replayable = None):
+        action = baseAction(action)
+        attempt = 0
+        while True:
+            attempt += 1
+            self.limit.acquire()
+            try:
+                response = send()
+            except (requests.ConnectionError, requests.Timeout):
+                if not self.shouldRetry(action, TRANSIENT, attempt, replayable = replayable):
+                    raise
+                kind, retryAfter = TRANSIENT, None
+            else:
+                if response.status_code < 400:
+                    self.limit.onSuccess()
+                    return response
+                kind, retryAfter = classifyResponse(response)
+                if not self.shouldRetry(action, kind, attempt, retryAfter, replayable):
+                    return response
+                response.close()
+            finally:
+                self.limit.release()
+            if kind == THROTTLED:
+                self.limit.onThrottle()
+            instrumentation.record(action, retry = True)
+            self.sleep(self.delay(attempt, retryAfter))
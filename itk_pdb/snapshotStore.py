@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# snapshotStore.py -- a local (SQLite) snapshot of the components of the ITkPD, their stage histories and their test runs, for analytics
+# A refresh pages through listComponents for a project/componentType and only writes the components which are new, have changed or have
+# gone: each one carries a stamp (its cts, current stage and the dateTime of its latest stage), and getComponent (for the stage history
+# and the test runs) is only called for those whose stamp has moved since they were last fetched, or which were last fetched more than
+# maxAge ago (test runs are uploaded without the component changing stage, so they can only be kept up to date by refetching)
+# Queries never touch the network: the listing of a project is kept as a columnar ComponentTable (NumPy arrays saved in the snapshot),
+# rebuilt only after a refresh changed something, so loading the components of a project takes milliseconds rather than a download
+
+import io, os, json, time, sqlite3, threading
+import numpy as np
+
+from itk_pdb.componentTable import ComponentTable, Categories
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.itk_pdb', 'snapshot.sqlite')
+
+# Components whose details (stage history and test runs) were fetched longer ago than this [s] are fetched again
+DEFAULT_MAX_AGE = 24 * 3600
+
+# The stamp of a component in a listing, which changes whenever it is created anew or moves stage
+def componentStamp(component):
+    currentStage = component.get('currentStage')
+    currentStage = currentStage.get('code') if isinstance(currentStage, dict) else currentStage
+    latest = max([stage.get('dateTime') or '' for stage in component.get('stages') or []] + [component.get('cts') or ''])
+    return '%s|%s' % (currentStage, latest)
+
+def _code(value):
+    return value.get('code') if isinstance(value, dict) else value
+
+# Save/load a ComponentTable as the bytes of an .npz (the categories are saved as JSON, so nothing needs to be pickled)
+def _packTable(table):
+    arrays = dict(('column_' + name, column) for name, column in table.columns.items())
+    arrays['stageOffsets'], arrays['stageCodes'], arrays['stageTimes'] = table.stageOffsets, table.stageCodes, table.stageTimes
+    arrays['categories'] = np.array(json.dumps(dict((name, categories.values) for name, categories in table.categories.items())))
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+def _unpackTable(data):
+    arrays = np.load(io.BytesIO(data), allow_pickle = False)
+    columns = dict((name[len('column_'):], arrays[name]) for name in arrays.files if name.startswith('column_'))
+    categories = dict((name, Categories(values)) for name, values in json.loads(str(arrays['categories'])).items())
+    return ComponentTable(columns, categories, arrays['stageOffsets'], arrays['stageCodes'], arrays['stageTimes'])
+
+# Define our snapshot
+# path := SQLite file (created with its parent directory if needed), or ':memory:'
+class SnapshotStore(object):
+
+    def __init__(self, path = DEFAULT_PATH):
+        self.path = path
+        self.__lock = threading.Lock()
+        if path != ':memory:' and os.path.dirname(path) != '' and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        self.__connection = sqlite3.connect(path, timeout = 30, check_same_thread = False)
+        with self.__lock:
+            self.__connection.executescript('''
+                CREATE TABLE IF NOT EXISTS components (code TEXT PRIMARY KEY, project TEXT, componentType TEXT, stamp TEXT, fetchedStamp TEXT,
+                                                        fetched REAL, listing TEXT);
+                CREATE INDEX IF NOT EXISTS componentsByType ON components (project, componentType);
+                CREATE TABLE IF NOT EXISTS stages (code TEXT, stage TEXT, dateTime TEXT, PRIMARY KEY (code, stage, dateTime));
+                CREATE TABLE IF NOT EXISTS testRuns (id TEXT PRIMARY KEY, code TEXT, testType TEXT, state TEXT, date TEXT, runNumber TEXT);
+                CREATE INDEX IF NOT EXISTS testRunsByComponent ON testRuns (code);
+                CREATE TABLE IF NOT EXISTS refreshes (project TEXT, componentType TEXT, refreshed REAL, PRIMARY KEY (project, componentType));
+                CREATE TABLE IF NOT EXISTS tables (project TEXT PRIMARY KEY, data BLOB);
+            ''')
+            self.__connection.commit()
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
+
+    def __len__(self):
+        with self.__lock:
+            return self.__connection.execute('SELECT COUNT(*) FROM components').fetchone()[0]
+
+    # The time of the last refresh of project/componentType, None if it was never refreshed
+    def refreshed(self, project, componentType):
+        with self.__lock:
+            row = self.__connection.execute('SELECT refreshed FROM refreshes WHERE project = ? AND componentType = ?', (project, componentType)).fetchone()
+        return row[0] if row is not None else None
+
+    ##############
+    # Refreshing #
+    ##############
+
+    # Bring the snapshot of project/componentType up to date with a listing (an iterable of component JSONs)
+    # details := also return the components whose details need to be fetched (new stamp, or fetched more than maxAge seconds ago)
+    # Return ({code: stamp} of the components which need to be fetched, the number of components written, the number removed)
+    def update(self, project, componentType, listing, details = False, maxAge = DEFAULT_MAX_AGE):
+        now = time.time()
+        with self.__lock:
+            known = dict((code, (stamp, fetchedStamp, text, fetched)) for code, stamp, fetchedStamp, text, fetched in self.__connection.execute(
+                            'SELECT code, stamp, fetchedStamp, listing, fetched FROM components WHERE project = ? AND componentType = ?', (project, componentType)))
+        seen, changed, stale = set(), [], {}
+        for component in listing:
+            code = component['code']
+            seen.add(code)
+            text = json.dumps(component, sort_keys = True)
+            stamp = componentStamp(component)
+            old = known.get(code)
+            if old is None or old[2] != text:
+                changed.append((code, stamp, text, component.get('stages')))
+            if details and (old is None or old[1] != stamp or old[3] is None or now - old[3] > maxAge):
+                stale[code] = stamp
+        removed = [code for code in known if code not in seen]
+
+        with self.__lock:
+            for code, stamp, text, stages in changed:
+                self.__connection.execute('INSERT OR REPLACE INTO components (code, project, componentType, stamp, fetchedStamp, fetched, listing) '
+                                            'VALUES (?, ?, ?, ?, (SELECT fetchedStamp FROM components WHERE code = ?), (SELECT fetched FROM components WHERE code = ?), ?)',
+                                            (code, project, componentType, stamp, code, code, text))
+                # Listings which include the stage history give it for free
+                if stages is not None:
+                    self.__replaceStages(code, stages)
+            for code in removed:
+                for table in ['components', 'stages', 'testRuns']:
+                    self.__connection.execute('DELETE FROM %s WHERE code = ?' % table, (code,))
+            if changed or removed:
+                self.__connection.execute('DELETE FROM tables WHERE project = ?', (project,))
+            self.__connection.execute('INSERT OR REPLACE INTO refreshes (project, componentType, refreshed) VALUES (?, ?, ?)', (project, componentType, time.time()))
+            self.__connection.commit()
+        return stale, len(changed), len(removed)
+
+    def __replaceStages(self, code, stages):
+        self.__connection.execute('DELETE FROM stages WHERE code = ?', (code,))
+        self.__connection.executemany('INSERT OR IGNORE INTO stages (code, stage, dateTime) VALUES (?, ?, ?)',
+                                        [(code, stage.get('code'), stage.get('dateTime')) for stage in stages])
+
+    # Record the stage histories and test runs of fetched components, {code: (stamp, component JSON from getComponent)}
+    def record(self, components):
+        now = time.time()
+        with self.__lock:
+            for code, (stamp, component) in components.items():
+                self.__replaceStages(code, component.get('stages') or [])
+                self.__connection.execute('DELETE FROM testRuns WHERE code = ?', (code,))
+                for test in component.get('tests') or []:
+                    self.__connection.executemany('INSERT OR REPLACE INTO testRuns (id, code, testType, state, date, runNumber) VALUES (?, ?, ?, ?, ?, ?)',
+                                                    [(testRun.get('id'), code, _code(test.get('code')) or _code(test.get('testType')), _code(testRun.get('state')),
+                                                        testRun.get('date') or testRun.get('cts'), testRun.get('runNumber')) for testRun in test.get('testRuns') or []])
+                self.__connection.execute('UPDATE components SET fetchedStamp = ?, fetched = ? WHERE code = ?', (stamp, now, code))
+            self.__connection.commit()
+
+    # Refresh project/componentType from a listing of it, e.g., ITkPDSession.doSomethingPaged('listComponents', ...) or
+    # databaseUtilities.commands['listComponents'].iterate(...)
+    # getComponents := function(codes, workers, return_exceptions) generating (code, component JSON) pairs, e.g., ITkPDSession.getComponents
+    # or databaseUtilities.getComponents: if given, the stage histories and test runs of the components whose stamp moved since they were
+    # last fetched, or which were last fetched more than maxAge seconds ago, are also fetched (concurrently, over workers)
+    # Return {'written': n, 'removed': n, 'fetched': n, 'errors': [(code, exception), ...]}
+    def refresh(self, listing, project, componentType, getComponents = None, workers = 8, maxAge = DEFAULT_MAX_AGE):
+        stale, written, removed = self.update(project, componentType, listing, details = getComponents is not None, maxAge = maxAge)
+        fetched, errors = {}, []
+        if stale:
+            for code, component in getComponents(list(stale.keys()), workers = workers, return_exceptions = True):
+                if isinstance(component, Exception):
+                    errors.append((code, component))
+                else:
+                    fetched[code] = (stale[code], component)
+            self.record(fetched)
+        return {'written': written, 'removed': removed, 'fetched': len(fetched), 'errors': errors}
+
+    ############
+    # Querying #
+    ############
+
+    # The components of project as a ComponentTable (ordered by code), optionally only those of the given componentType/type/currentStage
+    # (codes or lists of codes)
+    def table(self, project, componentType = None, type = None, currentStage = None):
+        with self.__lock:
+            row = self.__connection.execute('SELECT data FROM tables WHERE project = ?', (project,)).fetchone()
+            if row is None:
+                listings = [json.loads(text) for text, in self.__connection.execute('SELECT listing FROM components WHERE project = ? ORDER BY code', (project,))]
+                table = ComponentTable.fromComponents(listings)
+                self.__connection.execute('INSERT OR REPLACE INTO tables (project, data) VALUES (?, ?)', (project, sqlite3.Binary(_packTable(table))))
+                self.__connection.commit()
+            else:
+                table = _unpackTable(bytes(row[0]))
+        mask = np.ones(len(table), dtype = bool)
+        for name, values in [('componentType', componentType), ('type', type), ('currentStage', currentStage)]:
+            if values is not None:
+                mask &= table.isIn(name, values if isinstance(values, (list, tuple)) else [values])
+        return table if mask.all() else table.subset(mask)
+
+    # Generate the (code, stage, dateTime) events of codes (default: all), ordered by code (as StageLog.events(), for StageTimeline.fromEvents())
+    def events(self, codes = None):
+        with self.__lock:
+            rows = self.__connection.execute('SELECT code, stage, dateTime FROM stages ORDER BY code, dateTime').fetchall()
+        if codes is not None:
+            codes = set(codes)
+            rows = [row for row in rows if row[0] in codes]
+        return rows
+
+    # The test runs of codes (default: all), as dictionaries ordered by component and date
+    def testRuns(self, codes = None, testType = None):
+        with self.__lock:
+            rows = self.__connection.execute('SELECT id, code, testType, state, date, runNumber FROM testRuns ORDER BY code, date').fetchall()
+        keys = ['id', 'code', 'testType', 'state', 'date', 'runNumber']
+        codes = set(codes) if codes is not None else None
+        return [dict(zip(keys, row)) for row in rows if (codes is None or row[1] in codes) and (testType is None or row[2] == testType)]
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# stageTimeline.py -- stage histories of components, kept as a local (SQLite) event log and aggregated into per-stage timelines
+# The stage history of a component needs a getComponent, so the log remembers the histories fetched by previous runs along with the
+# current stage they were fetched at: a run only fetches (concurrently, through ITkPDSession.getComponents) the components which are new
+# or whose current stage in the listing has changed since
+# A timeline holds the events (component, stage, dateTime) as flat arrays: a component is in a stage from its dateTime until the dateTime
+# of its next stage, so the number of components in each stage over time is a cumsum of +1 (entries) and -1 (exits) per time bucket
+
+import os, time, sqlite3, threading
+import numpy as np
+
+from itk_pdb.componentTable import Categories, MISSING, _timestamp, _datetimes
+from itk_pdb.dateCounts import binDays, cumulativeSeries
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.itk_pdb', 'stage_log.sqlite')
+
+# Define our event log
+# path := SQLite file (created with its parent directory if needed), or ':memory:'
+class StageLog(object):
+
+    def __init__(self, path = DEFAULT_PATH):
+        self.path = path
+        self.__lock = threading.Lock()
+        if path != ':memory:' and os.path.dirname(path) != '' and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        self.__connection = sqlite3.connect(path, timeout = 30, check_same_thread = False)
+        with self.__lock:
+            self.__connection.executescript('''
+                CREATE TABLE IF NOT EXISTS components (code TEXT PRIMARY KEY, currentStage TEXT, fetched REAL);
+                CREATE TABLE IF NOT EXISTS events (code TEXT, stage TEXT, dateTime TEXT, PRIMARY KEY (code, stage, dateTime));
+            ''')
+            self.__connection.commit()
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
+
+    def __len__(self):
+        with self.__lock:
+            return self.__connection.execute('SELECT COUNT(*) FROM components').fetchone()[0]
+
+    # Of listing ((code, currentStage) pairs), the codes whose history was never fetched or was fetched at another current stage
+    def stale(self, listing):
+        with self.__lock:
+            known = dict(self.__connection.execute('SELECT code, currentStage FROM components'))
+        return [code for code, currentStage in listing if code not in known or known[code] != currentStage]
+
+    # Record the stage history of components, {code: component JSON (with 'currentStage' and 'stages')}, replacing what was known
+    def record(self, components):
+        now = time.time()
+        with self.__lock:
+            for code, component in components.items():
+                currentStage = component.get('currentStage')
+                currentStage = currentStage.get('code') if isinstance(currentStage, dict) else currentStage
+                self.__connection.execute('DELETE FROM events WHERE code = ?', (code,))
+                self.__connection.executemany('INSERT OR IGNORE INTO events (code, stage, dateTime) VALUES (?, ?, ?)',
+                                                [(code, stage.get('code'), stage.get('dateTime')) for stage in component.get('stages') or []])
+                self.__connection.execute('INSERT OR REPLACE INTO components (code, currentStage, fetched) VALUES (?, ?, ?)', (code, currentStage, now))
+            self.__connection.commit()
+
+    # Generate the (code, stage, dateTime) events of codes (default: all), ordered by code
+    def events(self, codes = None):
+        with self.__lock:
+            rows = self.__connection.execute('SELECT code, stage, dateTime FROM events ORDER BY code').fetchall()
+        if codes is not None:
+            codes = set(codes)
+            rows = [row for row in rows if row[0] in codes]
+        return rows
+
+# Fetch the stage histories of the components in listing ((code, currentStage) pairs) which the log does not know (at that current stage)
+# session := (authenticated) ITkPDSession, workers := concurrent getComponent requests
+# Return the number of components fetched and the list of (code, exception) for those which could not be
+def updateLog(session, log, listing, workers = 8):
+    stale = log.stale(listing)
+    fetched, errors = {}, []
+    for code, component in session.getComponents(stale, workers = workers, return_exceptions = True):
+        if isinstance(component, Exception):
+            errors.append((code, component))
+        else:
+            fetched[code] = component
+    log.record(fetched)
+    return len(fetched), errors
+
+# Define our timeline
+# components := the code of each component, stages := Categories of the stage codes
+# component, stage := index into components/stages of each event, entered := datetime64[ms] of each event
+class StageTimeline(object):
+
+    def __init__(self, components, stages, component, stage, entered):
+        order = np.lexsort((entered, component))
+        self.components = components
+        self.stages = stages
+        self.component = component[order]
+        self.stage = stage[order]
+        self.entered = entered[order]
+
+    @classmethod
+    def fromEvents(cls, events):
+        components, stages = Categories(), Categories()
+        component, stage, entered = [], [], []
+        for code, stageCode, dateTime in events:
+            component.append(components.encode(code))
+            stage.append(stages.encode(stageCode))
+            entered.append(_timestamp(dateTime))
+        return cls(components.values, stages, np.array(component, dtype = np.int32), np.array(stage, dtype = np.int32), _datetimes(entered))
+
+    # From the stages of a ComponentTable (e.g., a listing which includes them), rows := boolean mask or row indices (default: all)
+    @classmethod
+    def fromTable(cls, table, rows = None):
+        rows = np.arange(len(table)) if rows is None else (np.nonzero(rows)[0] if np.asarray(rows).dtype == bool else np.asarray(rows))
+        counts = np.diff(table.stageOffsets)[rows]
+        events = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(table.stageOffsets[rows], counts)
+        codes = [table.value('code', i) for i in rows]
+        return cls(codes, table.categories['currentStage'], np.repeat(np.arange(len(rows), dtype = np.int32), counts),
+                    table.stageCodes[events], table.stageTimes[events])
+
+    def __len__(self):
+        return len(self.component)
+
+    # The time each event ends (the time of the next event of the same component, NaT for the current stage)
+    def exited(self):
+        exited = np.full(len(self), np.datetime64('NaT'), dtype = 'datetime64[ms]')
+        same = self.component[1:] == self.component[:-1]
+        exited[:-1][same] = self.entered[1:][same]
+        return exited
+
+    # Number of components in each stage over time, in the counter shape of dateCounts.cumulativeCounts()
+    # 'total' is the number of components which have entered any stage, stages := the stage codes to include (default: all)
+    def counts(self, binning = 'day', lowerDate = None, upperDate = None, stages = None):
+        dated = ~np.isnat(self.entered) & (self.stage != MISSING)
+        if not dated.any():
+            return {}
+        component, stage, entered, exited = self.component[dated], self.stage[dated], self.entered[dated], self.exited()[dated]
+        entries = binDays(entered.astype('datetime64[D]'), binning)
+        left = ~np.isnat(exited)
+        exits = binDays(exited[left].astype('datetime64[D]'), binning)
+        origin = entries.min()
+        entryIndex = (entries - origin).astype(np.int64)
+        exitIndex = (exits - origin).astype(np.int64)
+        n_buckets = int(max(entryIndex.max(), exitIndex.max() if len(exitIndex) else 0)) + 1
+        n_stages = len(self.stages)
+
+        # +1 in the bucket a component enters a stage, -1 in the bucket it leaves it (for the next one)
+        into = np.bincount(stage.astype(np.int64) * n_buckets + entryIndex, minlength = n_stages * n_buckets).reshape(n_stages, n_buckets)
+        out = np.bincount(stage[left].astype(np.int64) * n_buckets + exitIndex, minlength = n_stages * n_buckets).reshape(n_stages, n_buckets)
+
+        # The first event of each component is when it entered the timeline
+        first = np.ones(len(component), dtype = bool)
+        first[1:] = component[1:] != component[:-1]
+        total = np.bincount(entryIndex[first], minlength = n_buckets)
+
+        keys, changes, active = ['total'], [total], [total > 0]
+        for i, code in enumerate(self.stages.values):
+            if (into[i].any() or out[i].any()) and (stages is None or code in stages):
+                keys.append(code)
+                changes.append(into[i] - out[i])
+                active.append((into[i] + out[i]) > 0)
+        return cumulativeSeries(keys, np.vstack(changes), np.vstack(active), origin, binning, lowerDate, upperDate)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# tableCuts.py -- cuts on the columns of a ComponentTable, written as expressions and evaluated as boolean masks over all rows at once
+# e.g., cut = Column('institution').isIn(['LBNL', 'RAL']) & (Column('currentGrade') >= 2) & ~Column('trashed').isIn([True])
+#       mask = cut.mask(table)
+# A cut is built once (nothing is evaluated until mask() is called) and a component which is missing the value of a column never passes
+# a comparison on that column, as when a cut used to be applied to the component JSON itself
+
+import operator
+import numpy as np
+
+from itk_pdb.componentTable import FLAG_COLUMNS, STRING_COLUMNS, MISSING
+
+# Virtual column of the creation day of each component ('YYYY-MM-DD', compared as datetime64[D])
+DAY = 'day'
+
+# Define our cut, a named predicate over a table
+# predicate := function(table) returning a boolean mask with one entry per row
+class Cut(object):
+
+    def __init__(self, name, predicate):
+        self.name = name
+        self.predicate = predicate
+
+    def __repr__(self):
+        return 'Cut(%s)' % self.name
+
+    def mask(self, table):
+        return np.asarray(self.predicate(table), dtype = bool)
+
+    def __and__(self, other):
+        return Cut('(%s & %s)' % (self.name, other.name), lambda table: self.mask(table) & other.mask(table))
+
+    def __or__(self, other):
+        return Cut('(%s | %s)' % (self.name, other.name), lambda table: self.mask(table) | other.mask(table))
+
+    def __invert__(self):
+        return Cut('~%s' % self.name, lambda table: ~self.mask(table))
+
+# A cut which every row passes
+ALL = Cut('all', lambda table: np.ones(len(table), dtype = bool))
+
+# Combine cuts with &, ALL if there are none
+def allOf(cuts):
+    combined = ALL
+    for cut in cuts:
+        combined = cut if combined is ALL else combined & cut
+    return combined
+
+# Define a column of a table, whose comparisons with a value build cuts
+class Column(object):
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return 'Column(%s)' % self.name
+
+    # The (raw) values of the column and the mask of the rows where it is set
+    def __values(self, table):
+        if self.name == DAY:
+            days = table.days()
+            return days, ~np.isnat(days)
+        return table.column(self.name), table.isSet(self.name)
+
+    # The value in the representation of the column
+    def __encode(self, value):
+        if self.name == DAY:
+            return np.datetime64(value, 'D')
+        if self.name == 'cts':
+            return np.datetime64(value[:-1] if value.endswith('Z') else value, 'ms')
+        if self.name in STRING_COLUMNS:
+            return value.encode('ascii', 'replace')
+        if self.name in FLAG_COLUMNS:
+            return MISSING if value is None else int(bool(value))
+        return value
+
+    def isIn(self, values):
+        values = list(values)
+        if self.name == DAY:
+            return Cut('%s in %s' % (self.name, values), lambda table: np.isin(table.days(), [np.datetime64(value, 'D') for value in values]))
+        return Cut('%s in %s' % (self.name, values), lambda table: table.isIn(self.name, values))
+
+    def isSet(self):
+        return Cut('%s is set' % self.name, lambda table: self.__values(table)[1])
+
+    def __compare(self, symbol, function, value):
+        def predicate(table):
+            column, isSet = self.__values(table)
+            if self.name in table.categories:
+                # Categories are interned, so only (in)equality is meaningful: compare the codes
+                if function not in [operator.eq, operator.ne]:
+                    raise TypeError('Column \'%s\' only supports == and !=' % self.name)
+                mask = table.isIn(self.name, [value])
+                return isSet & (mask if function is operator.eq else ~mask)
+            return isSet & function(column, self.__encode(value))
+        return Cut('%s %s %r' % (self.name, symbol, value), predicate)
+
+    def __eq__(self, value):
+        return self.__compare('==', operator.eq, value)
+
+    def __ne__(self, value):
+        return self.__compare('!=', operator.ne, value)
+
+    def __lt__(self, value):
+        return self.__compare('<', operator.lt, value)
+
+    def __le__(self, value):
+        return self.__compare('<=', operator.le, value)
+
+    def __gt__(self, value):
+        return self.__compare('>', operator.gt, value)
+
+    def __ge__(self, value):
+        return self.__compare('>=', operator.ge, value)
+
+    # Columns are compared with values, not with each other (and are not hashed by value)
+    __hash__ = object.__hash__
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# tokenManager.py -- keeps a valid ITk Production Database token for as long as it is needed
+# Tokens are refreshed ahead of their expiry (in a background thread), re-granted once when the server rejects them, and shared
+# between threads and processes through a file-locked token cache, so that parallel workers do not all ask the OIDC endpoint at once
+
+import base64, contextlib, json, os, threading, time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Default location of the shared token cache (override with the ITK_DB_TOKEN_CACHE environment variable, set it empty to disable)
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.itk_pdb', 'token.json')
+
+# Tokens are considered stale refresh_margin seconds before they expire; the background thread refreshes them twice as early
+DEFAULT_REFRESH_MARGIN = 300
+
+# Path of the shared token cache, or None if it is disabled
+def tokenCachePath():
+    path = os.getenv('ITK_DB_TOKEN_CACHE', DEFAULT_PATH)
+    return path if path != '' else None
+
+# id_tokens are JWTs -- the expiry is the 'exp' claim of the (base64url encoded) payload
+def tokenExpiry(id_token):
+    try:
+        payload = id_token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload.encode('ascii')).decode('utf-8'))['exp'])
+    except (IndexError, KeyError, ValueError, TypeError, AttributeError):
+        return None
+
+# Define our token manager
+# grant := function taking prompt (whether it may ask the user for access codes) and returning the grantToken response
+#          (a dictionary with 'id_token' and, ideally, 'expires_at'), or None if it cannot get a token without prompting
+# path := shared token cache (None to disable), key := entry in the cache (e.g., the OIDC URL)
+# background := refresh ahead of expiry in a daemon thread
+class TokenManager(object):
+
+    def __init__(self, grant, path = DEFAULT_PATH, key = '', refresh_margin = DEFAULT_REFRESH_MARGIN, background = True):
+        self.grant = grant
+        self.path = path
+        self.key = key
+        self.refresh_margin = refresh_margin
+        self.background = background
+        self.id_token = None
+        self.expires_at = None
+        self.grants = 0
+        self.__lock = threading.RLock()
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    # Start with a token obtained elsewhere (e.g., from ITK_DB_AUTH)
+    def seed(self, id_token, expires_at = None):
+        with self.__lock:
+            self.id_token = id_token
+            self.expires_at = expires_at if expires_at is not None else tokenExpiry(id_token)
+            self.__schedule()
+
+    # Stop the background refresh
+    def stop(self):
+        self.__stop.set()
+
+    def __isValid(self, id_token, expires_at, margin):
+        return id_token is not None and (expires_at is None or time.time() < expires_at - margin)
+
+    # Return a token which is good for at least refresh_margin seconds, granting a new one if needed
+    def token(self):
+        with self.__lock:
+            if self.__isValid(self.id_token, self.expires_at, self.refresh_margin):
+                return self.id_token
+            return self.__refresh(prompt = True)
+
+    # Force a new token
+    def refresh(self, prompt = True):
+        with self.__lock:
+            return self.__refresh(prompt = prompt, rejected = self.id_token)
+
+    # The server rejected id_token: return a new token (which may already have been granted by another thread/process)
+    def invalidate(self, id_token):
+        with self.__lock:
+            return self.__refresh(prompt = True, rejected = id_token)
+
+    # The following must be called with the lock held
+    def __refresh(self, prompt, rejected = None):
+        if self.id_token != rejected and self.__isValid(self.id_token, self.expires_at, self.refresh_margin):
+            return self.id_token
+        with self.__fileLock():
+
+            # Somebody else may have refreshed the token while we were waiting for the lock
+            id_token, expires_at = self.__read()
+            if id_token is None or id_token == rejected or not self.__isValid(id_token, expires_at, self.refresh_margin):
+                response = self.grant(prompt)
+                if response is None:
+                    return self.id_token if self.id_token != rejected and self.__isValid(self.id_token, self.expires_at, 0) else None
+                id_token = response['id_token']
+                expires_at = float(response['expires_at']) if response.get('expires_at') is not None else tokenExpiry(id_token)
+                self.grants += 1
+                self.__write(id_token, expires_at)
+            self.id_token, self.expires_at = id_token, expires_at
+        self.__schedule()
+        return self.id_token
+
+    def __schedule(self):
+        if self.background and self.expires_at is not None and (self.__thread is None or not self.__thread.is_alive()):
+            self.__thread = threading.Thread(target = self.__refreshLoop, name = 'TokenManager')
+            self.__thread.daemon = True
+            self.__thread.start()
+
+    def __refreshLoop(self):
+        while True:
+            with self.__lock:
+                if self.expires_at is None:
+                    return
+                wait = self.expires_at - 2 * self.refresh_margin - time.time()
+            if self.__stop.wait(max(wait, 0)):
+                return
+            with self.__lock:
+                if not self.__isValid(self.id_token, self.expires_at, 2 * self.refresh_margin):
+                    expires_at = self.expires_at
+                    try:
+                        self.__refresh(prompt = False, rejected = self.id_token)
+                    except Exception:
+                        return
+                    # Leave it to the foreground if we could not get a fresher token without prompting
+                    if self.expires_at == expires_at:
+                        return
+
+    # The shared token cache is only ever modified under an exclusive lock on a separate lock file
+    @contextlib.contextmanager
+    def __fileLock(self):
+        if self.path is None or fcntl is None:
+            yield
+            return
+        self.__makeDirectory()
+        fd = os.open(self.path + '.lock', os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def __makeDirectory(self):
+        directory = os.path.dirname(self.path)
+        if directory != '' and not os.path.exists(directory):
+            os.makedirs(directory, 0o700)
+
+    def __read(self):
+        if self.path is None:
+            return None, None
+        try:
+            with open(self.path) as f:
+                entry = json.load(f)[self.key]
+            return entry['id_token'], entry.get('expires_at')
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return None, None
+
+    # Write to a temporary file (readable by the owner only) and move it into place, so readers never see a partial file
+    def __write(self, id_token, expires_at):
+        if self.path is None:
+            return
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (IOError, OSError, ValueError):
+            entries = {}
+        if not isinstance(entries, dict):
+            entries = {}
+        entries[self.key] = {'id_token': id_token, 'expires_at': expires_at}
+        self.__makeDirectory()
+        temp = '%s.%s.tmp' % (self.path, os.getpid())
+        fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entries, f)
+        os.chmod(temp, 0o600)
+        os.rename(temp, self.path)
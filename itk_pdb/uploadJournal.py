@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# uploadJournal.py -- a local (SQLite) journal of the ITSDAQ results files which have been parsed and of what has been uploaded from them
+# Parses are keyed by results file path + mtime (+ size), so a rerun only parses the files which have changed since
+# Uploads are keyed by results file path + runNumber + testType + piece (the JSON or the filetype of an attachment), so a rerun (e.g.,
+# after a crash) only uploads what is missing -- the mtime of the file at the time is recorded, but a file which grows by new runs
+# must not have its older runs uploaded again
+
+import os, json, time, sqlite3, threading
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.itk_pdb', 'upload_journal.sqlite')
+
+# The piece of a test which is its JSON (the attachments are identified by their filetype, e.g., 'det_filename')
+JSON = 'JSON'
+
+UPLOADED = 'uploaded'
+FAILED = 'failed'
+
+# (mtime, size) of a file, None if it does not exist
+def fileStamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size
+
+# Define our journal
+# path := SQLite file (created with its parent directory if needed)
+class UploadJournal(object):
+
+    def __init__(self, path = DEFAULT_PATH):
+        self.path = path
+        self.__lock = threading.Lock()
+        if path != ':memory:' and os.path.dirname(path) != '' and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        self.__connection = sqlite3.connect(path, timeout = 30, check_same_thread = False)
+        with self.__lock:
+            self.__connection.executescript('''
+                CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime REAL, size INTEGER, parsed REAL, tests TEXT, full_test TEXT, error TEXT);
+                CREATE TABLE IF NOT EXISTS uploads (path TEXT, runNumber TEXT, testType TEXT, piece TEXT, mtime REAL, status TEXT, updated REAL,
+                                                    message TEXT, PRIMARY KEY (path, runNumber, testType, piece));
+            ''')
+            self.__connection.commit()
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
+
+    ###########
+    # Parsing #
+    ###########
+
+    # Return the (tests, full_test, error) recorded for a results file, or None if it was never parsed or has changed since
+    def getParsed(self, path):
+        stamp = fileStamp(path)
+        with self.__lock:
+            row = self.__connection.execute('SELECT mtime, size, tests, full_test, error FROM files WHERE path = ?', (os.path.abspath(path),)).fetchone()
+        if row is None or stamp is None or (row[0], row[1]) != stamp:
+            return None
+        full_test = json.loads(row[3])
+        return json.loads(row[2]), tuple(full_test) if full_test is not None else None, row[4]
+
+    # Record the (tests, full_test, error) of a results file, as returned by ITSDAQParser.parseResultsFile()
+    def putParsed(self, path, tests, full_test, error = None):
+        stamp = fileStamp(path)
+        if stamp is None:
+            return
+        with self.__lock:
+            self.__connection.execute('INSERT OR REPLACE INTO files (path, mtime, size, parsed, tests, full_test, error) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                        (os.path.abspath(path), stamp[0], stamp[1], time.time(), json.dumps(tests), json.dumps(full_test), error))
+            self.__connection.commit()
+
+    ###########
+    # Uploads #
+    ###########
+
+    def isUploaded(self, path, runNumber, testType, piece = JSON):
+        with self.__lock:
+            row = self.__connection.execute('SELECT status FROM uploads WHERE path = ? AND runNumber = ? AND testType = ? AND piece = ?',
+                                                (os.path.abspath(path), runNumber, testType, piece)).fetchone()
+        return row is not None and row[0] == UPLOADED
+
+    # Of pieces, those which have not been uploaded yet
+    def pending(self, path, runNumber, testType, pieces):
+        with self.__lock:
+            uploaded = set(row[0] for row in self.__connection.execute('SELECT piece FROM uploads WHERE path = ? AND runNumber = ? AND testType = ? AND status = ?',
+                                                                        (os.path.abspath(path), runNumber, testType, UPLOADED)))
+        return [piece for piece in pieces if piece not in uploaded]
+
+    # Record the outcome of the upload of a piece of a test (status := UPLOADED or FAILED, message := e.g., the error)
+    def record(self, path, runNumber, testType, piece = JSON, status = UPLOADED, message = None):
+        stamp = fileStamp(path)
+        with self.__lock:
+            self.__connection.execute('INSERT OR REPLACE INTO uploads (path, runNumber, testType, piece, mtime, status, updated, message) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                        (os.path.abspath(path), runNumber, testType, piece, stamp[0] if stamp is not None else None, status, time.time(), message))
+            self.__connection.commit()
+
+    # Summary of the journal, {'files': number of files parsed, UPLOADED: number of pieces uploaded, FAILED: number of failed pieces}
+    def stats(self):
+        with self.__lock:
+            summary = {'files': self.__connection.execute('SELECT COUNT(*) FROM files').fetchone()[0], UPLOADED: 0, FAILED: 0}
+            for status, count in self.__connection.execute('SELECT status, COUNT(*) FROM uploads GROUP BY status'):
+                summary[status] = count
+        return summary
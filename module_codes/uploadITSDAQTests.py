@@ -11,6 +11,7 @@ import argparse, os, sys, traceback
 from itk_pdb.dbAccess import ITkPDSession
 from itk_pdb.databaseUtilities import INFO, PROMPT, WARNING, ERROR, STATUS, Colours
 from itk_pdb.ITSDAQTestClasses import ResultsFile, ResultsFolder, ComponentNotFound
+from itk_pdb.uploadJournal import UploadJournal
 
 # Fix the input (python3) versus raw_input (python2) issue
 # See: https://stackoverflow.com/questions/954834/how-do-i-use-raw-input-in-python-3
@@ -91,13 +92,20 @@ def main(args):
         print('******************************************************************************')
         print('')
 
-        (sctvar_folder_path, get_confirm, upload_files, ps_folder_path, config_folder_path, recursion_depth) = (
-            args.sctvar_folder_path, args.get_confirm, args.upload_files, args.ps_folder_path, args.config_folder_path, args.recursion_depth)
+        (sctvar_folder_path, get_confirm, upload_files, ps_folder_path, config_folder_path, recursion_depth, workers, journal_path) = (
+            args.sctvar_folder_path, args.get_confirm, args.upload_files, args.ps_folder_path, args.config_folder_path, args.recursion_depth, args.workers,
+            args.journal_path)
 
         INFO('Launching ITkPDSession.')
         session = ITkPDSession()
         session.authenticate()
 
+        # The journal remembers what was parsed/uploaded by previous runs, so that a rerun only uploads what is missing
+        journal = None
+        if journal_path:
+            INFO('Using upload journal: ' + journal_path)
+            journal = UploadJournal(journal_path)
+
         results_folder = ResultsFolder(sctvar_folder_path, ps_folder_path, config_folder_path)
 
         INFO('Looking in: ' + str(results_folder))
@@ -111,11 +119,20 @@ def main(args):
             indices = getIndices(len(results_folder))
             results_folder.filterFiles(indices)
 
-            for results_file in results_folder:
+            # Parse all of the selected files up front (in parallel), failures are reported and skipped below
+            INFO('Parsing %s file(s).' % len(results_folder))
+            results_files = results_folder.parseAll(workers = workers, journal = journal)
+
+            # Resolve the components of all of the tests up front, in as few calls to the DB as possible
+            INFO('Identifying components.')
+            resolver = results_folder.resolveComponents(results_files, session)
+
+            for results_file in results_files:
                 full_test = False
                 INFO('Looking in: ' + str(results_file))
-                results_file.getTests()
-                if results_file.tests == []:
+                if results_file.error is not None:
+                    WARNING('Error encountered in file -- skipping.')
+                elif results_file.tests == []:
                     WARNING('No tests found -- skipping.')
                 else:
                     INFO('The following tests were found:')
@@ -146,7 +163,11 @@ def main(args):
                     for i in indices:
                         try:
                             results_file.finalizeTest(test_number = i, ITkPDSession = session, upload_files = upload_files, ResultsFolder = results_folder,
-                                                        depth = recursion_depth, full_test = full_test)
+                                                        depth = recursion_depth, full_test = full_test, resolver = resolver)
+                            if journal is not None and results_file.pendingUploads(i, journal, upload_files) == []:
+                                INFO('Run number \'' + results_file[i]['JSON']['runNumber'] + '\' was already uploaded -- skipping.')
+                                continue
+                            upload_these_files = upload_files
                             if get_confirm:
                                 INFO('Printing JSON for run number \'' + results_file[i]['JSON']['runNumber'] + '\':\n')
                                 results_file.printJSON(i)
@@ -173,9 +194,9 @@ def main(args):
                                     if not getYesOrNo('Please enter \'y\' to confirm the upload or \'n\' to cancel:'):
                                         INFO(Colours.BOLD + Colours.RED + 'Cancelled' + Colours.ENDC + ' upload of run number \'' + results_file[i]['JSON']['runNumber'] + '\'.')
                                         continue
-                            results_file.uploadJSON(i, session)
+                            results_file.uploadJSON(i, session, journal = journal)
                             if upload_these_files:
-                                results_file.uploadFiles(i, session, upload_files)
+                                results_file.uploadFiles(i, session, upload_files, journal = journal)
                         except ComponentNotFound:
                             continue
 
@@ -205,6 +226,9 @@ if __name__ == '__main__':
     optional.add_argument('-P', '--psPath', dest = 'ps_folder_path', type = str, help = 'path to the ps directory (or equivalent) if an SCTVAR directory structure is not present')
     optional.add_argument('-C', '--cfgPath', dest = 'config_folder_path', type = str, help = 'path to the config directory (or equivalent) if an SCTVAR directory structure is not present')
     optional.add_argument('-R', '--recursionDepth', dest = 'recursion_depth', type = int, default = 0, help = 'depth for searching for files in results, ps, and config')
+    optional.add_argument('-J', '--journal', dest = 'journal_path', type = str, default = os.getenv('ITK_DB_UPLOAD_JOURNAL', None),
+                            help = 'SQLite journal of the files parsed and the tests/files uploaded, so that reruns skip whatever was already uploaded')
+    optional.add_argument('-w', '--workers', dest = 'workers', type = int, default = None, help = 'number of processes used to parse the results files (default: one per CPU)')
 
     # Fetch our args
     args = parser.parse_args()
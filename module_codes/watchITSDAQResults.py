@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# watchITSDAQResults.py -- watch SCTDAQ_VAR/results and upload the tests of the ITSDAQ results summary files to the ITk Production Database
+# as they are written (no prompts: every complete test is uploaded once, the upload journal skips whatever was already uploaded)
+
+if __name__ == '__main__':
+    from __path__ import updatePath
+    updatePath()
+
+import argparse, os, sys, traceback
+from itk_pdb.dbAccess import ITkPDSession
+from itk_pdb.databaseUtilities import INFO, WARNING, ERROR, STATUS, Colours
+from itk_pdb.ITSDAQTestClasses import ResultsFile, ResultsFolder, ComponentNotFound
+from itk_pdb.componentResolver import ComponentResolver
+from itk_pdb.resultsWatcher import ResultsWatcher
+from itk_pdb.uploadJournal import UploadJournal, DEFAULT_PATH
+
+# Define the function uploading a batch of new tests from a results summary file (called by the watcher, on its handler thread)
+def makeHandler(session, results_folder, journal, upload_files, recursion_depth):
+
+    def handle(path, tests):
+        results_file = ResultsFile(path)
+        results_file.tests = tests
+        INFO('Found %s new test(s) in: %s' % (len(tests), path))
+
+        # Resolve the components of the whole batch at once
+        resolver = ComponentResolver(session)
+        resolver.resolveTests(tests)
+
+        for i, test in enumerate(results_file):
+            # A %NewTest without any results is nothing to upload
+            if test['JSON']['results'] == {}:
+                continue
+            run_number = test['JSON']['runNumber']
+            try:
+                results_file.finalizeTest(test_number = i, ITkPDSession = session, upload_files = upload_files, ResultsFolder = results_folder,
+                                            depth = recursion_depth, resolver = resolver)
+                if results_file.pendingUploads(i, journal, upload_files) == []:
+                    INFO('Run number \'' + run_number + '\' was already uploaded -- skipping.')
+                    continue
+                results_file.uploadJSON(i, session, journal = journal)
+                if upload_files:
+                    results_file.uploadFiles(i, session, upload_files, journal = journal)
+            except ComponentNotFound:
+                continue
+            except Exception:
+                ERROR('Exception encountered while uploading run number \'' + run_number + '\' -- printing Traceback:\n')
+                print(traceback.format_exc())
+
+    return handle
+
+# Define our main function
+def main(args):
+
+    try:
+
+        print('')
+        print('******************************************************************************')
+        print('*                            {0}{1}watchITSDAQResults.py{2}                           *'.format(Colours.WHITE, Colours.BOLD, Colours.ENDC))
+        print('******************************************************************************')
+        print('')
+
+        (sctvar_folder_path, upload_files, ps_folder_path, config_folder_path, recursion_depth, journal_path, settle, idle, backfill) = (
+            args.sctvar_folder_path, args.upload_files, args.ps_folder_path, args.config_folder_path, args.recursion_depth, args.journal_path,
+            args.settle, args.idle, args.backfill)
+
+        INFO('Launching ITkPDSession.')
+        session = ITkPDSession()
+        session.authenticate()
+
+        # The journal is what keeps the watcher from uploading a test twice (e.g., with --backfill, when the files are read from the start)
+        INFO('Using upload journal: ' + journal_path)
+        journal = UploadJournal(journal_path)
+
+        results_folder = ResultsFolder(sctvar_folder_path, ps_folder_path, config_folder_path)
+        watcher = ResultsWatcher(results_folder.results_folder_path, makeHandler(session, results_folder, journal, upload_files, recursion_depth),
+                                    depth = recursion_depth, settle = settle, idle = idle, backfill = backfill)
+        if not backfill:
+            INFO('Only tests written from now on are uploaded: tests written while the watcher was not running are not (use --backfill to also '
+                    'upload those already in the results files which are not in the journal).')
+
+        INFO('Watching: ' + results_folder.results_folder_path + ' (press Ctrl+C to stop)')
+        watcher.run()
+
+    except KeyboardInterrupt:
+        print('')
+        INFO('Stopped watching.')
+        STATUS('Finished successfully.', True)
+        sys.exit(0)
+
+if __name__ == '__main__':
+
+    # Define our parser
+    parser = argparse.ArgumentParser(description = 'Watch SCTDAQ_VAR/results and upload new ITSDAQ test results/files to the ITk Production Database',
+                                        formatter_class = argparse.ArgumentDefaultsHelpFormatter)
+    parser._action_groups.pop()
+
+    # Define our required arguments
+    required = parser.add_argument_group('required arguments')
+    required.add_argument(dest = 'sctvar_folder_path', type = str, nargs = '?', default = os.getenv('SCTDAQ_VAR', None), help = 'path to the SCTVAR (or results) directory')
+
+    # Define our optional arguments
+    optional = parser.add_argument_group('optional arguments')
+    optional.add_argument('-u', '--uploadFiles', dest = 'upload_files', action = 'store_true', help = 'upload the file(s) (e.g., .det, .trim, .mask, .pdf) associated with each test result')
+    optional.add_argument('-P', '--psPath', dest = 'ps_folder_path', type = str, help = 'path to the ps directory (or equivalent) if an SCTVAR directory structure is not present')
+    optional.add_argument('-C', '--cfgPath', dest = 'config_folder_path', type = str, help = 'path to the config directory (or equivalent) if an SCTVAR directory structure is not present')
+    optional.add_argument('-R', '--recursionDepth', dest = 'recursion_depth', type = int, default = 0, help = 'depth for watching for files in results and searching for files in ps and config')
+    optional.add_argument('-J', '--journal', dest = 'journal_path', type = str, default = os.getenv('ITK_DB_UPLOAD_JOURNAL', DEFAULT_PATH),
+                            help = 'SQLite journal of the tests/files uploaded, so that nothing is uploaded twice')
+    optional.add_argument('--settle', dest = 'settle', type = float, default = 5.0, help = 'seconds a results file must be left unchanged before it is read')
+    optional.add_argument('--backfill', dest = 'backfill', action = 'store_true', help = 'also upload the tests already in the results files when the watch starts, if they are not in the journal '
+                            '(without it, tests written while the watcher was not running, e.g., before a restart, are never uploaded)')
+    optional.add_argument('--idle', dest = 'idle', type = float, default = 60.0, help = 'seconds after which the last test of an unchanged results file is taken as complete')
+
+    # Fetch our args
+    args = parser.parse_args()
+    if args.sctvar_folder_path is None:
+        parser.error('no SCTVAR directory given and SCTDAQ_VAR is not set')
+
+    # Run main()
+    main(args)
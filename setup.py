@@ -18,6 +18,9 @@ develop_require = [
 
 extras_require = {
     'develop' : develop_require,
+    'async' : ['aiohttp'],
+    'stream' : ['ijson'],
+    'watch' : ['inotify_simple; sys_platform == "linux"'],
 }
 
 setup(
@@ -31,7 +34,9 @@ setup(
     include_package_data=True,
     packages=find_packages(".", exclude=["testing"]),
     install_requires=[
-        'requests'
+        'requests',
+        'numpy',
+        'futures; python_version < "3"',
     ],
     extras_require=extras_require,
 )
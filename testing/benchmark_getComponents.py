@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# benchmark_getComponents.py -- wall time of one-by-one getComponent versus the bulk ComponentFetcher.getComponents (as used by
+# ITkPDSession.getComponents), against a local stub server
+# Usage: python testing/benchmark_getComponents.py [--sizes 1000 10000] [--latency 0.005] [--workers 8] [--duplicates 0.1]
+
+import argparse, multiprocessing, os, random, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from itk_pdb.dbAccess import ITkPDSession
+from itk_pdb.componentFetcher import ComponentFetcher
+from stubServer import StubServer
+
+def makeCodes(n, duplicates):
+    codes = ['%032x' % i for i in range(n)]
+    codes += random.sample(codes, int(n * duplicates))
+    random.shuffle(codes)
+    return codes
+
+def timeSerial(url, codes):
+    session = ITkPDSession(enable_printing = False, cache = False)
+    start = time.time()
+    for code in codes:
+        session.doSomething(action = 'getComponent', method = 'GET', data = {'component': code}, url = url)
+    return time.time() - start
+
+def timeBulk(url, codes, workers):
+    session = ITkPDSession(enable_printing = False, cache = False)
+    fetcher = ComponentFetcher(lambda code: session.doSomething(action = 'getComponent', method = 'GET', data = {'component': code}, url = url), workers = workers)
+    start = time.time()
+    n = sum(1 for _ in fetcher.getComponents(codes))
+    elapsed = time.time() - start
+
+    # A second pass is answered entirely from the memo
+    start = time.time()
+    sum(1 for _ in fetcher.getComponents(codes))
+    return elapsed, time.time() - start, n
+
+def main(args):
+
+    # Serve from a separate process, so that the server does not compete with the client for the GIL
+    server = StubServer(latency = args.latency)
+    process = multiprocessing.Process(target = server.serve_forever)
+    process.daemon = True
+    process.start()
+    try:
+        print('{0:>8} {1:>8} {2:>12} {3:>12} {4:>12} {5:>10}'.format('codes', 'unique', 'serial [s]', 'bulk [s]', 'memo [s]', 'speedup'))
+        for size in args.sizes:
+            codes = makeCodes(size, args.duplicates)
+            serial = timeSerial(server.url, codes)
+            bulk, memo, unique = timeBulk(server.url, codes, args.workers)
+            print('{0:>8} {1:>8} {2:>12.3f} {3:>12.3f} {4:>12.3f} {5:>10.1f}'.format(len(codes), unique, serial, bulk, memo, serial / bulk))
+    finally:
+        process.terminate()
+        server.server_close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark bulk getComponent fetching against a local stub server')
+    parser.add_argument('--sizes', type = int, nargs = '+', default = [1000, 10000], help = 'numbers of unique component codes to fetch')
+    parser.add_argument('--latency', type = float, default = 0.005, help = 'stub server latency per request [s]')
+    parser.add_argument('--workers', type = int, default = 8, help = 'size of the worker pool')
+    parser.add_argument('--duplicates', type = float, default = 0.1, help = 'fraction of codes requested twice')
+    main(parser.parse_args())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# benchmark_parser.py -- throughput (lines/s, tests/s) and peak memory of ResultsFile.getTests on synthetic ITSDAQ results summary files,
+# plus the golden-output check of the regression corpus (see stubResults.CORPUS and test_parserRegression.py)
+# Each measurement runs in a fresh process, so that its peak RSS is its own
+# Usage: python testing/benchmark_parser.py [--modules 10 100 1000] [--chips 10] [--repeat 3] [--arrays]
+#        python testing/benchmark_parser.py --update-golden (after a deliberate change of the parser output, check the diff!)
+
+import argparse, json, multiprocessing, os, shutil, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from itk_pdb.ITSDAQTestClasses import ResultsFile
+from itk_pdb.gainArrays import serializeJSON
+from stubResults import CORPUS, writeResultsFile, loadGolden, writeGolden
+
+# Peak RSS of this process [MB] (ru_maxrss is in kB on Linux, in bytes on macOS), None where unavailable
+def peakRSS():
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1e6 if sys.platform == 'darwin' else 1e3)
+
+def measure(path, arrays, connection):
+    baseline = peakRSS()
+    results_file = ResultsFile(path, enable_printing = False)
+    start = time.time()
+    results_file.getTests(arrays = arrays)
+    elapsed = time.time() - start
+    connection.send((elapsed, len(results_file), baseline, peakRSS()))
+    connection.close()
+
+# Parse path in a fresh process, returning (elapsed [s], number of tests, peak RSS before/after parsing [MB])
+def measureInProcess(path, arrays):
+    receiver, sender = multiprocessing.Pipe(duplex = False)
+    process = multiprocessing.Process(target = measure, args = (path, arrays, sender))
+    process.start()
+    result = receiver.recv()
+    process.join()
+    return result
+
+# Parse the corpus, returning {name: tests (as plain JSON)}
+def parseCorpus(folder, arrays = False):
+    parsed = {}
+    for name, kwargs in sorted(CORPUS.items()):
+        results_file = ResultsFile(writeResultsFile(os.path.join(folder, name + '.txt'), **kwargs), enable_printing = False)
+        results_file.getTests(arrays = arrays)
+        parsed[name] = json.loads(json.dumps([dict(test, JSON = serializeJSON(test['JSON'])) for test in results_file]))
+    return parsed
+
+def checkGolden(folder):
+    ok = True
+    for arrays in [False, True]:
+        for name, tests in sorted(parseCorpus(folder, arrays = arrays).items()):
+            golden = loadGolden(name)
+            same = tests == golden
+            ok = ok and same
+            print('{0:<14} {1:<8} {2:>6} tests  {3}'.format(name, 'arrays' if arrays else 'lists', len(tests), 'OK' if same else 'DIFFERS FROM GOLDEN'))
+    return ok
+
+def main(args):
+    folder = tempfile.mkdtemp()
+    try:
+        if args.update_golden:
+            for name, tests in sorted(parseCorpus(folder).items()):
+                writeGolden(name, tests)
+                print('Wrote golden output of \'%s\' (%s tests).' % (name, len(tests)))
+            return 0
+
+        ok = checkGolden(folder)
+        print('')
+        print('{0:>8} {1:>6} {2:>10} {3:>8} {4:>10} {5:>12} {6:>10} {7:>12}'.format('modules', 'chips', 'lines', 'tests', 'time [s]', 'lines/s', 'tests/s', 'peak [MB]'))
+        for n_modules in args.modules:
+            path = writeResultsFile(os.path.join(folder, 'results_%s.txt' % n_modules), n_modules = n_modules, n_chips = args.chips,
+                                    defect_rate = args.defect_rate, nan_rate = args.nan_rate)
+            with open(path) as f:
+                n_lines = sum(1 for line in f)
+            elapsed, n_tests, baseline, peak = min(measureInProcess(path, args.arrays) for k in range(args.repeat))
+            print('{0:>8} {1:>6} {2:>10} {3:>8} {4:>10.3f} {5:>12.0f} {6:>10.0f} {7:>12}'.format(n_modules, args.chips, n_lines, n_tests, elapsed,
+                    n_lines / elapsed, n_tests / elapsed, '%.1f (+%.1f)' % (peak, peak - baseline) if peak is not None else 'n/a'))
+        return 0 if ok else 1
+    finally:
+        shutil.rmtree(folder)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark ResultsFile.getTests on synthetic ITSDAQ results summary files')
+    parser.add_argument('--modules', type = int, nargs = '+', default = [10, 100, 1000], help = 'numbers of modules per results file')
+    parser.add_argument('--chips', type = int, default = 10, help = 'number of chips per stream')
+    parser.add_argument('--defect-rate', dest = 'defect_rate', type = float, default = 0.05, help = 'fraction of the gain test chips with too many defects')
+    parser.add_argument('--nan-rate', dest = 'nan_rate', type = float, default = 0.01, help = 'fraction of the Loop B values which are nan')
+    parser.add_argument('--repeat', type = int, default = 3, help = 'number of runs per size (the fastest is reported)')
+    parser.add_argument('--arrays', action = 'store_true', help = 'parse in the array mode')
+    parser.add_argument('--update-golden', dest = 'update_golden', action = 'store_true', help = 'rewrite the golden output of the regression corpus')
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# stubResults.py -- synthetic ITSDAQ results summary files, for benchmarks and tests
+# Each module gets a %NewTest per test of a FullTest-like sequence: strobe delay, 3PG, trim range scans, response curve and noise occupancy
+# CORPUS names the configurations of the regression corpus (see test_parserRegression.py and benchmark_parser.py)
+
+import json, os, random
+
+def _field(label, value):
+    return '%-15s: %s\n' % (label, value)
+
+def _header(serial_number, run_number, scan):
+    return (['%NewTest\n', '#\n', _field('SERIAL NUMBER', serial_number), _field('TEST MADE BY', 'user'), _field('MODULE SITE', 'LBNL'),
+                _field('RUN NUMBER', '%s-%s' % (run_number, scan)), _field('TEST DATE', '28/01/2019'), _field('PASSED', 'YES'), _field('PROBLEM', 'NO'), '\n',
+             '%DAQ_INFO\n', '#\n', '#HOST\n', '"pc-itk"\n', '#VERSION\n', '"3.0"\n', '#DUT\n', '"%s"\n' % serial_number, '#TIME\n', '"10:11:%02d"\n' % (scan % 60), '\n',
+             '%DCS_INFO\n', '#\n', '#T0 T1\n', '20.5 21.5\n', '#VDET IDET\n', '-350 0.12\n', '#VCC ICC\n', '1.5 0.9\n', '#VDD IDD\n', '1.5 0.4\n',
+                '#TIME_POWERED\n', '1234.5s\n', '\n'])
+
+def _scanInfo(points):
+    return ['%SCAN_INFO\n', '#\n', '#POINT_TYPE\n', '"Vcal"\n', '#N_POINTS\n', '%s\n' % len(points), '#POINTS\n',
+            ' '.join('%.2f' % point for point in points[:3]) + '\n', ' '.join('%.2f' % point for point in points[3:]) + ' .\n', '#\n']
+
+def _chips(n_chips):
+    return ['M%s' % k for k in range(n_chips)]
+
+def _strobeDelay(rng, n_chips):
+    delays = [[rng.randint(20, 40) if k != 3 else -1 for k in range(n_chips)] for stream in range(2)]
+    return (['%StrobeDelay\n', '#\n', '#Stream 0\n', '#Delays ' + ' '.join(_chips(n_chips)) + '\n', ' '.join(map(str, delays[0])) + '\n',
+             '#Stream 1\n', '#Delays ' + ' '.join(_chips(n_chips)) + '\n', ' '.join(map(str, delays[1])) + '\n', '#Defects\n', '#\n', '#\n',
+             '#Defect on chip M3\n', '#Strobe Delay Fraction used is 0.57\n', '\n'])
+
+def _gain(rng, n_chips, loopA_columns, nan_chips = {}, defect_chips = ()):
+    lines = ['#\n', '#LoopA\n', '#chip ' + ' '.join('c%s' % c for c in range(loopA_columns)) + '\n']
+    for k in range(2 * n_chips):
+        lines += ['#M%s\n' % k, 'A ' + ' '.join('%.3f' % rng.uniform(0, 100) for c in range(loopA_columns)) + '\n']
+    lines += ['#\n', '#LoopB\n', '#vt50 rms gain rms offset rms outnse innse rms\n']
+    for k in range(2 * n_chips):
+        lines.append('#M%s\n' % k)
+        if k in defect_chips:
+            lines.append('#Too many defects in this chip!\n')
+        else:
+            row = ['%.3f' % rng.uniform(0, 100) for c in range(7)] + [str(rng.randint(500, 700)), str(rng.randint(10, 50))]
+            for c in nan_chips.get(k, []):
+                row[c] = 'nan'
+            lines.append(' '.join(row) + '\n')
+    return lines
+
+def _trim(rng, n_channels, trim_type):
+    lines = ['%Trim\n', '#\n', '#Type\n', '#type %s\n' % trim_type, '#\n', '#\n', '#\n']
+    if trim_type == -1:
+        for k in range(2 * n_channels):
+            lines += ['#Ch%s\n' % k, '%s %.3f\n' % (rng.randint(0, 3), rng.uniform(50, 100))]
+        lines.append('#\n')
+    return lines
+
+def _noiseOccupancy(rng, n_chips):
+    lines = ['%NO\n', '#\n', '#chip occ err ests EstENC\n']
+    for k in range(2 * n_chips):
+        lines.append('#M%s\n' % k)
+        if k == 1:
+            lines.append('0 0 0 0\n')
+        elif k == 2:
+            lines.append('1.5 0.1 2.0 nan\n')
+        else:
+            lines.append('%.3f %.3f %.3f %s\n' % (rng.uniform(0, 1), rng.uniform(0, 1), rng.uniform(0, 1), rng.randint(500, 700)))
+    return lines + ['#\n']
+
+# The chips (of both streams) which have too many defects and the {chip: columns} of Loop B which are nan, drawn from a separate
+# generator so that the values of a file do not depend on the rates
+def _flaws(flaws, n_chips, defect_rate, nan_rate):
+    defect_chips = set(k for k in range(2 * n_chips) if flaws.random() < defect_rate)
+    nan_chips = {}
+    for k in range(2 * n_chips):
+        columns = [c for c in range(9) if flaws.random() < nan_rate]
+        if columns and k not in defect_chips:
+            nan_chips[k] = columns
+    return nan_chips, defect_chips
+
+# Generate the lines of a results summary file with n_modules modules (each with 9 %NewTests, 7 of which are kept by the parser)
+# defect_rate, nan_rate := fraction of the gain test chips with too many defects, of the Loop B values which are nan (None := a fixed
+# defect-ridden chip and nan per gain test)
+def generateLines(n_modules = 1, n_chips = 10, seed = 0, defect_rate = None, nan_rate = None):
+    rng = random.Random(seed)
+    flaws = random.Random(-1 - seed)
+    for module in range(n_modules):
+        serial_number = '20USBHX%07d' % module
+        run_number = 100 + module
+        scans = [('strobe', 0), ('3pg', 1), ('trim0', 2), ('trim1', 10), ('trim-1', 20), ('rc', 30), ('3pg', 33), ('3pg', 35), ('no', 41), ('empty', 42)]
+        for kind, scan in sorted(scans, key = lambda item: item[1]):
+            for line in _header(serial_number, run_number, scan):
+                yield line
+            if kind in ['3pg', 'rc'] and (defect_rate is not None or nan_rate is not None):
+                nan_chips, defect_chips = _flaws(flaws, n_chips, defect_rate or 0.0, nan_rate or 0.0)
+            elif kind == '3pg':
+                nan_chips, defect_chips = {2: [2]}, [n_chips + 1]
+            else:
+                nan_chips, defect_chips = {}, [4]
+            if kind == 'strobe':
+                lines = _strobeDelay(rng, n_chips)
+            elif kind == '3pg':
+                lines = _scanInfo([1.0, 1.5, 2.0, 2.5]) + ['%ThreePointGain\n'] + _gain(rng, n_chips, 3, nan_chips = nan_chips, defect_chips = defect_chips)
+            elif kind.startswith('trim'):
+                lines = (_scanInfo([0.5, 1.0, 1.5, 2.0]) if kind != 'trim-1' else []) + _trim(rng, n_chips, int(kind[4:]) if kind != 'trim-1' else -1)
+            elif kind == 'rc':
+                lines = _scanInfo([0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 4.0]) + ['%ResponseCurve\n'] + _gain(rng, n_chips, 3, nan_chips = nan_chips, defect_chips = defect_chips)
+            elif kind == 'no':
+                lines = _noiseOccupancy(rng, n_chips)
+            else:
+                lines = []
+            for line in lines:
+                yield line
+
+def writeResultsFile(path, **kwargs):
+    with open(path, 'w') as f:
+        f.writelines(generateLines(**kwargs))
+    return path
+
+# The regression corpus: {name: generateLines() keyword arguments}
+CORPUS = {
+    'module':       {'n_modules': 2, 'n_chips': 4, 'seed': 0},
+    'defects':      {'n_modules': 2, 'n_chips': 10, 'seed': 1, 'defect_rate': 0.5},
+    'nans':         {'n_modules': 2, 'n_chips': 10, 'seed': 2, 'nan_rate': 0.2},
+    'single_chip':  {'n_modules': 1, 'n_chips': 1, 'seed': 3, 'defect_rate': 0.5, 'nan_rate': 0.5}
+}
+
+GOLDEN_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden')
+
+def goldenPath(name):
+    return os.path.join(GOLDEN_FOLDER, name + '.json')
+
+# The tests of a corpus file as stored in its golden file (as plain JSON, which is how they are uploaded)
+def loadGolden(name):
+    with open(goldenPath(name)) as f:
+        return json.load(f)
+
+def writeGolden(name, tests):
+    if not os.path.exists(GOLDEN_FOLDER):
+        os.makedirs(GOLDEN_FOLDER)
+    with open(goldenPath(name), 'w') as f:
+        json.dump(tests, f, sort_keys = True, separators = (',', ':'))
+        f.write('\n')
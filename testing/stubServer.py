@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# stubServer.py -- a local stand-in for the ITk Production Database, for benchmarks and tests
+# Answers getComponent (for any code) and listComponents (paged) with synthetic components after a configurable latency
+# Failures (or answers to other commands) can be injected with inject()
+
+import json, threading, time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+def makeComponent(code):
+    return {'code': code, 'serialNumber': '20USE' + code[-9:].rjust(9, '0'), 'institution': {'code': 'LBNL_STRIP_MODULES'},
+            'type': {'code': 'BARREL_LS_MODULE'}, 'properties': [{'code': 'LOCAL_NAME', 'value': 'module-' + code}],
+            'stages': [{'code': 'ASSEMBLY', 'dateTime': '2019-01-28T00:00:00.000Z'}]}
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Otherwise delayed ACKs add ~40 ms to every keep-alive request, swamping the latency we want to simulate
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length else b'{}'
+        data = json.loads(body.decode('utf-8') or '{}')
+        action = self.path.lstrip('/').split('?')[0]
+        self.server.count(action)
+        time.sleep(self.server.latency)
+        headers = {}
+        fault = self.server.fault(action)
+        if fault is not None:
+            status, out, headers = fault
+        elif action == 'getComponent':
+            status, out = 200, makeComponent(str(data['component']))
+        elif action == 'listComponents':
+            pageInfo = data.get('pageInfo', {'pageIndex': 0, 'pageSize': self.server.n_components})
+            first = pageInfo['pageIndex'] * pageInfo['pageSize']
+            last = min(first + pageInfo['pageSize'], self.server.n_components)
+            status, out = 200, {'pageItemList': [makeComponent('%032x' % i) for i in range(first, last)],
+                                'pageInfo': dict(pageInfo, total = self.server.n_components)}
+        else:
+            status, out = 404, {'uuAppErrorMap': {'uu-app-server/notFound': {'type': 'error', 'message': 'Unknown uuCMD: %s' % action}}}
+        out = json.dumps(out).encode('utf-8')
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    do_POST = do_GET
+
+    def log_message(self, *args):
+        pass
+
+# Define our stub server
+# latency := seconds slept before answering each request
+# n_components := number of components returned by listComponents
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency = 0.0, n_components = 1000, address = ('127.0.0.1', 0)):
+        HTTPServer.__init__(self, address, StubHandler)
+        self.latency = latency
+        self.n_components = n_components
+        self.requests = {}
+        self.faults = {}
+        self.__lock = threading.Lock()
+        self.__thread = None
+
+    @property
+    def url(self):
+        return 'http://%s:%s/' % self.server_address
+
+    def count(self, action):
+        with self.__lock:
+            self.requests[action] = self.requests.get(action, 0) + 1
+
+    # Answer the next requests for action with the given (status, body, headers) responses, in order, before answering normally
+    def inject(self, action, *responses):
+        with self.__lock:
+            self.faults.setdefault(action, []).extend(responses)
+
+    def fault(self, action):
+        with self.__lock:
+            faults = self.faults.get(action)
+            return faults.pop(0) if faults else None
+
+    def start(self):
+        self.__thread = threading.Thread(target = self.serve_forever)
+        self.__thread.daemon = True
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,129 @@
+import numpy as np
+import pytest
+
+from itk_pdb.gainArrays import GainResults, serializeJSON, stackTests
+from itk_pdb.ITSDAQParser import ResultsParser, iterTests, findFullTest, parseFiles, THREE_POINT_GAIN_KEYS, RESPONSE_CURVE_KEYS
+from stubResults import generateLines, writeResultsFile
+
+def test_parse_module():
+    tests = list(ResultsParser(generateLines(n_modules = 2, n_chips = 4)))
+    # 7 tests per module (the trims with type != -1 are dropped), the empty %NewTest of the first module is purged but the last one is kept
+    assert len(tests) == 15
+    assert [test['JSON']['testType'] for test in tests[:7]] == ['STROBE_DELAY', 'THREE_POINT_GAIN', 'TRIM_RANGE', 'RESPONSE_CURVE',
+                                                                'THREE_POINT_GAIN', 'THREE_POINT_GAIN', 'NOISE_OCCUPANCY']
+    assert tests[-1]['JSON']['results'] == {} and tests[-1]['JSON']['runNumber'] == '101-42'
+    # The last pair of tests 41 scans apart: scan 1 of the second module and its (empty) scan 42
+    assert findFullTest(tests[:7]) == (0, 6) and findFullTest(tests) == (8, 14)
+
+    strobe = tests[0]
+    assert strobe['JSON']['properties']['SERIAL_NUMBER'] == '20USBHX0000000'
+    assert strobe['JSON']['date'] == '28.01.2019' and strobe['JSON']['passed'] is True and strobe['JSON']['problems'] is False
+    assert strobe['JSON']['properties']['FRACTION'] == 0.57
+    assert strobe['extra_data']['identifiers']['stream0'] == ['M0', 'M1', 'M2']
+    assert strobe['extra_data']['DCS_INFO']['VDET'] == -350.0
+
+    gain = tests[1]
+    assert gain['JSON']['properties']['MIDPOINT'] == 1.5
+    assert set(gain['JSON']['results']) == set('STREAM%s_%s' % (stream, key) for stream in range(2) for key in THREE_POINT_GAIN_KEYS)
+    assert all(len(column) == 4 for column in gain['JSON']['results'].values())
+    assert isinstance(gain['JSON']['results']['STREAM0_INNSE'][0], int)
+    # nan's and chips with too many defects go to -1000000
+    assert gain['JSON']['results']['STREAM0_GAIN'][2] == -1000000.0
+    assert gain['JSON']['results']['STREAM1_VT50'][1] == -1000000.0
+
+    trim = tests[2]
+    assert trim['extra_data']['SCAN_INFO']['points'] == [0.5, 1.0, 1.5, 2.0]
+    assert len(trim['JSON']['results']['STREAM1_RANGE']) == 4
+
+    curve = tests[3]
+    assert curve['JSON']['properties']['INPUT_CHARGE'] == 3.0
+    assert set(curve['JSON']['results']) == set('STREAM%s_%s' % (stream, key) for stream in range(2) for key in RESPONSE_CURVE_KEYS)
+
+    noise = tests[6]
+    assert noise['JSON']['results']['STREAM0_ESTENC'][1] == -1000000
+    assert noise['extra_data']['identifiers']['stream0'] == ['M0', 'M2', 'M3']
+
+def test_parse_is_incremental():
+    consumed = []
+    def lines():
+        for line in generateLines(n_modules = 50):
+            consumed.append(line)
+            yield line
+    parser = iter(ResultsParser(lines()))
+    next(parser)
+    assert len(consumed) < 100
+    assert len(list(parser)) == 50 * 7
+
+def test_truncated_file(tmpdir):
+    lines = list(generateLines(n_chips = 4))
+    end = lines.index('%ThreePointGain\n') + 10
+    with pytest.raises(IndexError):
+        list(ResultsParser(lines[:end]))
+    path = writeResultsFile(str(tmpdir.join('results.txt')), n_chips = 4)
+    assert len(list(iterTests(path))) == 8
+
+def test_parse_files(tmpdir):
+    paths = [writeResultsFile(str(tmpdir.join('results_%s.txt' % k)), n_modules = k + 1, n_chips = 4, seed = k) for k in range(4)]
+    with open(paths[2], 'a') as f:
+        f.write('%NewTest\n#\n')
+    serial = parseFiles(paths, workers = 1)
+    parallel = parseFiles(paths, workers = 3)
+    assert parallel == serial
+    assert parseFiles(paths, workers = 2, arrays = True) == parseFiles(paths, workers = 1, arrays = True)
+    assert [len(tests) for tests, full_test, error in parallel] == [8, 15, 0, 29]
+    assert parallel[2][2].startswith('IndexError') and parallel[3][1] == (22, 28)
+
+def test_array_mode():
+    tests = list(ResultsParser(generateLines(n_modules = 3, n_chips = 4)))
+    arrays = list(ResultsParser(generateLines(n_modules = 3, n_chips = 4), arrays = True))
+    assert [serializeJSON(test['JSON']) for test in arrays] == [test['JSON'] for test in tests]
+
+    gain = arrays[1]['JSON']['results']
+    assert isinstance(gain, GainResults) and gain.streams[0].dtype['INNSE'] == np.int32
+    assert gain['STREAM0_GAIN'].mask.tolist() == [False, False, True, False]
+    assert gain['STREAM1_VT50'].mask.tolist() == [False, True, False, False] and not gain['STREAM1_P0'].mask.any()
+
+    serialNumbers, streams, table = stackTests(arrays)
+    assert len(table) == 3 * 3 * 8 and (serialNumbers == '20USBHX0000002').sum() == 3 * 8
+    # One nan and one chip with too many defects per test
+    assert table['GAIN'].count() == len(table) - 9 * 2
+    assert parseFiles([], arrays = True) == []
+
+def test_get_tests_reads_appended_tests(tmpdir):
+    from itk_pdb.ITSDAQTestClasses import ResultsFile
+    lines = list(generateLines(n_modules = 2, n_chips = 4))
+    path = tmpdir.join('results.txt')
+    # Stop in the middle of a block of the second module
+    end = lines.index('%ThreePointGain\n', lines.index('SERIAL NUMBER  : 20USBHX0000001\n')) + 5
+    path.write(''.join(lines[:end]))
+    results_file = ResultsFile(str(path))
+    results_file.getTests()
+    first = results_file.tests
+    assert len(first) == 8 and results_file.full_test['state']
+    offset = results_file.results_tail.offset
+    with open(str(path), 'a') as f:
+        f.writelines(lines[end:])
+    results_file.getTests()
+    assert results_file.results_tail.offset > offset
+    # The complete tests are kept as they were, the rest is parsed from the checkpoint
+    assert all(a is b for a, b in zip(first, results_file.tests))
+    assert results_file.tests == list(ResultsParser(lines))
+    assert (results_file.full_test['lower_index'], results_file.full_test['upper_index']) == (8, 14)
+    # A truncated (e.g., replaced) file is read again from the start
+    path.write(''.join(lines[:end]))
+    results_file.getTests()
+    assert results_file.tests == first
+
+def test_get_tests_raises_on_a_malformed_test(tmpdir):
+    from itk_pdb.ITSDAQTestClasses import ResultsFile
+    lines = list(generateLines(n_modules = 1, n_chips = 4))
+    lines[lines.index('#T0 T1\n') + 1] = '20.5 abc\n'
+    path = tmpdir.join('results.txt')
+    path.write(''.join(lines))
+    results_file = ResultsFile(str(path))
+    # Unlike the watcher, a partial run is never returned: the whole file is refused
+    with pytest.raises(ValueError):
+        results_file.getTests()
+    assert results_file.tests == [] and results_file.error.startswith('ValueError')
+    with pytest.raises(ValueError):
+        results_file.getTests()
@@ -0,0 +1,44 @@
+import threading
+
+import pytest
+
+pytest.importorskip('requests_toolbelt')
+
+from itk_pdb.attachmentUploader import Attachment, AttachmentUploader
+
+class Session(object):
+
+    def __init__(self):
+        self.received = {}
+        self.inflight, self.peak = 0, 0
+        self.lock = threading.Lock()
+
+    def doSomething(self, action, method, data = None, url = None):
+        with self.lock:
+            self.inflight += 1
+            self.peak = max(self.peak, self.inflight)
+        try:
+            body = data.read()
+            if b'broken' in body:
+                raise IOError('upload failed')
+            self.received[data.fields['title']] = body
+        finally:
+            with self.lock:
+                self.inflight -= 1
+        return {}
+
+def test_upload(tmpdir):
+    paths = []
+    for k in range(6):
+        path = tmpdir.join('file_%s.pdf' % k)
+        path.write_binary(b'broken' if k == 3 else k * 100000 * b'x')
+        paths.append(str(path))
+    session = Session()
+    events = []
+    uploader = AttachmentUploader(session, workers = 4, per_host = 2, callback = lambda attachment, progress: events.append(progress.sent_bytes))
+    attachments = uploader.upload([Attachment('abc', path, key = k) for k, path in enumerate(paths)])
+    assert [attachment.status for attachment in attachments] == [True, True, True, False, True, True]
+    assert isinstance(attachments[3].error, IOError)
+    assert session.received['file_5.pdf'].count(b'x') == 500000 and session.peak <= 2
+    assert uploader.progress.succeeded == 5 and uploader.progress.sent_bytes == uploader.progress.total_bytes
+    assert len(events) >= 6
@@ -0,0 +1,75 @@
+import threading, time
+
+import pytest
+
+import itk_pdb.databaseUtilities as databaseUtilities
+from itk_pdb.componentFetcher import ComponentFetcher
+
+def makeComponent(code):
+    return {'code': code, 'serialNumber': 'SN-' + code}
+
+def test_dedup_and_memo():
+    calls = []
+    def getComponent(code):
+        calls.append(code)
+        return makeComponent(code)
+    fetcher = ComponentFetcher(getComponent, workers = 4)
+    out = fetcher.getComponentsDict(['a', 'b', 'a', 'c', 'b'])
+    assert out == dict((code, makeComponent(code)) for code in 'abc')
+    assert sorted(calls) == ['a', 'b', 'c']
+
+    # Memoized under code and serial number, so neither is fetched again
+    assert list(fetcher.getComponents(['SN-a', 'c'])) == [('SN-a', makeComponent('a')), ('c', makeComponent('c'))]
+    assert len(calls) == 3
+
+    fetcher.forget(['sn-A'])
+    assert 'a' not in fetcher.memo and 'SN-a' not in fetcher.memo and 'b' in fetcher.memo
+    fetcher.get('a')
+    assert len(calls) == 4
+
+def test_results_as_completed():
+    delays = {'slow': 0.3, 'fast': 0.0}
+    def getComponent(code):
+        time.sleep(delays[code])
+        return makeComponent(code)
+    fetcher = ComponentFetcher(getComponent, workers = 2)
+    assert [code for code, _ in fetcher.getComponents(['slow', 'fast'])] == ['fast', 'slow']
+
+def test_bounded_workers():
+    lock = threading.Lock()
+    state = {'active': 0, 'peak': 0}
+    def getComponent(code):
+        with lock:
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+        time.sleep(0.01)
+        with lock:
+            state['active'] -= 1
+        return makeComponent(code)
+    fetcher = ComponentFetcher(getComponent, workers = 3)
+    assert len(fetcher.getComponentsDict([str(i) for i in range(30)])) == 30
+    assert state['peak'] <= 3
+
+def test_exceptions():
+    def getComponent(code):
+        if code == 'bad':
+            raise KeyError(code)
+        return makeComponent(code)
+    fetcher = ComponentFetcher(getComponent)
+    out = fetcher.getComponentsDict(['good', 'bad'], return_exceptions = True)
+    assert out['good'] == makeComponent('good') and isinstance(out['bad'], KeyError)
+    assert 'bad' not in fetcher.memo
+    with pytest.raises(KeyError):
+        fetcher.getComponentsDict(['bad'])
+
+def test_functional_getComponents(mocker):
+    mocked = mocker.patch('itk_pdb.dbAccess.doSomething', side_effect = lambda action, method, data: makeComponent(data['component']))
+    databaseUtilities.componentFetcher.forget()
+    assert dict(databaseUtilities.getComponents(['x', 'y', 'x'])) == {'x': makeComponent('x'), 'y': makeComponent('y')}
+    assert mocked.call_count == 2
+
+    # A mutating command touching a component forgets it
+    mocked.side_effect = None
+    mocked.return_value = {}
+    databaseUtilities.commands['deleteComponent'].run(component = 'x')
+    assert 'x' not in databaseUtilities.componentFetcher.memo and 'y' in databaseUtilities.componentFetcher.memo
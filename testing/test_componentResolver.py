@@ -0,0 +1,66 @@
+import pytest
+
+from itk_pdb.componentResolver import ComponentResolver, checkSerialNumber
+from itk_pdb.ITSDAQTestClasses import ResultsFile, ComponentNotFound
+from stubResults import writeResultsFile
+
+def component(serial_number, local_name = None):
+    return {'code': 'code-' + serial_number, 'serialNumber': serial_number, 'institution': {'code': 'LBNL'},
+            'properties': [{'code': 'LOCAL_NAME', 'value': local_name}] if local_name else []}
+
+class Session(object):
+
+    # hidden := names which are only found when looked up on their own
+    def __init__(self, hidden = []):
+        self.calls = []
+        self.hidden = hidden
+
+    def getComponents(self, components, return_exceptions = False):
+        self.calls.append(('getComponents', sorted(components)))
+        for identifier in components:
+            yield identifier, component(identifier) if identifier != '20USBHX0000009' else ValueError('unknown component')
+
+    def doSomethingPaged(self, action, method, data = None):
+        names = set(f['value'] for f in data['propertyFilter'])
+        self.calls.append((action, sorted(names)))
+        if len(names) > 1:
+            names -= set(self.hidden)
+        return iter([component('20USBHX00000%02d' % i, 'hybrid-%s' % i) for i in range(3) if 'hybrid-%s' % i in names] +
+                    [component('20USBHX00000%02d' % i, 'twin') for i in range(50, 52) if 'twin' in names])
+
+def test_resolve_in_bulk():
+    session = Session()
+    resolver = ComponentResolver(session)
+    resolver.resolve(['20USBHX0000001', 'hybrid-1', '20USBHX0000001', 'hybrid-2', 'twin', 'unknown', '20USBHX0000009'])
+    # A name which the batch does not match is looked up again on its own
+    assert session.calls == [('getComponents', ['20USBHX0000001', '20USBHX0000009']), ('listComponentsByProperty', ['hybrid-1', 'hybrid-2', 'twin', 'unknown']),
+                                ('listComponentsByProperty', ['unknown'])]
+    assert resolver.get('hybrid-2')['serialNumber'] == '20USBHX0000002'
+    assert resolver.get('twin') is None and resolver.get('unknown') is None
+    with pytest.raises(ValueError):
+        resolver.get('20USBHX0000009')
+    resolver.resolve(['hybrid-1', '20USBHX0000001'])
+    assert len(session.calls) == 3
+    assert checkSerialNumber('20USBHX0000001') and not checkSerialNumber('hybrid-1')
+
+def test_unresolved_names_are_looked_up_on_their_own():
+    session = Session(hidden = ['hybrid-2'])
+    resolver = ComponentResolver(session)
+    resolver.resolve(['hybrid-0', 'hybrid-1', 'hybrid-2'])
+    assert session.calls == [('listComponentsByProperty', ['hybrid-0', 'hybrid-1', 'hybrid-2']), ('listComponentsByProperty', ['hybrid-2'])]
+    assert [resolver.get('hybrid-%s' % i)['serialNumber'] for i in range(3)] == ['20USBHX00000%02d' % i for i in range(3)]
+
+def test_finalize_from_resolver(tmpdir):
+    results_file = ResultsFile(writeResultsFile(str(tmpdir.join('results.txt')), n_modules = 2, n_chips = 4), enable_printing = False)
+    results_file.getTests()
+    session = Session()
+    resolver = ComponentResolver(session)
+    resolver.resolveTests(results_file.tests)
+    for i in range(len(results_file)):
+        results_file.finalizeTest(i, session, resolver = resolver)
+    assert session.calls == [('getComponents', ['20USBHX0000000', '20USBHX0000001'])]
+    assert results_file[8]['JSON']['component'] == 'code-20USBHX0000001' and results_file[8]['JSON']['institution'] == 'LBNL'
+    assert results_file[8]['JSON']['properties']['LOCAL_OBJECT_NAME'] is None
+    results_file[0]['JSON']['properties']['SERIAL_NUMBER'] = 'twin'
+    with pytest.raises(ComponentNotFound):
+        results_file.finalizeTest(0, session, resolver = resolver)
@@ -0,0 +1,53 @@
+import numpy as np
+
+from itk_pdb.componentTable import ComponentTable
+
+COMPONENTS = [  {'code': 'a' * 32, 'serialNumber': '20USEH00000001', 'cts': '2019-01-28T10:11:12.123Z', 'institution': {'code': 'LBNL'},
+                    'currentLocation': {'code': 'RAL'}, 'type': {'code': 'X'}, 'currentStage': {'code': 'ASSEMBLY'}, 'trashed': False, 'dummy': True,
+                    'currentGrade': 3, 'qaState': 'ok', 'stages': [{'code': 'REGISTERED', 'dateTime': '2019-01-01T00:00:00.000Z'},
+                                                                    {'code': 'ASSEMBLY', 'dateTime': '2019-01-28T00:00:00.000Z'}]},
+                {'code': 'b' * 32, 'serialNumber': None, 'cts': '2019-03-01T00:00:00.000Z', 'institution': {'code': 'RAL'},
+                    'currentLocation': {'code': 'RAL'}, 'type': None, 'currentStage': {'code': 'REGISTERED'}, 'trashed': True, 'dummy': False,
+                    'currentGrade': None, 'qaState': None, 'stages': None},
+                {'code': 'c' * 32, 'serialNumber': '20USEH00000003', 'cts': None, 'institution': None, 'currentLocation': {'code': 'LBNL'},
+                    'type': {'code': 'X'}, 'currentStage': None, 'trashed': False, 'stages': [{'code': 'REGISTERED', 'dateTime': '2019-04-01T00:00:00.000Z'}]}  ]
+
+def test_round_trip():
+    table = ComponentTable.fromComponents(iter(COMPONENTS))
+    assert len(table) == 3
+    for i, component in enumerate(COMPONENTS):
+        assert table.value('code', i) == component['code']
+        assert table.value('serialNumber', i) == component['serialNumber']
+        assert table.value('cts', i) == component['cts']
+        assert table.value('trashed', i) == component['trashed']
+        assert table.value('dummy', i) == component.get('dummy')
+        assert table.value('currentGrade', i) == component.get('currentGrade')
+        assert table.value('qaState', i) == component.get('qaState')
+        for name in ['institution', 'currentLocation', 'type', 'currentStage']:
+            assert table.value(name, i) == (component[name]['code'] if component[name] is not None else None)
+        assert table.stages(i) == [(stage['code'], stage['dateTime']) for stage in component['stages'] or []]
+
+def test_filter_and_group():
+    table = ComponentTable.fromComponents(COMPONENTS)
+    assert list(table.isIn('institution', ['LBNL', 'RAL', 'NOWHERE'])) == [True, True, False]
+    assert list(table.isIn('trashed', [False])) == [True, False, True]
+    assert list(table.isIn('currentGrade', [3])) == [True, False, False]
+    assert list(table.isIn('serialNumber', ['20USEH00000003'])) == [False, False, True]
+    assert list(table.dateMask('2019-01-28', '2019-02-28')) == [True, False, False]
+    assert list(table.dateMask(lower = '2019-02-01')) == [False, True, False]
+    assert table.groupCounts('currentLocation') == {'RAL': 2, 'LBNL': 1}
+    assert table.groupCounts('currentLocation', table.isIn('trashed', [False])) == {'RAL': 1, 'LBNL': 1}
+    assert dict((key, list(rows)) for key, rows in table.groupIndices('type').items()) == {'X': [0, 2]}
+    assert [str(day) for day in table.days(np.array([0, 1]))] == ['2019-01-28', '2019-03-01']
+
+def test_subset():
+    table = ComponentTable.fromComponents(COMPONENTS)
+    subset = table.subset(table.isIn('currentLocation', ['LBNL']) | table.isIn('institution', ['LBNL']))
+    assert len(subset) == 2
+    assert [row['code'] for row in subset.rows(columns = ['code'])] == ['a' * 32, 'c' * 32]
+    assert subset.stages(1) == [('REGISTERED', '2019-04-01T00:00:00.000Z')]
+    assert subset.nbytes < table.nbytes
+
+def test_grades():
+    table = ComponentTable.fromComponents([dict(COMPONENTS[0], currentGrade = grade) for grade in [3, 2.5, None, '4', 'A', {}]])
+    assert [table.value('currentGrade', i) for i in range(6)] == [3, 2.5, None, 4, None, None] and isinstance(table.value('currentGrade', 0), int)
@@ -0,0 +1,54 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from itk_pdb.componentTable import ComponentTable
+from itk_pdb.dateCounts import cumulativeCounts, binDays
+
+# The cumulative counts as generatePlots used to compute them, from a list of dates per series
+def referenceCounts(dates, lowerDate = None, upperDate = None):
+    counter = {}
+    for key, values in dates.items():
+        counts = Counter(values)
+        days = sorted(counts)
+        counter[key] = {'dates': days, 'counts': list(np.cumsum([counts[day] for day in days]))}
+    earliest_date = lowerDate if lowerDate != None else counter['total']['dates'][0]
+    latest_date = upperDate if upperDate != None else counter['total']['dates'][-1]
+    for series in counter.values():
+        if series['dates'][0] != earliest_date:
+            series['dates'].insert(0, earliest_date)
+            series['counts'].insert(0, series['counts'][0])
+        if series['dates'][-1] != latest_date:
+            series['dates'].append(latest_date)
+            series['counts'].append(series['counts'][-1])
+    return counter
+
+def makeComponents(n, seed = 0):
+    rng = np.random.RandomState(seed)
+    return [{'code': '%032x' % i, 'cts': '20%02d-%02d-%02dT10:00:00.000Z' % (rng.randint(17, 20), rng.randint(1, 13), rng.randint(1, 29)),
+                'institution': {'code': rng.choice(['LBNL', 'RAL', 'DESY'])} if rng.randint(10) else None} for i in range(n)]
+
+@pytest.mark.parametrize('lowerDate, upperDate', [(None, None), ('2016-01-01', '2021-01-01')])
+def test_matches_reference(lowerDate, upperDate):
+    components = makeComponents(5000)
+    table = ComponentTable.fromComponents(components)
+    mask = np.arange(len(table)) % 3 != 0
+    dates = {'total': [c['cts'][0:10] for c, m in zip(components, mask) if m]}
+    for c, m in zip(components, mask):
+        if m and c['institution'] is not None:
+            dates.setdefault(c['institution']['code'], []).append(c['cts'][0:10])
+    assert cumulativeCounts(table, mask, 'institution', lowerDate = lowerDate, upperDate = upperDate) == referenceCounts(dates, lowerDate, upperDate)
+
+def test_binning():
+    table = ComponentTable.fromComponents(makeComponents(2000, seed = 1))
+    daily = cumulativeCounts(table)
+    for binning in ['week', 'month']:
+        counter = cumulativeCounts(table, binning = binning)
+        assert counter['total']['counts'][-1] == daily['total']['counts'][-1] == 2000
+        assert counter['total']['dates'] == sorted(counter['total']['dates']) and len(counter['total']['dates']) < len(daily['total']['dates'])
+    assert all(date.endswith('-01') for date in cumulativeCounts(table, binning = 'month')['total']['dates'])
+    # Weeks start on Monday
+    days = np.array(['2019-01-27', '2019-01-28', '2019-02-03'], dtype = 'datetime64[D]')
+    assert [str(week.astype('datetime64[D]') - np.timedelta64(3, 'D')) for week in binDays(days, 'week')] == ['2019-01-21', '2019-01-28', '2019-01-28']
+    assert cumulativeCounts(table, np.zeros(len(table), dtype = bool)) == {}
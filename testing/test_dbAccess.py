@@ -0,0 +1,80 @@
+import json, sys, threading
+
+import pytest
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+import itk_pdb.dbAccess as dbAccess
+
+class EchoHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    client_ports = set()
+
+    def do_GET(self):
+        EchoHandler.client_ports.add(self.client_address[1])
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length else b'{}'
+        out = json.dumps({'action': self.path.lstrip('/'), 'data': json.loads(body.decode('utf-8'))}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    do_POST = do_GET
+
+    def log_message(self, *args):
+        pass
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+def test_functional_api_reuses_connections():
+    server = ThreadingServer(('127.0.0.1', 0), EchoHandler)
+    thread = threading.Thread(target = server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        url = 'http://127.0.0.1:%s/' % server.server_address[1]
+        dbAccess.configureTransport(pool_size = 2)
+        for i in range(5):
+            out = dbAccess.doRequest(url + 'getComponent', data = json.dumps({'component': i}).encode('utf-8'),
+                                     headers = {'Content-Type': 'application/json'}, method = 'GET')
+            assert out == {'action': 'getComponent', 'data': {'component': i}}
+        assert len(EchoHandler.client_ports) == 1
+        assert dbAccess.getTransport() is dbAccess.getTransport()
+    finally:
+        dbAccess.configureTransport(pool_size = 10)
+        server.shutdown()
+        server.server_close()
+
+@pytest.fixture
+def echo_url():
+    server = ThreadingServer(('127.0.0.1', 0), EchoHandler)
+    thread = threading.Thread(target = server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield 'http://127.0.0.1:%s/' % server.server_address[1]
+    dbAccess.configureTransport()
+    server.shutdown()
+    server.server_close()
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason = 'asyncio.run requires Python 3.7')
+@pytest.mark.parametrize('use_aiohttp', [True, False])
+def test_async_session(echo_url, use_aiohttp, monkeypatch):
+    import itk_pdb.asyncAccess as asyncAccess
+    if use_aiohttp and asyncAccess.aiohttp is None:
+        pytest.skip('aiohttp is not installed')
+    if not use_aiohttp:
+        monkeypatch.setattr(asyncAccess, 'aiohttp', None)
+
+    session = dbAccess.ITkPDSession(enable_printing = False)
+    session.updateToken('abc')
+    commands = [{'action': 'getComponent', 'method': 'GET', 'data': {'component': i}, 'url': echo_url} for i in range(50)]
+    outputs = asyncAccess.runMany(commands, session = session, max_concurrency = 8)
+    assert outputs == [{'action': 'getComponent', 'data': {'component': i}} for i in range(50)]
@@ -0,0 +1,39 @@
+import os
+
+from itk_pdb.fileIndex import FileIndex
+
+def touch(*parts):
+    path = os.path.join(*parts)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    open(path, 'w').close()
+    return path
+
+def test_find(tmpdir):
+    root = str(tmpdir)
+    touch(root, '20USBHX0000001.det')
+    fuzzy = touch(root, 'run', '20USBHX0000001_RCPlot_20190128_101112.pdf')
+    touch(root, 'run', 'deeper', '20USBHX0000002_RCPlot_20190128_101112.pdf')
+    touch(root, 'IGNORE', '20USBHX0000003_RCPlot_20190128_101112.pdf')
+    trim = touch(root, 'run', '20USBHX0000001_tr-1_20190128.trim')
+
+    index = FileIndex(root, depth = 1)
+    assert index.find('20USBHX0000001.det') == os.path.join(root, '20USBHX0000001.det')
+    # The time stamp may be a second off
+    assert index.find('20USBHX0000001_RCPlot_20190128_101113.pdf') == fuzzy
+    assert index.find('20USBHX0000001_tr-1_20190128.trim') == trim
+    assert index.find('20USBHX0000002_RCPlot_20190128_101112.pdf') is None
+    assert index.find('20USBHX0000003_RCPlot_20190128_101112.pdf') is None
+    assert FileIndex(root, depth = 2).find('20USBHX0000002_RCPlot_20190128_101112.pdf') is not None
+
+def test_refresh(tmpdir):
+    root = str(tmpdir)
+    touch(root, 'scan_1.txt')
+    index = FileIndex(root, max_age = 3600)
+    assert index.find('module_2.txt') is None
+    listing = index.directories[root]
+    assert not index.refresh() and index.directories[root] is listing
+    # A miss always checks for new files, even within max_age
+    path = touch(root, 'module_2.txt')
+    os.utime(root, (0, os.stat(root).st_mtime + 10))
+    assert index.find('module_2.txt') == path
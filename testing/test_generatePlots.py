@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from generatePlots import PlotMaker, loadBatch
+from itk_pdb.snapshotStore import SnapshotStore
+
+COMPONENTS = [{'code': '%032x' % i, 'componentType': {'code': 'HYBRID'}, 'cts': '2019-%02d-01T00:00:00.000Z' % (1 + i % 12), 'institution': {'code': ['LBNL', 'RAL'][i % 2]},
+                'currentLocation': {'code': 'LBNL'}, 'trashed': i % 5 == 0} for i in range(100)]
+
+class StubPlotMaker(PlotMaker):
+
+    def __init__(self):
+        super(StubPlotMaker, self).__init__(verbose = False)
+        self.calls = []
+
+    def doSomething(self, action, method, data = None, url = None):
+        self.calls.append(action)
+        if action == 'listInstitutions':
+            return [{'code': 'LBNL'}, {'code': 'RAL'}]
+        return {'types': [{'code': 'X'}], 'stages': []}
+
+    def doSomethingPaged(self, action, method, data = None, stream = False):
+        self.calls.append(action)
+        return iter(COMPONENTS)
+
+def test_batch_shares_listings(tmpdir):
+    batch = {'defaults': {'project': 's', 'trashed': False},
+             'plots': [{'componentType': 'hybrid', 'savePath': str(tmpdir.join('all.pdf'))},
+                       {'componentType': 'HYBRID', 'savePath': str(tmpdir.join('split.png')), 'split': 'institution', 'institution': ['lbnl', 'ral']},
+                       {'componentType': 'HYBRID', 'savePath': str(tmpdir.join('monthly.pdf')), 'binning': 'month', 'currentLocation': 'LBNL'},
+                       {'componentType': 'HYBRID', 'savePath': str(tmpdir.join('unknown.pdf')), 'institution': 'NOWHERE'},
+                       {'componentType': 'MODULE', 'savePath': str(tmpdir.join('modules.pdf')), 'lowerDate': '2030-01-01'}]}
+    tmpdir.join('batch.json').write(json.dumps(batch))
+    plots = loadBatch(str(tmpdir.join('batch.json')), 'now')
+    assert plots[1]['institution'] == ['LBNL', 'RAL'] and plots[2]['currentLocation'] == ['LBNL'] and plots[0]['project'] == 'S'
+
+    plotMaker = StubPlotMaker()
+    jobs = plotMaker.makeCounters(plots)
+    # One listing per component type, the institutions are only listed once, and the unknown institution/empty plot are skipped
+    assert plotMaker.calls.count('listComponents') == 2 and plotMaker.calls.count('listInstitutions') == 1
+    assert [kwargs['savePath'] for counter, kwargs in jobs] == [plots[i]['savePath'] for i in range(3)]
+    counters = [counter for counter, kwargs in jobs]
+    assert counters[0]['total']['counts'][-1] == 80
+    assert set(counters[1]) == set(['total', 'LBNL', 'RAL']) and counters[1]['LBNL']['counts'][-1] == 40
+    assert len(counters[2]['total']['dates']) == 12
+
+def test_yaml_batch(tmpdir):
+    yaml = pytest.importorskip('yaml')
+    batch = [{'componentType': 'hybrid', 'savePath': str(tmpdir.join('all.pdf')), 'trashed': False}]
+    tmpdir.join('batch.yaml').write(yaml.safe_dump(batch))
+    tmpdir.join('batch.json').write(json.dumps(batch))
+    assert loadBatch(str(tmpdir.join('batch.yaml')), 'now') == loadBatch(str(tmpdir.join('batch.json')), 'now')
+
+def test_offline_snapshot(tmpdir):
+    batch = [{'componentType': 'HYBRID', 'savePath': str(tmpdir.join('split.pdf')), 'split': 'institution', 'trashed': False}]
+    tmpdir.join('batch.json').write(json.dumps(batch))
+    plots = loadBatch(str(tmpdir.join('batch.json')), 'now')
+    online = [counter for counter, kwargs in StubPlotMaker().makeCounters(plots)]
+    snapshot = str(tmpdir.join('snapshot.sqlite'))
+    assert [counter for counter, kwargs in StubPlotMaker().makeCounters([dict(plot, snapshot = snapshot) for plot in plots])] == online
+    # Offline, nothing at all is asked of the ITkPD
+    plotMaker = StubPlotMaker()
+    jobs = plotMaker.makeCounters([dict(plot, snapshot = snapshot, offline = True) for plot in plots])
+    assert [counter for counter, kwargs in jobs] == online and plotMaker.calls == []
+
+def test_stage_plots(tmpdir):
+    stages = ['ASSEMBLY', 'TESTING', 'SHIPPED']
+    listing = [dict(component, currentStage = {'code': stages[i % 3]},
+                    stages = [{'code': stage, 'dateTime': '2019-%02d-01T00:00:00.000Z' % (1 + k)} for k, stage in enumerate(stages[:i % 3 + 1])])
+                for i, component in enumerate(COMPONENTS)]
+    snapshot = str(tmpdir.join('snapshot.sqlite'))
+    store = SnapshotStore(snapshot)
+    store.refresh(iter(listing), 'S', 'HYBRID')
+    store.close()
+    batch = [{'componentType': 'HYBRID', 'savePath': str(tmpdir.join('testing.pdf')), 'currentStage': ['TESTING', 'SHIPPED']},
+             {'componentType': 'HYBRID', 'savePath': str(tmpdir.join('split.pdf')), 'currentStage': ['TESTING'], 'split': 'institution'}]
+    tmpdir.join('batch.json').write(json.dumps(batch))
+    plots = [dict(plot, snapshot = snapshot, offline = True) for plot in loadBatch(str(tmpdir.join('batch.json')), 'now')]
+    jobs = StubPlotMaker().makeCounters(plots)
+    # Only the requested stages are counted, and a split which cannot be made is refused rather than ignored
+    assert len(jobs) == 1 and set(jobs[0][0]) == set(['total', 'TESTING', 'SHIPPED'])
+    assert jobs[0][0]['SHIPPED']['counts'][-1] == len([i for i in range(100) if i % 3 == 2])
@@ -0,0 +1,85 @@
+import json
+
+import pytest
+import requests
+
+import itk_pdb.dbAccess as dbAccess
+from itk_pdb import instrumentation
+from itk_pdb.dbAccess import ITkPDSession
+from itk_pdb.instrumentation import Histogram, Metrics
+from stubServer import StubServer
+
+@pytest.fixture
+def metrics():
+    metrics = dbAccess.enableMetrics()
+    yield metrics
+    dbAccess.disableMetrics()
+
+def test_histogram():
+    histogram = Histogram([1, 2, 4])
+    for value in [0.5, 1.5, 1.5, 3, 10]:
+        histogram.observe(value)
+    assert list(histogram.cumulative()) == [(1, 1), (2, 3), (4, 4), (float('inf'), 5)]
+    assert histogram.sum == 16.5
+    assert histogram.quantile(0.5) == pytest.approx(1.75)
+    assert Histogram([1]).quantile(0.5) is None
+
+def test_export():
+    metrics = Metrics()
+    metrics.record('getComponent', method = 'GET', status = 200, latency = 0.02, sent = 10, received = 2000)
+    metrics.record('getComponent', method = 'GET', status = 401, latency = 0.2, sent = 10, received = 100)
+    metrics.record('getComponent', retry = True)
+    metrics.record('getComponent', cached = True)
+    stats = metrics.toJSON()['actions']['getComponent']
+    assert (stats['requests'], stats['status'], stats['retries'], stats['cacheHits']) == (2, {'200': 1, '401': 1}, 1, 1)
+    assert stats['latency']['count'] == 2 and stats['received']['buckets']['+Inf'] == 2
+    text = metrics.toPrometheus()
+    assert 'itkpd_requests_total{action="getComponent",status="401"} 1' in text
+    assert 'itkpd_request_duration_seconds_bucket{action="getComponent",le="0.025"} 1' in text
+    assert 'itkpd_response_size_bytes_count{action="getComponent"} 2' in text
+    assert 'itkpd_retries_total{action="getComponent"} 1' in text
+
+def test_dump(tmpdir):
+    metrics = Metrics()
+    metrics.record('listComponents', status = 200, latency = 1.0)
+    metrics.dump(str(tmpdir.join('metrics.json')))
+    metrics.dump(str(tmpdir.join('metrics.prom')))
+    assert json.loads(tmpdir.join('metrics.json').read())['actions']['listComponents']['requests'] == 1
+    assert tmpdir.join('metrics.prom').read().startswith('# HELP itkpd_requests_total')
+
+def test_session_requests_are_recorded(metrics):
+    with StubServer(n_components = 10) as server:
+        session = ITkPDSession(enable_printing = False, cache = False)
+        session.doSomething('getComponent', 'GET', data = {'component': '%032x' % 1}, url = server.url)
+        with pytest.raises(requests.HTTPError):
+            session.doSomething('unknownCommand?x=1', 'GET', url = server.url)
+        session.close()
+    actions = metrics.toJSON()['actions']
+    assert actions['getComponent']['status'] == {'200': 1}
+    assert actions['getComponent']['received']['count'] == 1
+    assert actions['unknownCommand']['status'] == {'404': 1}
+
+def test_functional_requests_are_recorded(metrics, monkeypatch):
+    monkeypatch.setattr(dbAccess, 'testing', False)
+    with StubServer(n_components = 10) as server:
+        dbAccess.doSomething('getComponent', data = {'component': '%032x' % 2}, url = server.url, method = 'GET')
+        list(dbAccess.doSomething('listComponents', data = {'pageInfo': {'pageIndex': 0, 'pageSize': 100}}, url = server.url, method = 'GET', stream = True))
+    actions = metrics.toJSON()['actions']
+    assert actions['getComponent']['status'] == {'200': 1}
+    assert actions['listComponents']['status'] == {'200': 1}
+    assert actions['getComponent']['sent']['sum'] > 0
+
+def test_custom_recorder(monkeypatch):
+    monkeypatch.setattr(dbAccess, 'testing', False)
+    class Recorder(object):
+        def __init__(self):
+            self.events = []
+        def record(self, **event):
+            self.events.append(event)
+    recorder = instrumentation.addRecorder(Recorder())
+    try:
+        with StubServer(n_components = 10) as server:
+            dbAccess.doSomething('getComponent', data = {'component': '%032x' % 3}, url = server.url, method = 'GET')
+    finally:
+        instrumentation.removeRecorder(recorder)
+    assert [(event['action'], event['status']) for event in recorder.events] == [('getComponent', 200)]
@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+from itk_pdb.dbAccess import ITkPDSession
+from itk_pdb.jsonStream import JSONListStream, ijson
+from stubServer import StubServer
+
+DOCUMENTS = [   {'pageItemList': [{'a': [1, [2, 3], {'b': u'\xe9'}]}, {'c': 1.5}, 3, 'x', None], 'pageInfo': {'total': 5, 'pageIndex': 0}},
+                {'pageInfo': {'total': 1}, 'itemList': [{'x': 1}], 'uuAppErrorMap': {}},
+                [1, {'a': 2}, [3]],
+                {'code': 'abc'},
+                {'pageItemList': []},
+                {'nested': {'pageItemList': [1]}, 'n': 12345678901234}   ]
+
+@pytest.mark.parametrize('use_ijson', [False, pytest.param(True, marks = pytest.mark.skipif(ijson is None, reason = 'ijson is not installed'))])
+@pytest.mark.parametrize('document', DOCUMENTS)
+def test_stream_matches_json(document, use_ijson):
+    text = json.dumps(document, ensure_ascii = False).encode('utf-8')
+    for size in [1, 3, 1000]:
+        stream = JSONListStream([text[i:i + size] for i in range(0, len(text), size)], use_ijson = use_ijson)
+        items = list(stream)
+        if isinstance(document, list):
+            assert (items, stream.meta, stream.key) == (document, {}, '')
+        elif stream.key is None:
+            assert (items, stream.meta) == ([], document)
+        else:
+            meta = dict(document)
+            assert items == meta.pop(stream.key)
+            assert stream.meta == meta
+
+def test_stream_is_incremental():
+    def chunks():
+        yield b'{"pageItemList": [{"code": "a"}, '
+        yield b'{"code": "b"}'
+        raise AssertionError('read too far')
+    items = iter(JSONListStream(chunks(), use_ijson = False))
+    assert next(items) == {'code': 'a'}
+
+@pytest.mark.parametrize('pageSize', [7, 50, 1000])
+def test_session_streamed_pages(pageSize):
+    with StubServer(n_components = 123) as server:
+        session = ITkPDSession(enable_printing = False, cache = False)
+        streamed = list(session.doSomethingPaged('listComponents', 'GET', data = {'project': 'S'}, url = server.url, pageSize = pageSize, stream = True))
+        paged = list(session.doSomethingPaged('listComponents', 'GET', data = {'project': 'S'}, url = server.url, pageSize = pageSize))
+        session.close()
+    assert streamed == paged
+    assert [component['code'] for component in streamed] == ['%032x' % i for i in range(123)]
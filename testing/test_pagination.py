@@ -0,0 +1,78 @@
+import json, threading
+
+from itk_pdb.jsonStream import JSONListStream
+from itk_pdb.pagination import PageIterator, streamPages
+
+# cap := the largest page the server returns, whatever pageSize is asked for
+def makeFetchPage(total, report_total = True, calls = None, cap = None):
+    def fetchPage(pageIndex, pageSize):
+        if calls is not None:
+            calls.append(pageIndex)
+        pageSize = min(pageSize, cap) if cap is not None else pageSize
+        start = pageIndex * pageSize
+        items = list(range(start, min(start + pageSize, total)))
+        pageInfo = {'pageIndex': pageIndex, 'pageSize': pageSize}
+        if report_total:
+            pageInfo['total'] = total
+        return {'pageItemList': items, 'pageInfo': pageInfo}
+    return fetchPage
+
+def test_all_pages_in_order():
+    pages = PageIterator(makeFetchPage(1234), pageSize = 100, window = 3)
+    assert list(pages) == list(range(1234))
+    assert pages.total == 1234
+
+def test_without_total():
+    calls = []
+    pages = PageIterator(makeFetchPage(250, report_total = False, calls = calls), pageSize = 100, window = 4)
+    assert list(pages) == list(range(250))
+    # Speculative pages past the end are allowed, but never more than one window's worth
+    assert max(calls) <= 2 + 4
+
+def test_exact_multiple_of_page_size():
+    calls = []
+    assert list(PageIterator(makeFetchPage(300, calls = calls), pageSize = 100)) == list(range(300))
+    assert sorted(calls) == [0, 1, 2]
+
+def test_capped_page_size():
+    fetch = makeFetchPage(1234, cap = 100)
+    assert list(PageIterator(fetch, pageSize = 500, window = 3)) == list(range(1234))
+    streamed = streamPages(lambda pageIndex, pageSize: JSONListStream([json.dumps(fetch(pageIndex, pageSize)).encode('utf-8')]), pageSize = 500)
+    assert list(streamed) == list(range(1234))
+
+def test_complete_item_list():
+    calls = []
+    def fetchPage(pageIndex, pageSize):
+        calls.append(pageIndex)
+        return {'itemList': [1, 2, 3]}
+    assert list(PageIterator(fetchPage, pageSize = 2)) == [1, 2, 3]
+    assert calls == [0]
+
+def test_bounded_window():
+    lock = threading.Lock()
+    state = {'in_flight': 0, 'max_in_flight': 0}
+    fetch = makeFetchPage(5000)
+    def fetchPage(pageIndex, pageSize):
+        with lock:
+            state['in_flight'] += 1
+            state['max_in_flight'] = max(state['max_in_flight'], state['in_flight'])
+        try:
+            return fetch(pageIndex, pageSize)
+        finally:
+            with lock:
+                state['in_flight'] -= 1
+    assert len(list(PageIterator(fetchPage, pageSize = 10, window = 3))) == 5000
+    assert state['max_in_flight'] <= 3
+
+def test_standard_command_fetches_every_page(mocker):
+    fetch = makeFetchPage(25)
+    def doSomething(action, method = None, data = None):
+        assert action == 'listComponents'
+        return fetch(data['pageInfo']['pageIndex'], data['pageInfo']['pageSize'])
+    mocker.patch('itk_pdb.dbAccess.doSomething', side_effect = doSomething)
+
+    from itk_pdb.databaseUtilities import commands
+    assert commands['listComponents'].run(project = 'S') == list(range(25))
+    assert list(commands['listComponents'].iterate(pageSize = 7, project = 'S')) == list(range(25))
+    # An explicitly requested page is returned on its own
+    assert commands['listComponents'].run(project = 'S', pageInfo__pageIndex = 1, pageInfo__pageSize = 10) == list(range(10, 20))
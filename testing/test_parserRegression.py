@@ -0,0 +1,16 @@
+import json
+
+import pytest
+
+from itk_pdb.ITSDAQTestClasses import ResultsFile
+from itk_pdb.gainArrays import serializeJSON
+from stubResults import CORPUS, writeResultsFile, loadGolden
+
+# The golden output was written by benchmark_parser.py --update-golden, any change to it must be deliberate
+@pytest.mark.parametrize('name', sorted(CORPUS))
+@pytest.mark.parametrize('arrays', [False, True])
+def test_corpus_matches_golden(tmpdir, name, arrays):
+    results_file = ResultsFile(writeResultsFile(str(tmpdir.join(name + '.txt')), **CORPUS[name]), enable_printing = False)
+    results_file.getTests(arrays = arrays)
+    tests = json.loads(json.dumps([dict(test, JSON = serializeJSON(test['JSON'])) for test in results_file]))
+    assert tests == loadGolden(name)
@@ -0,0 +1,59 @@
+import time
+
+from itk_pdb.responseCache import ResponseCache
+
+def test_hit_miss_and_canonical_key(tmpdir):
+    cache = ResponseCache(str(tmpdir.join('cache.sqlite')))
+    assert cache.get('getComponentTypeByCode', {'project': 'S', 'code': 'HYBRID'}) == (False, None)
+    cache.put('getComponentTypeByCode', {'project': 'S', 'code': 'HYBRID'}, {'code': 'HYBRID', 'types': []})
+    # Key ordering and JSON encoding of the payload don't matter
+    assert cache.get('getComponentTypeByCode', b'{"code": "HYBRID", "project": "S"}') == (True, {'code': 'HYBRID', 'types': []})
+    assert cache.get('getComponentTypeByCode', {'project': 'P', 'code': 'HYBRID'}) == (False, None)
+    # Uncached commands are never stored
+    cache.put('listComponents', {'project': 'S'}, [1, 2, 3])
+    assert cache.get('listComponents', {'project': 'S'}) == (False, None)
+
+def test_ttl(tmpdir):
+    cache = ResponseCache(str(tmpdir.join('cache.sqlite')), ttl_policies = {'getComponent': 0.05})
+    cache.put('getComponent', {'component': 'abc'}, {'code': 'abc'})
+    assert cache.get('getComponent', {'component': 'abc'})[0]
+    time.sleep(0.1)
+    assert not cache.get('getComponent', {'component': 'abc'})[0]
+
+def test_invalidation_by_code_or_serial(tmpdir):
+    cache = ResponseCache(str(tmpdir.join('cache.sqlite')))
+    cache.put('getComponent', {'component': '20USBHX0000001'}, {'code': 'abc123', 'serialNumber': '20USBHX0000001'})
+    cache.put('getComponent', {'component': 'def456'}, {'code': 'def456', 'serialNumber': None})
+    assert cache.invalidate('getComponent', {'component': 'abc123'}) == 0
+    assert cache.invalidate('setComponentStage', {'component': 'abc123', 'stage': 'TESTED'}) == 1
+    assert not cache.get('getComponent', {'component': '20USBHX0000001'})[0]
+    assert cache.get('getComponent', {'component': 'def456'})[0]
+    cache.invalidate('assembleComponent', {'parent': 'xyz', 'child': 'def456'})
+    assert not cache.get('getComponent', {'component': 'def456'})[0]
+    cache.put('getTestRun', {'testRun': '5c1a2b'}, {'id': '5c1a2b', 'state': 'ready'})
+    assert cache.invalidate('setTestRunStatus', {'testRun': '5c1a2b', 'status': 'deleted'}) == 1
+    assert not cache.get('getTestRun', {'testRun': '5c1a2b'})[0]
+
+def test_lru_eviction(tmpdir):
+    cache = ResponseCache(str(tmpdir.join('cache.sqlite')), max_entries = 3)
+    for i in range(3):
+        cache.put('getComponent', {'component': str(i)}, {'code': str(i)})
+        time.sleep(0.01)
+    cache.get('getComponent', {'component': '0'})
+    cache.put('getComponent', {'component': '3'}, {'code': '3'})
+    assert cache.stats()['entries'] == 3
+    assert cache.get('getComponent', {'component': '0'})[0]
+    assert not cache.get('getComponent', {'component': '1'})[0]
+
+def test_functional_api_reads_through(tmpdir, mocker):
+    import itk_pdb.dbAccess as dbAccess
+    m = mocker.patch('itk_pdb.dbAccess.doRequest', return_value = {'pageItemList': [{'code': 'UNIA'}]})
+    mocker.patch('itk_pdb.dbAccess.testing', False)
+    mocker.patch('itk_pdb.dbAccess.token', '1234')
+    dbAccess.enableCache(str(tmpdir.join('cache.sqlite')))
+    try:
+        for i in range(3):
+            assert dbAccess.doSomething('listInstitutions', method = 'GET') == {'pageItemList': [{'code': 'UNIA'}]}
+        assert m.call_count == 1
+    finally:
+        dbAccess.disableCache()
@@ -0,0 +1,101 @@
+import threading
+
+import itk_pdb.resultsWatcher as resultsWatcher
+
+from itk_pdb.ITSDAQParser import ResultsParser
+from itk_pdb.resultsWatcher import ResultsTail, ResultsWatcher, PollingObserver
+from stubResults import generateLines
+
+def test_tail_reads_complete_tests_once(tmpdir):
+    lines = list(generateLines(n_modules = 3, n_chips = 4))
+    expected = list(ResultsParser(lines))
+    path = tmpdir.join('results.txt')
+    path.write('')
+    tail = ResultsTail(str(path))
+    tests = []
+    # Append the file a few lines at a time, as ITSDAQ does
+    for i in range(0, len(lines), 37):
+        with open(str(path), 'a') as f:
+            f.writelines(lines[i:i + 37])
+        tests += tail.read()
+    assert tail.pending
+    tests += tail.read(final = True)
+    assert not tail.pending and tail.read(final = True) == []
+    assert tests == expected
+
+def test_tail_reads_windows_line_endings(tmpdir):
+    lines = list(generateLines(n_modules = 2, n_chips = 4))
+    path = tmpdir.join('results.txt')
+    path.write_binary(''.join(lines).replace('\n', '\r\n').encode('utf-8'))
+    tail = ResultsTail(str(path))
+    tests = tail.read()
+    # The last test is left pending, and is parsed again by peek() without moving past it
+    assert tail.pending and tail.peek() == tail.peek()
+    assert tests + tail.read(final = True) == list(ResultsParser(lines))
+
+def test_watcher(tmpdir):
+    lines = list(generateLines(n_modules = 2, n_chips = 4))
+    tmpdir.join('st_diagnostics_1.txt').write('%NewTest\n')
+    path = tmpdir.join('results.txt')
+    path.write(''.join(lines[:len(lines) // 2]))
+    handled = []
+    watcher = ResultsWatcher(str(tmpdir), lambda path, tests: handled.append((path, len(tests))), settle = 0, idle = 3600, interval = 0,
+                                observer = PollingObserver(str(tmpdir)), backfill = True)
+    first = watcher.poll()
+    assert first > 0
+    with open(str(path), 'a') as f:
+        f.writelines(lines[len(lines) // 2:])
+    second = watcher.poll()
+    assert watcher.poll() == 0
+    # Every test is queued once, the last one when the file has gone idle
+    watcher.idle = 0
+    assert first + second + watcher.poll() == len(list(ResultsParser(lines)))
+    stop = threading.Event()
+    stop.set()
+    watcher.run(stop)
+    assert [name for name, n in handled] == 3 * [str(path)] and watcher.errors == []
+
+def test_watcher_starts_at_the_end(tmpdir, capsys):
+    lines = list(generateLines(n_modules = 2, n_chips = 4))
+    half = [i for i, line in enumerate(lines) if line.startswith('%NewTest')][4]
+    path = tmpdir.join('results.txt')
+    path.write(''.join(lines[:half]))
+    handled = []
+    watcher = ResultsWatcher(str(tmpdir), lambda path, tests: handled.append(tests), settle = 0, idle = 0, interval = 0,
+                                observer = PollingObserver(str(tmpdir)))
+    # The tests already in the file are not read again, only what is appended after the watch started
+    assert watcher.poll() == 0
+    appended = lines[half:]
+    malformed = appended.index('#T0 T1\n') + 1
+    appended[malformed] = '20.5 abc\n'
+    with open(str(path), 'a') as f:
+        f.writelines(appended)
+    queued = watcher.poll()
+    # The malformed block is skipped (and recorded), without stopping the watch
+    assert queued == len(list(ResultsParser(lines[half:]))) - 1 and [type(e) for path, e in watcher.errors] == [ValueError]
+    assert 'Skipped a malformed test in \'%s\' -- ValueError' % path in capsys.readouterr().out
+    stop = threading.Event()
+    stop.set()
+    watcher.run(stop)
+    assert sum(len(tests) for tests in handled) == queued
+
+def test_watcher_reports_and_caps_errors(tmpdir, capsys, monkeypatch):
+    monkeypatch.setattr(resultsWatcher, 'MAX_ERRORS', 2)
+    lines = list(generateLines(n_modules = 3, n_chips = 4))
+    path = tmpdir.join('results.txt')
+    handled = []
+    def handler(path, tests):
+        handled.append(tests)
+        raise RuntimeError('upload failed')
+    watcher = ResultsWatcher(str(tmpdir), handler, settle = 0, idle = 0, interval = 0, observer = PollingObserver(str(tmpdir)), backfill = True)
+    starts = [i for i, line in enumerate(lines) if line.startswith('%NewTest')]
+    # Every batch fails to be handled
+    for start, end in [(0, starts[5]), (starts[5], starts[12]), (starts[12], len(lines))]:
+        with open(str(path), 'a') as f:
+            f.writelines(lines[start:end])
+        watcher.poll()
+    stop = threading.Event()
+    stop.set()
+    watcher.run(stop)
+    assert len(handled) > 2 and capsys.readouterr().out.count('Could not handle the tests of \'%s\' -- RuntimeError: upload failed' % path) == len(handled)
+    assert [str(e) for p, e in watcher.errors] == 2 * ['upload failed']
@@ -0,0 +1,108 @@
+import threading, time
+
+import pytest
+import requests
+
+import itk_pdb.dbAccess as dbAccess
+from itk_pdb.dbAccess import ITkPDSession
+from itk_pdb.retryScheduler import RetryScheduler, AdaptiveLimit, classifyError, parseRetryAfter, isReplayable, \
+                                    THROTTLED, TRANSIENT, AUTH, CLIENT, SERVER
+from stubServer import StubServer
+
+UNAVAILABLE = (503, {'uuAppErrorMap': {'uu-app-server/serviceUnavailable': {'type': 'error'}}}, {})
+OK = (200, {'uuAppErrorMap': {}}, {})
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(dbAccess, 'scheduler', RetryScheduler(sleep = sleeps.append))
+    monkeypatch.setattr(dbAccess, 'testing', False)
+    return sleeps
+
+def test_classify():
+    assert classifyError(429) == THROTTLED
+    assert classifyError(503, retryAfter = 5) == THROTTLED
+    assert classifyError(503) == TRANSIENT
+    assert classifyError(500, {'uu-app-server/internalServerError': {'message': 'Signature verification raised'}}) == AUTH
+    assert classifyError(500, {'cern-itkpd-main/getComponent/invalidDtoIn': {}}) == CLIENT
+    assert classifyError(500, {'uu-app-server/requestTimeout': {}}) == TRANSIENT
+    assert classifyError(404) == CLIENT
+    assert classifyError(500) == SERVER
+    assert parseRetryAfter('3') == 3.0
+    assert parseRetryAfter('Wed, 21 Oct 2015 07:28:10 GMT', now = 1445412480) == 10.0
+    assert parseRetryAfter('soon') is None
+    assert isReplayable('getComponent') and isReplayable('setComponentTrashed') and not isReplayable('registerComponent')
+    assert not isReplayable('setComponentStage') and not isReplayable('setComponentGrade')
+
+def test_backoff():
+    scheduler = RetryScheduler(backoff = 1.0, max_backoff = 5.0)
+    for attempt in range(1, 8):
+        assert 0 <= scheduler.delay(attempt) <= min(5.0, 2 ** (attempt - 1))
+    assert scheduler.delay(3, retryAfter = 7.0) == 7.0
+
+def test_aimd():
+    limit = AdaptiveLimit(8, minimum = 2, maximum = 10, cooldown = 0)
+    for i in range(8):
+        limit.onSuccess()
+    assert limit.limit == pytest.approx(9, abs = 0.1)
+    for i in range(5):
+        limit.onThrottle()
+    assert limit.limit == 2
+    limit = AdaptiveLimit(8, cooldown = 60)
+    limit.onThrottle()
+    limit.onThrottle()
+    assert limit.limit == 4
+
+def test_concurrency_is_bounded():
+    scheduler = RetryScheduler(concurrency = 2, max_concurrency = 2)
+    inflight, peak = [0], [0]
+    lock = threading.Lock()
+    def send():
+        with lock:
+            inflight[0] += 1
+            peak[0] = max(peak[0], inflight[0])
+        time.sleep(0.01)
+        with lock:
+            inflight[0] -= 1
+        response = requests.Response()
+        response.status_code = 200
+        return response
+    def run():
+        scheduler.send('getComponent', send)
+    threads = [threading.Thread(target = run) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 2
+
+def test_session_retries_transient_errors(sleeps):
+    with StubServer(n_components = 10) as server:
+        server.inject('getComponent', UNAVAILABLE, (429, {}, {'Retry-After': '2'}))
+        session = ITkPDSession(enable_printing = False, cache = False)
+        assert session.doSomething('getComponent', 'GET', data = {'component': 'abc'}, url = server.url)['code'] == 'abc'
+        session.close()
+        assert server.requests['getComponent'] == 3
+    assert len(sleeps) == 2 and sleeps[1] == 2.0
+
+def test_session_gives_up(sleeps):
+    with StubServer(n_components = 10) as server:
+        server.inject('getComponent', *([UNAVAILABLE] * 5))
+        session = ITkPDSession(enable_printing = False, cache = False)
+        with pytest.raises(requests.HTTPError):
+            session.doSomething('getComponent', 'GET', data = {'component': 'abc'}, url = server.url)
+        session.close()
+        assert server.requests['getComponent'] == 5
+
+def test_functional_retries_only_replayable_commands(sleeps):
+    with StubServer(n_components = 10) as server:
+        server.inject('setComponentTrashed', UNAVAILABLE, OK)
+        server.inject('registerComponent', UNAVAILABLE, OK)
+        server.inject('setComponentStage', UNAVAILABLE, OK)
+        assert dbAccess.doSomething('setComponentTrashed', data = {'component': 'abc', 'trashed': True}, url = server.url, method = 'POST') == {'uuAppErrorMap': {}}
+        with pytest.raises(dbAccess.dbAccessError):
+            dbAccess.doSomething('registerComponent', data = {'project': 'S'}, url = server.url, method = 'POST')
+        # Sending a stage again could append it to the history twice
+        with pytest.raises(dbAccess.dbAccessError):
+            dbAccess.doSomething('setComponentStage', data = {'component': 'abc', 'stage': 'TESTING'}, url = server.url, method = 'POST')
+        assert server.requests == {'setComponentTrashed': 2, 'registerComponent': 1, 'setComponentStage': 1}
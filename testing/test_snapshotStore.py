@@ -0,0 +1,78 @@
+import numpy as np
+
+from itk_pdb.componentTable import ComponentTable
+from itk_pdb.snapshotStore import SnapshotStore
+
+STAGES = ['REGISTERED', 'ASSEMBLY', 'TESTING']
+
+def history(i, stages):
+    return [{'code': STAGES[k], 'dateTime': '2019-%02d-%02dT12:00:00.000Z' % (1 + k, 1 + i % 28)} for k in range(stages)]
+
+def component(i, stages = 2):
+    return {'code': '%032x' % i, 'cts': history(i, stages)[0]['dateTime'], 'componentType': {'code': ['HYBRID', 'MODULE'][i % 2]}, 'type': {'code': 'X'},
+            'institution': {'code': ['LBNL', 'RAL'][i % 3 == 0]}, 'currentStage': {'code': STAGES[stages - 1]}, 'trashed': False}
+
+# As getComponent, with the stage history and the test runs
+def detailed(code):
+    i = int(code, 16)
+    stages = 3 if i == 4 else 2
+    return dict(component(i, stages), stages = history(i, stages),
+                tests = [{'code': 'IV', 'testRuns': [{'id': 'run%s' % i, 'state': 'ready', 'date': '2019-03-01T00:00:00.000Z', 'runNumber': '%s-1' % i}]}])
+
+class Fetcher(object):
+
+    def __init__(self):
+        self.fetched = []
+
+    def getComponents(self, codes, workers = 8, return_exceptions = False):
+        for code in codes:
+            self.fetched.append(code)
+            yield code, detailed(code)
+
+def test_refresh_is_incremental(tmpdir):
+    fetcher = Fetcher()
+    snapshot = SnapshotStore(str(tmpdir.join('snapshot.sqlite')))
+    listing = [component(i) for i in range(0, 20, 2)]
+    refresh = snapshot.refresh(iter(listing), 'S', 'HYBRID', getComponents = fetcher.getComponents)
+    assert refresh == {'written': 10, 'removed': 0, 'fetched': 10, 'errors': []}
+    table = snapshot.table('S')
+    assert len(table) == 10 and sorted(table.value('code', i) for i in range(10)) == sorted(c['code'] for c in listing)
+
+    # Nothing changed: nothing is written or fetched, and the cached table is used as it is
+    fetcher.fetched = []
+    assert snapshot.refresh(iter(listing), 'S', 'HYBRID', getComponents = fetcher.getComponents)['written'] == 0 and fetcher.fetched == []
+
+    # A component moves stage, another is trashed (a change without a new stamp), one is added and one is gone
+    listing[2] = component(4, stages = 3)
+    listing[3]['trashed'] = True
+    listing = listing[1:] + [component(20)]
+    refresh = snapshot.refresh(iter(listing), 'S', 'HYBRID', getComponents = fetcher.getComponents)
+    assert (refresh['written'], refresh['removed']) == (3, 1)
+    assert sorted(fetcher.fetched) == ['%032x' % 4, '%032x' % 20]
+    # Test runs are uploaded without the component changing: they are kept up to date by refetching the details past maxAge
+    fetcher.fetched = []
+    assert snapshot.refresh(iter(listing), 'S', 'HYBRID', getComponents = fetcher.getComponents, maxAge = 0)['fetched'] == 10
+    snapshot.close()
+
+    # The snapshot is read back offline, with the changes applied
+    snapshot = SnapshotStore(str(tmpdir.join('snapshot.sqlite')))
+    assert snapshot.refreshed('S', 'HYBRID') is not None and snapshot.refreshed('S', 'MODULE') is None
+    table = snapshot.table('S', 'HYBRID')
+    assert len(table) == 10 and int(table.isIn('currentStage', ['TESTING']).sum()) == 1 and int((table.column('trashed') == 1).sum()) == 1
+    assert len(snapshot.table('S', 'HYBRID', currentStage = ['TESTING'])) == 1
+    assert [stage for code, stage, dateTime in snapshot.events(['%032x' % 4])] == STAGES
+    assert '%032x' % 0 not in set(code for code, stage, dateTime in snapshot.events())
+    assert [run['id'] for run in snapshot.testRuns(testType = 'IV')] == ['run%s' % i for i in range(2, 22, 2)]
+
+def test_table_matches_listing():
+    snapshot = SnapshotStore(':memory:')
+    listing = [component(i) for i in range(300)]
+    for componentType in ['HYBRID', 'MODULE']:
+        snapshot.refresh(iter([c for c in listing if c['componentType']['code'] == componentType]), 'S', componentType)
+    expected = ComponentTable.fromComponents(sorted(listing, key = lambda c: c['code']))
+    # Once from the listings, once from the columnar cache
+    for i in range(2):
+        table = snapshot.table('S')
+        assert list(table.rows()) == list(expected.rows())
+        assert np.array_equal(table.stageTimes, expected.stageTimes) and np.array_equal(table.days(), expected.days())
+    assert len(snapshot.table('S', ['HYBRID', 'MODULE'])) == 300 and len(snapshot.table('S', 'MODULE', type = 'X')) == 150
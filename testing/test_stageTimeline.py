@@ -0,0 +1,59 @@
+import numpy as np
+
+from itk_pdb.componentTable import ComponentTable
+from itk_pdb.stageTimeline import StageLog, StageTimeline, updateLog
+
+STAGES = ['REGISTERED', 'ASSEMBLY', 'TESTING', 'SHIPPED']
+
+def history(i):
+    rng = np.random.RandomState(i)
+    days = np.sort(rng.choice(np.arange(1, 120), size = 1 + i % 4, replace = False))
+    return [{'code': STAGES[k], 'dateTime': str(np.datetime64('2019-01-01') + day) + 'T12:00:00.000Z'} for k, day in enumerate(days)]
+
+def component(code):
+    stages = history(int(code))
+    return {'code': code, 'currentStage': {'code': stages[-1]['code']}, 'stages': stages, 'cts': stages[0]['dateTime']}
+
+class Session(object):
+
+    def __init__(self):
+        self.fetched = []
+
+    def getComponents(self, components, workers = 8, return_exceptions = False):
+        for code in components:
+            self.fetched.append(code)
+            yield code, component(code) if code != '13' else ValueError('unknown component')
+
+def test_log_is_incremental(tmpdir):
+    session = Session()
+    log = StageLog(str(tmpdir.join('stages.sqlite')))
+    listing = [('%s' % i, component('%s' % i)['currentStage']['code']) for i in range(20)]
+    fetched, errors = updateLog(session, log, listing)
+    assert fetched == 19 and [code for code, error in errors] == ['13']
+    # Only new components, those which failed and those which moved to another stage are fetched again
+    session.fetched = []
+    listing[2] = ('2', 'SHIPPED')
+    updateLog(session, log, listing + [('20', 'REGISTERED')])
+    assert sorted(session.fetched) == ['13', '2', '20']
+    log.close()
+    assert len(StageLog(str(tmpdir.join('stages.sqlite')))) == 20
+
+def test_counts_match_intervals():
+    components = [component('%s' % i) for i in range(200)]
+    table = ComponentTable.fromComponents(components)
+    timeline = StageTimeline.fromTable(table)
+    counter = timeline.counts()
+    assert set(counter) == set(['total'] + STAGES)
+    assert counter['total']['counts'][-1] == 200
+    # The number of components in a stage at the end of each day (but the first, which is stretched to the first day of any stage)
+    for stage in STAGES:
+        for date, count in zip(counter[stage]['dates'][1:], counter[stage]['counts'][1:]):
+            expected = 0
+            for c in components:
+                for k, s in enumerate(c['stages']):
+                    end = c['stages'][k + 1]['dateTime'][0:10] if k + 1 < len(c['stages']) else '9999-12-31'
+                    expected += s['code'] == stage and s['dateTime'][0:10] <= date < end
+            assert count == expected
+    log = StageLog(':memory:')
+    log.record(dict((c['code'], c) for c in components))
+    assert StageTimeline.fromEvents(log.events()).counts(binning = 'month') == timeline.counts(binning = 'month')
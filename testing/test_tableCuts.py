@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from itk_pdb.componentTable import ComponentTable
+from itk_pdb.tableCuts import Column, DAY, ALL, allOf
+from test_componentTable import COMPONENTS
+
+def test_cuts():
+    table = ComponentTable.fromComponents(COMPONENTS)
+    assert list(Column('institution').isIn(['LBNL', 'RAL']).mask(table)) == [True, True, False]
+    # Missing values never pass a comparison
+    assert list((Column('institution') != 'LBNL').mask(table)) == [False, True, False]
+    assert list((Column('currentGrade') >= 2).mask(table)) == [True, False, False]
+    assert list((Column('currentGrade') != 2).mask(table)) == [True, False, False]
+    assert list((Column(DAY) >= '2019-02-01').mask(table)) == [False, True, False]
+    assert list((Column('cts') < '2019-01-28T10:11:12.124Z').mask(table)) == [True, False, False]
+    assert list((Column('serialNumber') == '20USEH00000003').mask(table)) == [False, False, True]
+    assert list(Column('qaState').isSet().mask(table)) == [True, False, False]
+    cut = (Column('currentLocation') == 'RAL') & ~Column('trashed').isIn([True]) | (Column(DAY) <= '2018-12-31')
+    assert list(cut.mask(table)) == [True, False, False]
+    assert list(allOf([]).mask(table)) == [True, True, True] and allOf([]) is ALL
+    with pytest.raises(TypeError):
+        (Column('institution') < 'LBNL').mask(table)
+
+def test_cuts_match_component_walk():
+    rng = np.random.RandomState(0)
+    components = [{'code': '%032x' % i, 'cts': '2019-%02d-%02dT00:00:00.000Z' % (rng.randint(1, 13), rng.randint(1, 29)),
+                    'institution': {'code': rng.choice(['LBNL', 'RAL', 'DESY'])}, 'trashed': bool(rng.randint(2)),
+                    'currentGrade': int(rng.randint(5)) if rng.randint(4) else None} for i in range(20000)]
+    table = ComponentTable.fromComponents(components)
+    cut = allOf([Column('institution').isIn(['LBNL', 'DESY']), Column('trashed').isIn([False]), Column('currentGrade') > 1,
+                    Column(DAY) >= '2019-03-01', Column(DAY) <= '2019-10-31'])
+    expected = [c['institution']['code'] in ['LBNL', 'DESY'] and not c['trashed'] and c['currentGrade'] is not None and c['currentGrade'] > 1
+                    and '2019-03-01' <= c['cts'][0:10] <= '2019-10-31' for c in components]
+    assert list(cut.mask(table)) == expected
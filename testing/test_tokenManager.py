@@ -0,0 +1,104 @@
+import json, os, stat, threading, time
+
+import pytest
+
+import itk_pdb.dbAccess as dbAccess
+from itk_pdb.tokenManager import TokenManager
+
+class Granter(object):
+    def __init__(self, lifetime = 3600, delay = 0.0, prefix = 'token'):
+        self.lifetime = lifetime
+        self.delay = delay
+        self.prefix = prefix
+        self.calls = []
+        self.lock = threading.Lock()
+        self.granted = threading.Event()
+
+    def __call__(self, prompt):
+        time.sleep(self.delay)
+        with self.lock:
+            self.calls.append(prompt)
+            self.granted.set()
+            return {'id_token': '%s-%s' % (self.prefix, len(self.calls)), 'expires_at': time.time() + self.lifetime}
+
+def test_refresh_ahead_of_expiry():
+    grant = Granter(lifetime = 100)
+    manager = TokenManager(grant, path = None, refresh_margin = 10, background = False)
+    assert manager.token() == 'token-1'
+    assert manager.token() == 'token-1'
+    manager.expires_at = time.time() + 5
+    assert manager.token() == 'token-2'
+    assert grant.calls == [True, True]
+
+def test_shared_token_cache(tmpdir):
+    path = str(tmpdir.join('token.json'))
+    grant1, grant2 = Granter(), Granter(prefix = 'other')
+    assert TokenManager(grant1, path = path, background = False).token() == 'token-1'
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+    # A second manager (e.g., in another process) picks the token up from the cache rather than granting its own
+    other = TokenManager(grant2, path = path, background = False)
+    assert other.token() == 'token-1'
+    assert grant2.calls == []
+
+    # Once it is rejected, a new one is granted and shared
+    assert other.invalidate('token-1') == 'other-1'
+    assert len(grant2.calls) == 1
+    assert TokenManager(Granter(prefix = 'third'), path = path, background = False).token() == 'other-1'
+
+def test_no_stampede(tmpdir):
+    grant = Granter(delay = 0.05)
+    manager = TokenManager(grant, path = str(tmpdir.join('token.json')), background = False)
+    rejected = manager.token()
+    threads = [threading.Thread(target = manager.invalidate, args = (rejected,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(grant.calls) == 2
+    assert manager.token() == 'token-2'
+
+def test_background_refresh():
+    grant = Granter(lifetime = 1.0)
+    manager = TokenManager(grant, path = None, refresh_margin = 0.2)
+    try:
+        assert manager.token() == 'token-1'
+        grant.lifetime = 3600
+        grant.granted.clear()
+        # The background thread holds the manager's lock while it grants, so token() only returns once the new token is in place
+        assert grant.granted.wait(10)
+        assert manager.token() == 'token-2'
+        assert grant.calls == [True, False]
+    finally:
+        manager.stop()
+
+# A 401, or a 500 from the signature verification of the token (as for the functional API, see dbAccess._isAuthFailure)
+@pytest.mark.parametrize('status_code, text', [(401, ''), (500, '{"uuAppErrorMap": {"uu-app-server/internalServerError": {"message": "Signature verification raised"}}}')])
+def test_session_retries_once_on_auth_failure(mocker, status_code, text):
+    session = dbAccess.ITkPDSession(enable_printing = False, cache = False)
+    grant = Granter()
+    session.tokenManager = TokenManager(grant, path = None, background = False)
+    rejected = mocker.Mock(status_code = status_code, text = text, headers = {})
+    rejected.json.return_value = json.loads(text) if text else {}
+    accepted = mocker.Mock(status_code = 200)
+    accepted.json.return_value = {'code': 'abc'}
+    responses = [rejected, accepted]
+    sent = []
+    def get(url, data, headers, **kwargs):
+        sent.append(headers['Authorization'])
+        return responses.pop(0)
+    mocker.patch.object(session, 'get', side_effect = get)
+    assert session.doSomething(action = 'getComponent', method = 'GET', data = {'component': 'abc'}) == {'code': 'abc'}
+    assert sent == ['Bearer token-1', 'Bearer token-2']
+    assert session.token == 'token-2'
+
+def test_functional_retries_once(mocker):
+    grant = Granter()
+    manager = TokenManager(grant, path = None, background = False)
+    mocker.patch('itk_pdb.dbAccess.tokenManager', manager)
+    mocker.patch('itk_pdb.dbAccess.token', 'stale')
+    mocker.patch('itk_pdb.dbAccess.testing', False)
+    mocker.patch('itk_pdb.dbAccess.cache', None)
+    doRequest = mocker.patch('itk_pdb.dbAccess.doRequest', side_effect = [dbAccess.InvalidToken('rejected'), {'code': 'abc'}])
+    assert dbAccess.doSomething('getComponent', {'component': 'abc'}, method = 'GET') == {'code': 'abc'}
+    assert [call[1]['headers']['Authorization'] for call in doRequest.call_args_list] == ['Bearer token-1', 'Bearer token-2']
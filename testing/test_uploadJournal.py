@@ -0,0 +1,44 @@
+import os
+
+from itk_pdb.ITSDAQParser import parseResultsFile
+from itk_pdb.ITSDAQTestClasses import ResultsFile
+from itk_pdb.uploadJournal import UploadJournal, JSON, UPLOADED, FAILED
+from stubResults import writeResultsFile
+
+def test_parses_are_keyed_by_mtime(tmpdir):
+    path = writeResultsFile(str(tmpdir.join('results.txt')), n_chips = 4)
+    journal = UploadJournal(str(tmpdir.join('journal', 'journal.sqlite')))
+    assert journal.getParsed(path) is None
+    tests, full_test, error = parseResultsFile(path)
+    journal.putParsed(path, tests, full_test, error)
+    assert journal.getParsed(path) == (tests, full_test, None)
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+    assert journal.getParsed(path) is None
+
+def test_uploads(tmpdir):
+    path = writeResultsFile(str(tmpdir.join('results.txt')), n_chips = 4)
+    journal = UploadJournal(str(tmpdir.join('journal.sqlite')))
+    journal.record(path, '100-1', 'THREE_POINT_GAIN')
+    journal.record(path, '100-1', 'THREE_POINT_GAIN', 'det_filename', status = FAILED, message = 'timeout')
+    assert journal.isUploaded(path, '100-1', 'THREE_POINT_GAIN') and not journal.isUploaded(path, '100-1', 'RESPONSE_CURVE')
+    assert journal.pending(path, '100-1', 'THREE_POINT_GAIN', [JSON, 'det_filename', 'no_filename']) == ['det_filename', 'no_filename']
+    # The uploads survive changes to the file (e.g., new runs appended to it), and a reopened journal
+    with open(path, 'a') as f:
+        f.write('\n')
+    journal.close()
+    journal = UploadJournal(str(tmpdir.join('journal.sqlite')))
+    assert journal.isUploaded(path, '100-1', 'THREE_POINT_GAIN')
+    assert journal.stats() == {'files': 0, UPLOADED: 1, FAILED: 1}
+
+def test_missing_files_are_not_pending(tmpdir):
+    results_file = ResultsFile(writeResultsFile(str(tmpdir.join('results.txt')), n_chips = 4), enable_printing = False)
+    results_file.getTests()
+    test = results_file[0]
+    test['files_to_upload_FULL'] = {'det_filename': str(tmpdir.join('det.det')), 'response_curve_filename': None}
+    journal = UploadJournal(str(tmpdir.join('journal.sqlite')))
+    assert results_file.pendingUploads(0, journal, upload_files = True) == [JSON, 'det_filename']
+    # A test whose files could not all be found is done once the others are uploaded
+    journal.record(results_file.results_file_path, test['JSON']['runNumber'], test['JSON'].get('testType'))
+    journal.record(results_file.results_file_path, test['JSON']['runNumber'], test['JSON'].get('testType'), 'det_filename')
+    assert results_file.pendingUploads(0, journal, upload_files = True) == []